@@ -16,23 +16,138 @@
 from settings import dckr
 import io
 import os
+import re
+import hashlib
+import subprocess
 import yaml
+import shutil
 from itertools import chain
-from threading import Thread
+from threading import Thread, Lock, Event
 import netaddr
 import sys
+import time
+from cgroup import CgroupSampler
+from timeline import NullTimeline
 
 flatten = lambda l: chain.from_iterable(l)
 
-def get_ctn_names():
+
+def scenario_neighbors(scenario_global_conf):
+    # every peer of the target: the tester neighbors, the receivers, then the monitor
+    groups = scenario_global_conf.get('testers', []) + scenario_global_conf.get('receivers', [])
+    return list(flatten(t.get('neighbors', {}).values() for t in groups)) + [scenario_global_conf['monitor']]
+
+# container names and networks, listed once per run by cache_inventory()
+# instead of once per container
+_inventory = {'containers': None, 'networks': {}}
+_inventory_lock = Lock()
+
+
+def _list_ctn_names():
     names = list(flatten(n['Names'] for n in dckr.containers(all=True)))
     return [n[1:] if n[0] == '/' else n for n in names]
 
 
+def cache_inventory():
+    with _inventory_lock:
+        _inventory['containers'] = set(_list_ctn_names())
+        _inventory['networks'] = dict((n['Name'], n) for n in dckr.networks())
+
+
+def get_ctn_names():
+    with _inventory_lock:
+        if _inventory['containers'] is not None:
+            return list(_inventory['containers'])
+    return _list_ctn_names()
+
+
 def ctn_exists(name):
     return name in get_ctn_names()
 
 
+def remove_ctn(name):
+    dckr.remove_container(name, force=True)
+    with _inventory_lock:
+        if _inventory['containers'] is not None:
+            _inventory['containers'].discard(name)
+
+
+def get_network(name):
+    with _inventory_lock:
+        if name in _inventory['networks']:
+            return _inventory['networks'][name]
+    for network in dckr.networks(names=[name]):
+        if network['Name'] == name:
+            with _inventory_lock:
+                _inventory['networks'][name] = network
+            return network
+    return None
+
+
+def run_parallel(jobs, workers=8):
+    # runs the callables in jobs on at most workers threads, and re-raises
+    # the first failure (sys.exit() included) in the caller once they're done
+    jobs = list(jobs)
+    errors = []
+    lock = Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not jobs or errors:
+                    return
+                job = jobs.pop(0)
+            try:
+                job()
+            except BaseException:
+                with lock:
+                    errors.append(sys.exc_info())
+
+    threads = [Thread(target=worker) for _ in range(min(workers, len(jobs)))]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    for t in threads:
+        # join() with a timeout keeps the main thread interruptible
+        while t.is_alive():
+            t.join(1)
+    if errors:
+        raise errors[0][0], errors[0][1], errors[0][2]
+
+
+def in_order(*jobs):
+    # a job running jobs one after the other, for run_parallel()
+    def run():
+        for job in jobs:
+            job()
+    return run
+
+
+def resolve_commit(repo, ref):
+    # commit id ref points to in the remote git repository, None when it
+    # can't be told (no git, no network, abbreviated commit id)
+    if re.match('^[0-9a-f]{40}$', ref):
+        return ref
+    env = dict(os.environ, GIT_TERMINAL_PROMPT='0')
+    try:
+        out = subprocess.check_output(['git', 'ls-remote', repo, ref, ref + '^{}'], env=env)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    refs = {}
+    for line in out.splitlines():
+        commit, name = line.split('\t', 1)
+        refs[name] = commit
+    # annotated tags are peeled to the commit they point to
+    for name in [ref + '^{}', 'refs/tags/' + ref + '^{}', ref, 'refs/heads/' + ref, 'refs/tags/' + ref]:
+        if name in refs:
+            return refs[name]
+    return None
+
+
+# build output of the images built in parallel
+_build_output_lock = Lock()
+
+
 def img_exists(name):
     return name in [ctn['RepoTags'][0].split(':')[0] for ctn in dckr.images() if ctn['RepoTags'] != None]
 
@@ -42,6 +157,11 @@ def rm_line():
 
 
 class Container(object):
+    # git repository the image is built from, see resolve_checkout()
+    GIT_REPO = None
+    # Timeline shared by every container of the run, see timeline.py
+    timeline = NullTimeline()
+
     def __init__(self, name, image, host_dir, guest_dir, conf):
         self.name = name
         self.image = image
@@ -49,12 +169,25 @@ class Container(object):
         self.guest_dir = guest_dir
         self.conf = conf
         self.config_name = None
+        self.stats_stopped = Event()
         if not os.path.exists(host_dir):
             os.makedirs(host_dir)
             os.chmod(host_dir, 0777)
 
     @classmethod
-    def build_image(cls, force, tag, nocache=False):
+    def resolve_checkout(cls, checkout):
+        # the commit checkout points to in cls.GIT_REPO, to build exactly
+        # that commit and label the image with it; checkout if unknown
+        if cls.GIT_REPO is None:
+            return checkout
+        return resolve_commit(cls.GIT_REPO, checkout) or checkout
+
+    @classmethod
+    def build_image(cls, force, tag, nocache=False, checkout=None):
+        # checkout: the commit built, see resolve_checkout(). the image is
+        # labeled with it, the Dockerfile hash and the bgperf base image it
+        # derives from, if any. an existing image is only rebuilt with force,
+        # and then not if it has the same labels, unless nocache is given.
         def insert_after_from(dockerfile, line):
             lines = dockerfile.split('\n')
             i = -1
@@ -67,16 +200,38 @@ class Container(object):
             lines.insert(i+1, line)
             return '\n'.join(lines)
 
+        labels = {'bgperf.dockerfile': hashlib.sha1(cls.dockerfile.encode('utf-8')).hexdigest()}
+        if checkout:
+            labels['bgperf.commit'] = checkout
+        base = re.search('^FROM\s+(bgperf/\S+)', cls.dockerfile, re.MULTILINE)
+        if base:
+            labels['bgperf.base'] = dckr.inspect_image(base.group(1))['Id']
+
+        if img_exists(tag):
+            if not force:
+                return
+            current = dckr.inspect_image(tag)['Config'].get('Labels') or {}
+            if not nocache and all(current.get(k) == v for k, v in labels.items()):
+                print '{0} is up to date ({1})'.format(tag, checkout or labels['bgperf.dockerfile'])
+                return
+
         for env in ['http_proxy', 'https_proxy']:
             if env in os.environ:
                 cls.dockerfile = insert_after_from(cls.dockerfile, 'ENV {0} {1}'.format(env, os.environ[env]))
+        for k, v in sorted(labels.items()):
+            cls.dockerfile = insert_after_from(cls.dockerfile, 'LABEL {0}={1}'.format(k, v))
 
         f = io.BytesIO(cls.dockerfile.encode('utf-8'))
-        if force or not img_exists(tag):
-            print 'build {0}...'.format(tag)
-            for line in dckr.build(fileobj=f, rm=True, tag=tag, decode=True, nocache=nocache):
-                if 'stream' in line:
-                    print line['stream'].strip()
+        print 'build {0}...'.format(tag)
+        for line in dckr.build(fileobj=f, rm=True, tag=tag, decode=True, nocache=nocache):
+            # images are built in parallel, each line tells which one it's about
+            if 'stream' in line and line['stream'].strip():
+                with _build_output_lock:
+                    print '{0}: {1}'.format(tag, line['stream'].strip())
+            if 'error' in line:
+                raise RuntimeError('build {0} failed: {1}'.format(tag, line['error'].strip()))
+        if checkout and re.match('^[0-9a-f]{40}$', checkout):
+            dckr.tag(tag, tag.split(':')[0], checkout[:12])
 
     def get_ipv4_addresses(self):
         if 'local-address' in self.conf:
@@ -85,57 +240,56 @@ class Container(object):
         raise NotImplementedError()
 
     def run(self, dckr_net_name='', rm=True):
+        begin = time.time()
 
         if rm and ctn_exists(self.name):
             print 'remove container:', self.name
-            dckr.remove_container(self.name, force=True)
+            remove_ctn(self.name)
 
         host_config = dckr.create_host_config(
             binds=['{0}:{1}'.format(os.path.abspath(self.host_dir), self.guest_dir)],
             privileged=True,
             network_mode='bridge',
-            cap_add=['NET_ADMIN']
+            cap_add=['NET_ADMIN'],
+            # e.g. '2,3' or '2-5', pins the container to these cores
+            cpuset_cpus=str(self.conf['cpus']) if 'cpus' in self.conf else None
         )
 
         ctn = dckr.create_container(image=self.image, entrypoint='bash', detach=True, name=self.name,
                                     stdin_open=True, volumes=[self.guest_dir], host_config=host_config)
         self.ctn_id = ctn['Id']
+        with _inventory_lock:
+            if _inventory['containers'] is not None:
+                _inventory['containers'].add(self.name)
 
         ipv4_addresses = self.get_ipv4_addresses()
 
         net_id = None
-        for network in dckr.networks(names=[dckr_net_name]):
-            if network['Name'] != dckr_net_name:
-                continue
-
+        network = get_network(dckr_net_name)
+        if network:
             net_id = network['Id']
             if not 'IPAM' in network:
                 print('can\'t verify if container\'s IP addresses '
                       'are valid for Docker network {}: missing IPAM'.format(dckr_net_name))
-                break
-            ipam = network['IPAM']
-
-            if not 'Config' in ipam:
+            elif not 'Config' in network['IPAM']:
                 print('can\'t verify if container\'s IP addresses '
                       'are valid for Docker network {}: missing IPAM.Config'.format(dckr_net_name))
-                break
-
-            ip_ok = False
-            network_subnets = [item['Subnet'] for item in ipam['Config'] if 'Subnet' in item]
-            for ip in ipv4_addresses:
-                for subnet in network_subnets:
-                    ip_ok = netaddr.IPAddress(ip) in netaddr.IPNetwork(subnet)
-
-                if not ip_ok:
-                    print('the container\'s IP address {} is not valid for Docker network {} '
-                          'since it\'s not part of any of its subnets ({})'.format(
-                              ip, dckr_net_name, ', '.join(network_subnets)))
-                    print('Please consider removing the Docket network {net} '
-                          'to allow bgperf to create it again using the '
-                          'expected subnet:\n'
-                          '  docker network rm {net}'.format(net=dckr_net_name))
-                    sys.exit(1)
-            break
+            else:
+                ip_ok = False
+                network_subnets = [item['Subnet'] for item in network['IPAM']['Config'] if 'Subnet' in item]
+                for ip in ipv4_addresses:
+                    for subnet in network_subnets:
+                        ip_ok = netaddr.IPAddress(ip) in netaddr.IPNetwork(subnet)
+
+                    if not ip_ok:
+                        print('the container\'s IP address {} is not valid for Docker network {} '
+                              'since it\'s not part of any of its subnets ({})'.format(
+                                  ip, dckr_net_name, ', '.join(network_subnets)))
+                        print('Please consider removing the Docket network {net} '
+                              'to allow bgperf to create it again using the '
+                              'expected subnet:\n'
+                              '  docker network rm {net}'.format(net=dckr_net_name))
+                        sys.exit(1)
 
         if net_id is None:
             print 'Docker network "{}" not found!'.format(dckr_net_name)
@@ -158,11 +312,48 @@ class Container(object):
             for ip in ipv4_addresses[1:]:
                 self.local('ip addr add {} dev {}'.format(ip, dev))
 
+        self.timeline.complete('create', self.name, begin)
         return ctn
 
-    def stats(self, queue):
+    def stats(self, queue, interval=1.0, source='auto'):
+        # source: 'cgroup' reads the container's cgroup files every interval
+        # seconds, 'docker' uses the docker stats API (one sample per second),
+        # 'auto' uses cgroup when available.
+        if source in ['auto', 'cgroup']:
+            try:
+                pid = dckr.inspect_container(self.ctn_id)['State']['Pid']
+                sampler = CgroupSampler(self.ctn_id, pid)
+            except (IOError, OSError) as e:
+                if source == 'cgroup':
+                    raise
+                print 'cgroup of {0} not available ({1}), using docker stats'.format(self.name, e)
+            else:
+                return self.stats_cgroup(queue, sampler, interval)
+        return self.stats_docker(queue)
+
+    def stats_cgroup(self, queue, sampler, interval):
+        def stats():
+            prev = sampler.sample()
+            prev_time = time.time()
+            while not self.stats_stopped.is_set():
+                time.sleep(interval)
+                s = sampler.sample()
+                now = time.time()
+                s['cpu'] = (s['cpu_seconds'] - prev['cpu_seconds']) / (now - prev_time) * 100.0
+                s['who'] = self.name
+                s['time'] = now
+                queue.put(s)
+                prev, prev_time = s, now
+
+        t = Thread(target=stats)
+        t.daemon = True
+        t.start()
+
+    def stats_docker(self, queue):
         def stats():
             for stat in dckr.stats(self.ctn_id, decode=True):
+                if self.stats_stopped.is_set():
+                    return
                 cpu_percentage = 0.0
                 prev_cpu = stat['precpu_stats']['cpu_usage']['total_usage']
                 if 'system_cpu_usage' in stat['precpu_stats']:
@@ -171,18 +362,23 @@ class Container(object):
                     prev_system = 0
                 cpu = stat['cpu_stats']['cpu_usage']['total_usage']
                 system = stat['cpu_stats']['system_cpu_usage']
-                cpu_num = len(stat['cpu_stats']['cpu_usage']['percpu_usage'])
+                # percpu_usage isn't reported on cgroup v2 hosts
+                cpu_num = stat['cpu_stats'].get('online_cpus') or \
+                    len(stat['cpu_stats']['cpu_usage'].get('percpu_usage') or [None])
                 cpu_delta = float(cpu) - float(prev_cpu)
                 system_delta = float(system) - float(prev_system)
                 if system_delta > 0.0 and cpu_delta > 0.0:
                     cpu_percentage = (cpu_delta / system_delta) * float(cpu_num) * 100.0
                 mem_usage = stat['memory_stats'].get('usage', 0)
-                queue.put({'who': self.name, 'cpu': cpu_percentage, 'mem': mem_usage})
+                queue.put({'who': self.name, 'cpu': cpu_percentage, 'mem': mem_usage, 'time': time.time()})
 
         t = Thread(target=stats)
         t.daemon = True
         t.start()
 
+    def stop_stats(self):
+        self.stats_stopped.set()
+
     def local(self, cmd, stream=False, detach=False):
         i = dckr.exec_create(container=self.name, cmd=cmd)
         return dckr.exec_start(i['Id'], stream=stream, detach=detach)
@@ -209,6 +405,14 @@ class Container(object):
 class Target(Container):
 
     CONFIG_FILE_NAME = None
+    # --profile: the targets without a profiler of their own run perf
+    # record against this process
+    PROFILE_PROCESS = None
+    PROFILE_SUFFIX = '.perf.data'
+    # warm reset: command printing the size of the target's own RIB, and the
+    # pattern of the prefix counts to add up in its output
+    RIB_COUNT_CMD = None
+    RIB_COUNT_PATTERN = None
 
     def write_config(self, scenario_global_conf):
         raise NotImplementedError()
@@ -221,20 +425,69 @@ class Target(Container):
             return True
         return False
 
+    def profile_cpu(self, path, seconds):
+        if self.PROFILE_PROCESS is None:
+            raise NotImplementedError()
+        name = os.path.basename(path)
+        # the perf binary of whatever kernel linux-tools was installed for
+        self.local(['bash', '-c', 'perf=$(ls /usr/lib/linux-tools/*/perf | head -1) && '
+                    '$perf record -q -g -F 99 -p $(pidof -s {0}) -o {1}/{2} -- sleep {3}'.format(
+                        self.PROFILE_PROCESS, self.guest_dir, name, seconds)])
+        shutil.move(os.path.join(self.host_dir, name), path)
+
+    def profile_heap(self, path):
+        raise NotImplementedError()
+
+    def rib_routes(self):
+        # number of prefixes in the target's own RIB, None when it can't tell
+        if self.RIB_COUNT_CMD is None:
+            return None
+        counts = re.findall(self.RIB_COUNT_PATTERN, self.local(self.RIB_COUNT_CMD))
+        return sum(int(c) for c in counts) if counts else None
+
     def run(self, scenario_global_conf, dckr_net_name=''):
         ctn = super(Target, self).run(dckr_net_name)
 
+        begin = time.time()
         if not self.use_existing_config():
             self.write_config(scenario_global_conf)
+        self.timeline.complete('config', self.name, begin)
 
+        begin = time.time()
         self.exec_startup_cmd(detach=True)
+        self.timeline.complete('start', self.name, begin)
 
         return ctn
 
 
+class BootProgress(object):
+    # one 'testers booting..' line for testers booting in parallel
+
+    def __init__(self, total):
+        self.total = total
+        self.booted = {}
+        self.lock = Lock()
+        self.printed = False
+
+    def update(self, name, cnt):
+        with self.lock:
+            self.booted[name] = cnt
+            if self.printed:
+                rm_line()
+            self.printed = True
+            print 'testers booting.. ({0}/{1})'.format(sum(self.booted.values()), self.total)
+
+    def log(self, msg):
+        with self.lock:
+            self.printed = False
+            print msg
+
+
 class Tester(Container):
 
     CONTAINER_NAME_PREFIX = None
+    # BootProgress shared by the testers booting in parallel
+    progress = None
 
     def __init__(self, name, host_dir, conf, image):
         Container.__init__(self, self.CONTAINER_NAME_PREFIX + name, image, host_dir, self.GUEST_DIR, conf)
@@ -252,10 +505,19 @@ class Tester(Container):
     def run(self, target_conf, dckr_net_name):
         ctn = super(Tester, self).run(dckr_net_name)
 
+        begin = time.time()
         self.configure_neighbors(target_conf)
+        self.timeline.complete('configure', self.name, begin)
 
+        begin = time.time()
         output = self.exec_startup_cmd(stream=True, detach=False)
 
+        self.wait_booted(output)
+        self.timeline.complete('boot', self.name, begin, neighbors=len(self.conf.get('neighbors', {})))
+
+        return ctn
+
+    def wait_booted(self, output):
         cnt = 0
         prev_pid = 0
         for lines in output: # This is the ExaBGP output
@@ -273,8 +535,27 @@ class Tester(Container):
                 if pid != prev_pid:
                     prev_pid = pid
                     cnt += 1
-                    if cnt > 1:
-                        rm_line()
-                    print 'tester booting.. ({0}/{1})'.format(cnt, len(self.conf.get('neighbors', {}).values()))
+                    self.report_booting(cnt, len(self.conf.get('neighbors', {}).values()))
 
-        return ctn
+    # warm reset: the default is for the ExaBGP testers, stopping the
+    # processes closes their sessions, which withdraws their routes
+
+    def withdraw_all(self):
+        self.local('pkill -f exabgp')
+
+    def announce_all(self):
+        self.exec_startup_cmd(detach=True)
+
+    def report_booting(self, cnt, num):
+        if self.progress:
+            self.progress.update(self.name, cnt)
+            return
+        if cnt > 1:
+            rm_line()
+        print 'tester booting.. ({0}/{1})'.format(cnt, num)
+
+    def log(self, msg):
+        if self.progress:
+            self.progress.log(msg)
+        else:
+            print msg
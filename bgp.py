@@ -0,0 +1,278 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# BGP wire format helpers.
+#
+# This module is shared between bgperf itself and the programs bgperf copies
+# into tester containers (e.g. speakerd.py), so it must only depend on the
+# standard library and work with both Python 2 and Python 3.
+
+import socket
+import struct
+
+BGP_PORT = 179
+BGP_VERSION = 4
+BGP_HEADER_LEN = 19
+BGP_MAX_MSG_LEN = 4096
+BGP_EXTENDED_MAX_MSG_LEN = 65535
+
+BGP_MSG_OPEN = 1
+BGP_MSG_UPDATE = 2
+BGP_MSG_NOTIFICATION = 3
+BGP_MSG_KEEPALIVE = 4
+
+BGP_ATTR_FLAG_OPTIONAL = 0x80
+BGP_ATTR_FLAG_TRANSITIVE = 0x40
+BGP_ATTR_FLAG_EXTENDED_LENGTH = 0x10
+
+BGP_ATTR_TYPE_ORIGIN = 1
+BGP_ATTR_TYPE_AS_PATH = 2
+BGP_ATTR_TYPE_NEXT_HOP = 3
+BGP_ATTR_TYPE_MULTI_EXIT_DISC = 4
+BGP_ATTR_TYPE_LOCAL_PREF = 5
+BGP_ATTR_TYPE_ATOMIC_AGGREGATE = 6
+BGP_ATTR_TYPE_AGGREGATOR = 7
+BGP_ATTR_TYPE_COMMUNITIES = 8
+BGP_ATTR_TYPE_ORIGINATOR_ID = 9
+BGP_ATTR_TYPE_CLUSTER_LIST = 10
+BGP_ATTR_TYPE_MP_REACH_NLRI = 14
+BGP_ATTR_TYPE_MP_UNREACH_NLRI = 15
+BGP_ATTR_TYPE_AS4_PATH = 17
+BGP_ATTR_TYPE_AS4_AGGREGATOR = 18
+
+BGP_ORIGIN_IGP = 0
+BGP_ORIGIN_EGP = 1
+BGP_ORIGIN_INCOMPLETE = 2
+
+BGP_AS_SET = 1
+BGP_AS_SEQUENCE = 2
+AS_TRANS = 23456
+
+# NOTIFICATION error codes
+BGP_ERR_HEADER = 1
+BGP_ERR_OPEN = 2
+BGP_ERR_UPDATE = 3
+BGP_ERR_HOLD_TIMER_EXPIRED = 4
+BGP_ERR_FSM = 5
+BGP_ERR_CEASE = 6
+
+BGP_CAP_MULTIPROTOCOL = 1
+BGP_CAP_EXTENDED_MESSAGE = 6
+BGP_CAP_FOUR_OCTET_AS = 65
+
+AFI_IPV4 = 1
+SAFI_UNICAST = 1
+
+_MARKER = b'\xff' * 16
+
+
+def message(msg_type, body):
+    return _MARKER + struct.pack('!HB', BGP_HEADER_LEN + len(body), msg_type) + body
+
+
+def parse_header(data):
+    # returns (length, type) of the message whose header is in data
+    if data[:16] != _MARKER:
+        raise ValueError('invalid BGP marker')
+    return struct.unpack('!HB', data[16:BGP_HEADER_LEN])
+
+
+def capability(code, value=b''):
+    return struct.pack('!BB', code, len(value)) + value
+
+
+def open_message(local_as, router_id, hold_time=90, capabilities=None, extended_message=False):
+    if capabilities is None:
+        capabilities = [
+            capability(BGP_CAP_MULTIPROTOCOL, struct.pack('!HBB', AFI_IPV4, 0, SAFI_UNICAST)),
+            capability(BGP_CAP_FOUR_OCTET_AS, struct.pack('!I', local_as)),
+        ]
+        if extended_message:
+            capabilities.append(capability(BGP_CAP_EXTENDED_MESSAGE))
+    caps = b''.join(capabilities)
+    opt = struct.pack('!BB', 2, len(caps)) + caps
+    my_as = local_as if local_as < 65536 else AS_TRANS
+    body = struct.pack('!BHH4sB', BGP_VERSION, my_as, hold_time,
+                       socket.inet_aton(router_id), len(opt)) + opt
+    return message(BGP_MSG_OPEN, body)
+
+
+def parse_open(body):
+    # returns (as, hold_time, router_id, {capability code: [values]})
+    version, peer_as, hold_time, router_id, opt_len = struct.unpack('!BHH4sB', body[:10])
+    caps = {}
+    opt = body[10:10 + opt_len]
+    while len(opt) >= 2:
+        param_type, param_len = struct.unpack('!BB', opt[:2])
+        param = opt[2:2 + param_len]
+        opt = opt[2 + param_len:]
+        if param_type != 2:
+            continue
+        while len(param) >= 2:
+            code, length = struct.unpack('!BB', param[:2])
+            caps.setdefault(code, []).append(param[2:2 + length])
+            param = param[2 + length:]
+    if BGP_CAP_FOUR_OCTET_AS in caps:
+        peer_as = struct.unpack('!I', caps[BGP_CAP_FOUR_OCTET_AS][0])[0]
+    return peer_as, hold_time, socket.inet_ntoa(router_id), caps
+
+
+def keepalive_message():
+    return message(BGP_MSG_KEEPALIVE, b'')
+
+
+def notification_message(code, subcode, data=b''):
+    return message(BGP_MSG_NOTIFICATION, struct.pack('!BB', code, subcode) + data)
+
+
+def pack_prefix(prefix):
+    # '10.0.0.0/8' -> b'\x08\x0a'
+    addr, length = prefix.split('/')
+    length = int(length)
+    return struct.pack('!B', length) + socket.inet_aton(addr)[:(length + 7) // 8]
+
+
+def split_prefixes(data):
+    # yields the packed prefixes of data (withdrawn routes or NLRI)
+    i = 0
+    while i < len(data):
+        n = 1 + (struct.unpack_from('!B', data, i)[0] + 7) // 8
+        yield data[i:i + n]
+        i += n
+
+
+def unpack_prefixes(data):
+    prefixes = []
+    for p in split_prefixes(data):
+        length = struct.unpack_from('!B', p, 0)[0]
+        addr = p[1:] + b'\x00' * (5 - len(p))
+        prefixes.append('{0}/{1}'.format(socket.inet_ntoa(addr), length))
+    return prefixes
+
+
+def path_attribute(flags, code, value):
+    if len(value) > 255:
+        return struct.pack('!BBH', flags | BGP_ATTR_FLAG_EXTENDED_LENGTH, code, len(value)) + value
+    return struct.pack('!BBB', flags, code, len(value)) + value
+
+
+def parse_attributes(data):
+    # returns the list of (flags, type, value) of raw path attributes
+    attrs = []
+    i = 0
+    while i < len(data):
+        flags, code = struct.unpack_from('!BB', data, i)
+        if flags & BGP_ATTR_FLAG_EXTENDED_LENGTH:
+            length = struct.unpack_from('!H', data, i + 2)[0]
+            i += 4
+        else:
+            length = struct.unpack_from('!B', data, i + 2)[0]
+            i += 3
+        attrs.append((flags & ~BGP_ATTR_FLAG_EXTENDED_LENGTH, code, data[i:i + length]))
+        i += length
+    return attrs
+
+
+def as_path_prepend(value, asn):
+    # prepends asn to a raw AS_PATH attribute value made of 4-octet AS numbers
+    if len(value) >= 2:
+        seg_type, seg_len = struct.unpack_from('!BB', value, 0)
+        if seg_type == BGP_AS_SEQUENCE and seg_len < 255:
+            return struct.pack('!BBI', BGP_AS_SEQUENCE, seg_len + 1, asn) + value[2:]
+    return struct.pack('!BBI', BGP_AS_SEQUENCE, 1, asn) + value
+
+
+def as_path_length(value):
+    # AS_SET counts as one, as in the best path selection
+    n = 0
+    i = 0
+    while i + 2 <= len(value):
+        seg_type, seg_len = struct.unpack_from('!BB', value, i)
+        n += 1 if seg_type == BGP_AS_SET else seg_len
+        i += 2 + seg_len * 4
+    return n
+
+
+def path_attributes(next_hop, as_path=(), origin=BGP_ORIGIN_IGP, med=None, communities=()):
+    # as_path is a sequence of 4-octet AS numbers (a single AS_SEQUENCE),
+    # communities a sequence of 'x:y' strings.
+    attrs = [path_attribute(BGP_ATTR_FLAG_TRANSITIVE, BGP_ATTR_TYPE_ORIGIN, struct.pack('!B', origin))]
+    seq = b''
+    as_path = list(as_path)
+    while as_path:
+        seg, as_path = as_path[:255], as_path[255:]
+        seq += struct.pack('!BB', BGP_AS_SEQUENCE, len(seg)) + struct.pack('!{0}I'.format(len(seg)), *seg)
+    attrs.append(path_attribute(BGP_ATTR_FLAG_TRANSITIVE, BGP_ATTR_TYPE_AS_PATH, seq))
+    attrs.append(path_attribute(BGP_ATTR_FLAG_TRANSITIVE, BGP_ATTR_TYPE_NEXT_HOP, socket.inet_aton(next_hop)))
+    if med is not None:
+        attrs.append(path_attribute(BGP_ATTR_FLAG_OPTIONAL, BGP_ATTR_TYPE_MULTI_EXIT_DISC, struct.pack('!I', med)))
+    if communities:
+        value = b''.join(struct.pack('!HH', *(int(x) for x in c.split(':'))) for c in communities)
+        attrs.append(path_attribute(BGP_ATTR_FLAG_OPTIONAL | BGP_ATTR_FLAG_TRANSITIVE,
+                                    BGP_ATTR_TYPE_COMMUNITIES, value))
+    return b''.join(attrs)
+
+
+def update_message(withdrawn=(), attrs=b'', nlri=()):
+    # withdrawn and nlri are sequences of already packed prefixes
+    w = b''.join(withdrawn)
+    body = struct.pack('!H', len(w)) + w + struct.pack('!H', len(attrs)) + attrs + b''.join(nlri)
+    return message(BGP_MSG_UPDATE, body)
+
+
+def split_update(body):
+    # returns the raw (withdrawn routes, path attributes, nlri) of an UPDATE body
+    wlen = struct.unpack_from('!H', body, 0)[0]
+    alen = struct.unpack_from('!H', body, 2 + wlen)[0]
+    return body[2:2 + wlen], body[4 + wlen:4 + wlen + alen], body[4 + wlen + alen:]
+
+
+def parse_update(body):
+    # returns (withdrawn prefixes, raw path attributes, nlri prefixes)
+    withdrawn, attrs, nlri = split_update(body)
+    return unpack_prefixes(withdrawn), attrs, unpack_prefixes(nlri)
+
+
+def count_prefixes(data):
+    # number of packed prefixes in data, without unpacking them
+    return sum(1 for _ in split_prefixes(data))
+
+
+def count_update_prefixes(body):
+    # (withdrawn, announced) prefix counts of an UPDATE message body
+    withdrawn, _, nlri = split_update(body)
+    return count_prefixes(withdrawn), count_prefixes(nlri)
+
+
+def update_nlri(msg):
+    # raw NLRI field of an UPDATE message (header included)
+    wlen = struct.unpack_from('!H', msg, BGP_HEADER_LEN)[0]
+    alen = struct.unpack_from('!H', msg, BGP_HEADER_LEN + 2 + wlen)[0]
+    return msg[BGP_HEADER_LEN + 4 + wlen + alen:]
+
+
+def withdrawal_message(msg):
+    # UPDATE message withdrawing the prefixes announced by the UPDATE message msg
+    return update_message(withdrawn=[update_nlri(msg)])
+
+
+def read_messages(f):
+    # yields the messages of a file of back to back BGP messages
+    while True:
+        header = f.read(BGP_HEADER_LEN)
+        if len(header) < BGP_HEADER_LEN:
+            return
+        length, _ = parse_header(header)
+        yield header + f.read(length - BGP_HEADER_LEN)
@@ -20,10 +20,11 @@ import sys
 import yaml
 import time
 import shutil
+import hashlib
 import netaddr
-import datetime
-from argparse import ArgumentParser, REMAINDER
-from itertools import chain, islice
+from argparse import ArgumentParser, ArgumentTypeError, REMAINDER
+from itertools import chain, count
+from functools import partial
 from requests.exceptions import ConnectionError
 from pyroute2 import IPRoute
 from socket import AF_INET
@@ -34,15 +35,60 @@ from gobgp import GoBGP, GoBGPTarget
 from bird import BIRD, BIRDTarget
 from quagga import Quagga, QuaggaTarget
 from frr import FRRouting, FRRoutingTarget
-from tester import ExaBGPTester
-from mrt_tester import GoBGPMRTTester, ExaBGPMrtTester
+from speaker import Speaker
+from tester import ExaBGPTester, SpeakerTester, ReceiverSink
+from mrt_tester import GoBGPMRTTester, ExaBGPMrtTester, SpeakerMRTTester
+from mrt_stream import compile_mrt, peer_prefixes, update_peers, TIMES_SUFFIX
+from mrt import MRTReader
 from monitor import Monitor
+from bmp import BMPCollector
+import latency
+from churn import ChurnTracker
+import results
+from profiler import Profiler
+from timeline import Timeline, NullTimeline
+from paths import path_range, next_start
+from ribgen import rib_slice
+from policy import value_range
 from settings import dckr
-from Queue import Queue
+from Queue import Queue, Empty
 from mako.template import Template
 from packaging import version
 from docker.types import IPAMConfig, IPAMPool
 
+TARGETS = ['gobgp', 'bird', 'quagga', 'frr']
+# seconds a BGP4MP replay may run past its recorded duration and lag
+REPLAY_GRACE = 60
+
+
+def value_list(type, choices=None):
+    # argparse type of comma separated values; with type=int, an item can be
+    # a range 'start:stop:step' or 'start:stop:xfactor', stop included
+    def parse(s):
+        values = []
+        for item in s.split(','):
+            if type is int and ':' in item:
+                fields = item.split(':')
+                if len(fields) != 3:
+                    raise ArgumentTypeError('invalid range: {0}'.format(item))
+                v, stop = int(fields[0]), int(fields[1])
+                geometric = fields[2].startswith('x')
+                step = float(fields[2][1:]) if geometric else int(fields[2])
+                if step <= (1 if geometric else 0):
+                    raise ArgumentTypeError('invalid range step: {0}'.format(item))
+                while v <= stop:
+                    values.append(v)
+                    v = int(round(v * step)) if geometric else v + step
+            else:
+                values.append(type(item))
+        if choices:
+            for v in values:
+                if v not in choices:
+                    raise ArgumentTypeError('invalid choice: {0} (choose from {1})'.format(v, ', '.join(choices)))
+        return values
+    return parse
+
+
 def gen_mako_macro():
     return '''<%
     import netaddr
@@ -81,7 +127,7 @@ def doctor(args):
     else:
         print '... not found. run `bgperf prepare`'
 
-    for name in ['gobgp', 'bird', 'quagga', 'frr']:
+    for name in ['speaker', 'gobgp', 'bird', 'quagga', 'frr']:
         print '{0} image'.format(name),
         if img_exists('bgperf/{0}'.format(name)):
             print '... ok'
@@ -92,90 +138,135 @@ def doctor(args):
 
 
 def prepare(args):
-    ExaBGP.build_image(args.force, nocache=args.no_cache)
-    ExaBGP_MRTParse.build_image(args.force, nocache=args.no_cache)
-    GoBGP.build_image(args.force, nocache=args.no_cache)
-    Quagga.build_image(args.force, checkout='quagga-1.0.20160309', nocache=args.no_cache)
-    BIRD.build_image(args.force, nocache=args.no_cache)
-    FRRouting.build_image(args.force, checkout='stable/3.0', nocache=args.no_cache)
+    # bgperf/exabgp_mrtparse derives from bgperf/exabgp
+    jobs = [in_order(partial(ExaBGP.build_image, args.force, nocache=args.no_cache),
+                     partial(ExaBGP_MRTParse.build_image, args.force, nocache=args.no_cache)),
+            partial(Speaker.build_image, args.force, nocache=args.no_cache),
+            partial(GoBGP.build_image, args.force, nocache=args.no_cache),
+            partial(Quagga.build_image, args.force, checkout='quagga-1.0.20160309', nocache=args.no_cache),
+            partial(BIRD.build_image, args.force, nocache=args.no_cache),
+            partial(FRRouting.build_image, args.force, checkout='stable/3.0', nocache=args.no_cache)]
+    run_parallel(jobs, args.build_workers)
 
 
 def update(args):
-    if args.image == 'all' or args.image == 'exabgp':
-        ExaBGP.build_image(True, checkout=args.checkout, nocache=args.no_cache)
-    if args.image == 'all' or args.image == 'exabgp_mrtparse':
-        ExaBGP_MRTParse.build_image(True, checkout=args.checkout, nocache=args.no_cache)
-    if args.image == 'all' or args.image == 'gobgp':
-        GoBGP.build_image(True, checkout=args.checkout, nocache=args.no_cache)
-    if args.image == 'all' or args.image == 'quagga':
-        Quagga.build_image(True, checkout=args.checkout, nocache=args.no_cache)
-    if args.image == 'all' or args.image == 'bird':
-        BIRD.build_image(True, checkout=args.checkout, nocache=args.no_cache)
-    if args.image == 'all' or args.image == 'frr':
-        FRRouting.build_image(True, checkout=args.checkout, nocache=args.no_cache)
+    def build(cls):
+        return partial(cls.build_image, True, checkout=args.checkout, nocache=args.no_cache)
+
+    jobs = []
+    if args.image == 'all':
+        jobs.append(in_order(build(ExaBGP), build(ExaBGP_MRTParse)))
+    elif args.image == 'exabgp':
+        jobs.append(build(ExaBGP))
+    elif args.image == 'exabgp_mrtparse':
+        # --checkout is the mrtparse one, bgperf/exabgp is only built if missing
+        jobs.append(in_order(ExaBGP.build_image, build(ExaBGP_MRTParse)))
+    for name, cls in [('speaker', Speaker), ('gobgp', GoBGP), ('quagga', Quagga), ('bird', BIRD), ('frr', FRRouting)]:
+        if args.image == 'all' or args.image == name:
+            jobs.append(build(cls))
+    run_parallel(jobs, args.build_workers)
 
 
 def bench(args):
     config_dir = '{0}/{1}'.format(args.dir, args.bench_name)
     dckr_net_name = args.docker_network_name or args.bench_name + '-br'
 
+    # phases of bgperf itself go to the 'bgperf' track, the containers have their own
+    timeline = Timeline() if args.trace else NullTimeline()
+    Container.timeline = timeline
+    phase = time.time()
+
+    # containers and networks are listed once, then tracked by base
+    cache_inventory()
+    removed = []
+
     for target_class in [BIRDTarget, GoBGPTarget, QuaggaTarget, FRRoutingTarget]:
         if ctn_exists(target_class.CONTAINER_NAME):
             print 'removing target container', target_class.CONTAINER_NAME
-            dckr.remove_container(target_class.CONTAINER_NAME, force=True)
+            removed.append(target_class.CONTAINER_NAME)
 
     if not args.repeat:
         if ctn_exists(Monitor.CONTAINER_NAME):
             print 'removing monitor container', Monitor.CONTAINER_NAME
-            dckr.remove_container(Monitor.CONTAINER_NAME, force=True)
+            removed.append(Monitor.CONTAINER_NAME)
 
         for ctn_name in get_ctn_names():
             if ctn_name.startswith(ExaBGPTester.CONTAINER_NAME_PREFIX) or \
+                ctn_name.startswith(SpeakerTester.CONTAINER_NAME_PREFIX) or \
+                ctn_name.startswith(ReceiverSink.CONTAINER_NAME_PREFIX) or \
+                ctn_name.startswith(SpeakerMRTTester.CONTAINER_NAME_PREFIX) or \
                 ctn_name.startswith(ExaBGPMrtTester.CONTAINER_NAME_PREFIX) or \
                 ctn_name.startswith(GoBGPMRTTester.CONTAINER_NAME_PREFIX):
                 print 'removing tester container', ctn_name
-                dckr.remove_container(ctn_name, force=True)
+                removed.append(ctn_name)
+
+    run_parallel([partial(remove_ctn, name) for name in removed], args.provision_workers)
 
+    if not args.repeat:
         if os.path.exists(config_dir):
             shutil.rmtree(config_dir)
+    timeline.complete('cleanup', 'bgperf', phase, containers=len(removed))
 
+    phase = time.time()
     if args.file:
         with open(args.file) as f:
-            conf = yaml.load(Template(f.read()).render())
+            scenario = f.read()
+        conf = yaml.load(Template(scenario).render())
     else:
-        conf = gen_conf(args)
+        scenario = gen_conf(args)
         if not os.path.exists(config_dir):
             os.makedirs(config_dir)
         with open('{0}/scenario.yaml'.format(config_dir), 'w') as f:
-            f.write(conf)
-        conf = yaml.load(Template(conf).render())
-
-    bridge_found = False
-    for network in dckr.networks(names=[dckr_net_name]):
-        if network['Name'] == dckr_net_name:
-            print 'Docker network "{}" already exists'.format(dckr_net_name)
-            bridge_found = True
-            break
-    if not bridge_found:
+            f.write(scenario)
+        conf = yaml.load(Template(scenario).render())
+    timeline.complete('scenario', 'bgperf', phase)
+
+    phase = time.time()
+    network = get_network(dckr_net_name)
+    if network:
+        print 'Docker network "{}" already exists'.format(dckr_net_name)
+    else:
         subnet = conf['local_prefix']
         print 'creating Docker network "{}" with subnet {}'.format(dckr_net_name, subnet)
         ipam = IPAMConfig(pool_configs=[IPAMPool(subnet=subnet)])
-        network = dckr.create_network(dckr_net_name, driver='bridge', ipam=ipam)
+        dckr.create_network(dckr_net_name, driver='bridge', ipam=ipam)
+        network = get_network(dckr_net_name)
+    timeline.complete('network', 'bgperf', phase)
 
-    num_tester = sum(len(t.get('neighbors', [])) for t in conf.get('testers', []))
+    num_tester = sum(len(t.get('neighbors', [])) for t in conf.get('testers', []) + conf.get('receivers', []))
+    # staggered overlapping peers keep changing the best paths after the check-point
+    settle = max([n.get('delay', 0) for t in conf.get('testers', []) for n in t.get('neighbors', {}).values()] or [0])
     if num_tester > gc_thresh3():
         print 'gc_thresh3({0}) is lower than the number of peer({1})'.format(gc_thresh3(), num_tester)
         print 'type next to increase the value'
         print '$ echo 16384 | sudo tee /proc/sys/net/ipv4/neigh/default/gc_thresh3'
 
+    bmp = None
+    if args.bmp:
+        gateway = None
+        for c in dckr.inspect_network(network['Id']).get('IPAM', {}).get('Config', []) or []:
+            gateway = c.get('Gateway', gateway)
+        if not gateway:
+            gateway = str(netaddr.IPNetwork(conf['local_prefix']).network + 1)
+        conf['bmp'] = {'address': gateway.split('/')[0], 'port': args.bmp_port}
+        if args.target in ['bird', 'quagga']:
+            print 'warning: {0} doesn\'t support BMP'.format(args.target)
+        elif args.target == 'frr':
+            print 'warning: BMP requires FRR 7.2 or later, use -i to give such an image'
+        print 'run BMP station on {0}:{1}'.format(conf['bmp']['address'], conf['bmp']['port'])
+        bmp = BMPCollector(port=args.bmp_port)
+        bmp.start()
+
     print 'run monitor'
     m = Monitor(config_dir+'/monitor', conf['monitor'])
-    m.run(conf, dckr_net_name)
+    jobs = [partial(m.run, conf, dckr_net_name)]
 
     is_remote = True if 'remote' in conf['target'] and conf['target']['remote'] else False
 
     if is_remote:
         print 'target is remote ({})'.format(conf['target']['local-address'])
+        if args.profile:
+            print 'warning: remote targets can\'t be profiled'
 
         ip = IPRoute()
 
@@ -275,18 +366,46 @@ def bench(args):
         elif args.target == 'frr':
             target_class = FRRoutingTarget
 
+        if args.profile:
+            conf['target']['profile'] = True
+
         print 'run', args.target
         if args.image:
             target = target_class('{0}/{1}'.format(config_dir, args.target), conf['target'], image=args.image)
         else:
             target = target_class('{0}/{1}'.format(config_dir, args.target), conf['target'])
-        target.run(conf, dckr_net_name)
+        jobs.append(partial(target.run, conf, dckr_net_name))
+
+    # the monitor and the target don't depend on each other
+    phase = time.time()
+    run_parallel(jobs, args.provision_workers)
+    timeline.complete('monitor and target', 'bgperf', phase)
 
     time.sleep(1)
 
     print 'waiting bgp connection between {0} and monitor'.format(args.target)
     m.wait_established(conf['target']['local-address'])
 
+    receivers = []
+    if not args.repeat:
+        for idx, receiver in enumerate(conf.get('receivers', [])):
+            name = receiver.get('name', 'receiver{0}'.format(idx))
+            receiver.setdefault('expect', conf['monitor']['check-points'][-1])
+            print 'run receivers', name
+            receivers.append(ReceiverSink(name, config_dir+'/'+name, receiver))
+
+        # the receivers are up before any route is announced
+        if receivers:
+            phase = time.time()
+            run_parallel([partial(r.run, conf['target'], dckr_net_name) for r in receivers], args.provision_workers)
+            print 'waiting bgp connection between {0} and receivers'.format(args.target)
+            table = wait_receivers(receivers, 'established', args.receiver_timeout)
+            waiting = len([v for v in table.values() if v['established'] is None])
+            if waiting:
+                print 'warning: {0} receivers not established'.format(waiting)
+            timeline.complete('receivers', 'bgperf', phase)
+
+    testers = []
     if not args.repeat:
         for idx, tester in enumerate(conf['testers']):
             if 'name' not in tester:
@@ -299,6 +418,8 @@ def bench(args):
                 tester_type = tester['type']
             if tester_type == 'normal':
                 tester_class = ExaBGPTester
+            elif tester_type == 'speaker':
+                tester_class = SpeakerTester
             elif tester_type == 'mrt':
                 if 'mrt_injector' not in tester:
                     mrt_injector = 'gobgp'
@@ -308,23 +429,46 @@ def bench(args):
                     tester_class = GoBGPMRTTester
                 elif mrt_injector == 'exabgp':
                     tester_class = ExaBGPMrtTester
+                elif mrt_injector == 'speaker':
+                    tester_class = SpeakerMRTTester
+                    tester.setdefault('mrt-cache-dir', mrt_cache_dir(args))
+                    tester['speed'] = args.speed
                 else:
                     print 'invalid mrt_injector:', mrt_injector
                     sys.exit(1)
             else:
                 print 'invalid tester type:', tester_type
                 sys.exit(1)
+            if args.latency:
+                tester['latency'] = True
             t = tester_class(name, config_dir+'/'+name, tester)
             print 'run tester', name, 'type', tester_type
-            t.run(conf['target'], dckr_net_name)
-
-    start = datetime.datetime.now()
+            testers.append(t)
+
+        # testers only start once the target is up, then all at once
+        if len(testers) > 1:
+            Tester.progress = BootProgress(sum(len(t.conf.get('neighbors', {})) for t in testers))
+        phase = time.time()
+        run_parallel([partial(t.run, conf['target'], dckr_net_name) for t in testers], args.provision_workers)
+        Tester.progress = None
+        timeline.complete('testers', 'bgperf', phase)
+
+    meta = {
+        'bench-name': args.bench_name,
+        'label': args.label,
+        'target': args.target,
+        'scenario-sha1': hashlib.sha1(scenario).hexdigest(),
+        'args': dict((k, v) for k, v in vars(args).items() if k != 'func'),
+    }
+    if not is_remote:
+        image = dckr.inspect_image(target.image)
+        meta['image'] = {'name': target.image, 'id': image['Id'], 'digests': image.get('RepoDigests', [])}
 
     q = Queue()
 
     m.stats(q)
     if not is_remote:
-        target.stats(q)
+        target.stats(q, args.stats_interval, args.stats_source)
 
     def mem_human(v):
         if v > 1000 * 1000 * 1000:
@@ -337,35 +481,652 @@ def bench(args):
             return '{0:.2f}B'.format(float(v))
 
     f = open(args.output, 'w') if args.output else None
-    cpu = 0
-    mem = 0
-    cooling = -1
-    while True:
-        info = q.get()
+    # every sample of the target, at --stats-interval
+    target_stats = open('{0}/target-stats.csv'.format(config_dir), 'w') if not is_remote else None
+    target_stats_keys = ['cpu', 'mem', 'cpu_seconds', 'rss', 'cache', 'major_faults', 'io_read', 'io_write', 'pids']
+    target_stats.write('elapsed, {0}\n'.format(', '.join(target_stats_keys))) if target_stats else None
+
+    def measure(recorder, start, profiler=None):
+        # returns (convergence time, received routes) once a check-point is
+        # reached and the cooling period is over
+        cpu = 0
+        mem = 0
+        cpu_seconds = None
+        printed = False
+        checked_at = None
+        first_route = False
+        while True:
+            info = q.get()
+
+            if not is_remote and info['who'] == target.name:
+                cpu = info['cpu']
+                mem = info['mem']
+                cpu_seconds = info.get('cpu_seconds')
+                timeline.counter('target cpu', info['time'], cpu=cpu)
+                timeline.counter('target mem', info['time'], mem=mem)
+                target_stats.write('{0:.3f}, {1}\n'.format(info['time'] - start, ', '.join(
+                    str(info.get(k, '')) for k in target_stats_keys)))
+
+            if info['who'] == m.name:
+                # routes received while the testers were booting count from the start
+                elapsed = max(info['time'] - start, 0)
+                recved = info['state']['adj-table']['accepted'] if 'accepted' in info['state']['adj-table'] else 0
+                if printed:
+                    rm_line()
+                printed = True
+                print 'elapsed: {0:.2f}sec, cpu: {1:>4.2f}%, mem: {2}, recved: {3}'.format(elapsed, cpu, mem_human(mem), recved)
+                f.write('{0:.3f}, {1}, {2}, {3}\n'.format(elapsed, cpu, mem, recved)) if f else None
+                f.flush() if f else None
+                recorder.append(elapsed, cpu, cpu_seconds, mem, recved)
+                timeline.counter('monitor routes', info['time'], routes=recved)
+                if recved and not first_route:
+                    first_route = True
+                    timeline.instant('first route', m.name, info['time'])
+
+                if info['checked']:
+                    timeline.instant('check-point', m.name, info['time'], routes=recved)
+                if info['checked'] and profiler:
+                    profiler.checkpoint(info['time'] - start)
+
+                if info['checked'] and checked_at is None:
+                    checked_at = info['time']
+
+                if checked_at is None or info['time'] < start + settle:
+                    continue
+                # cooling starts with the last best path change when staggered
+                quiet = max(checked_at, m.rib.last_change or 0) if settle else checked_at
+                if info['time'] - quiet >= args.cooling:
+                    return checked_at - start, recved
+
+    summaries = []
+    for iteration in range(args.iterations):
+        drain = None
+        if iteration > 0:
+            phase = time.time()
+            drain = warm_reset(testers, m, q, target if not is_remote else None, args.reset_timeout)
+            timeline.complete('warm reset', 'bgperf', phase, iteration=iteration + 1)
+            if drain is None:
+                print 'iteration {0}/{1} failed: the routes couldn\'t be withdrawn, stopping'.format(
+                    iteration + 1, args.iterations)
+                break
+
+        recorder = results.RunRecorder(results_dir(args), args.bench_name,
+                                       dict(meta, iteration=iteration + 1, warm=iteration > 0))
+        with open('{0}/scenario.yaml'.format(recorder.dir), 'w') as scenario_file:
+            scenario_file.write(scenario)
+
+        start = time.time()
+        # the monitor sees the first announcements while the testers boot
+        changes = m.rib.changes if iteration > 0 else 0
+        profiler = None
+        if args.profile and not is_remote:
+            profiler = Profiler(target, '{0}/profile'.format(recorder.dir), start, args.profile_window)
+            profiler.start()
+
+        if iteration > 0:
+            print 'iteration {0}/{1}: re-announcing all routes'.format(iteration + 1, args.iterations)
+            for t in testers:
+                t.announce_all()
+
+        convergence, recved = measure(recorder, start, profiler)
+        timeline.complete('convergence', 'bgperf', start, start + convergence, iteration=iteration + 1, routes=recved)
+        timeline.complete('cooling', 'bgperf', start + convergence)
+
+        # the best paths chosen by the target as seen by the monitor
+        extra = {'best-path-changes': m.rib.changes - changes}
+        if m.rib.last_change:
+            extra['best-path-convergence'] = max(m.rib.last_change - start, 0)
+        if extra['best-path-changes']:
+            print 'best path changes: {0}, the last one at {1:.2f}sec'.format(
+                extra['best-path-changes'], extra['best-path-convergence'])
+
+        # before any churn, which would add to the received counts
+        if iteration == 0 and receivers:
+            phase = time.time()
+            extra.update(report_receivers(receivers, start, args.receiver_timeout,
+                                          '{0}/receivers.csv'.format(config_dir)))
+            timeline.complete('receivers', 'bgperf', phase)
+
+        if args.churn_duration > 0:
+            phase = time.time()
+            extra.update(run_churn(args, testers, m, q, target.name if not is_remote else None,
+                                   recorder, start, '{0}/churn-{1}.csv'.format(config_dir, iteration + 1)) or {})
+            timeline.complete('churn', 'bgperf', phase)
+        if args.saturate:
+            phase = time.time()
+            extra.update(run_saturate(args, testers, m, q, target.name if not is_remote else None,
+                                      '{0}/saturate-{1}.csv'.format(config_dir, iteration + 1)) or {})
+            timeline.complete('saturate', 'bgperf', phase)
+
+        phase = time.time()
+        # bmp and monitor arrival times are only kept for the first announcement
+        if iteration == 0 and bmp:
+            report_bmp(bmp, start, '{0}/bmp.csv'.format(config_dir))
+
+        if iteration == 0 and args.latency:
+            report_latency(testers, m, '{0}/latency.csv'.format(config_dir))
+
+        extra.update(report_replay(testers, m, start, '{0}/replay-{1}.csv'.format(config_dir, iteration + 1)))
+
+        if profiler:
+            profiler.stop()
+        timeline.complete('reports', 'bgperf', phase)
+
+        summary = recorder.finish(convergence, routes=recved, iteration=iteration + 1, drain=drain, **extra)
+        summary['run'] = recorder.run_id
+        print 'saved as run {0} (convergence: {1:.2f}sec, peak mem: {2}, cpu: {3:.2f}sec)'.format(
+            recorder.run_id, summary['convergence'], mem_human(summary['peak_mem']), summary['cpu_seconds'])
+        summaries.append(summary)
+
+    f.close() if f else None
+    target_stats.close() if target_stats else None
+
+    if bmp:
+        bmp.stop()
+
+    m.stop_stats()
+    if not is_remote:
+        target.stop_stats()
 
-        if not is_remote and info['who'] == target.name:
-            cpu = info['cpu']
-            mem = info['mem']
+    if args.trace:
+        timeline.save('{0}/trace.json'.format(config_dir))
+        print 'timeline saved in {0}/trace.json'.format(config_dir)
 
-        if info['who'] == m.name:
-            now = datetime.datetime.now()
-            elapsed = now - start
-            recved = info['state']['adj-table']['accepted'] if 'accepted' in info['state']['adj-table'] else 0
-            if elapsed.seconds > 0:
-                rm_line()
-            print 'elapsed: {0}sec, cpu: {1:>4.2f}%, mem: {2}, recved: {3}'.format(elapsed.seconds, cpu, mem_human(mem), recved)
-            f.write('{0}, {1}, {2}, {3}\n'.format(elapsed.seconds, cpu, mem, recved)) if f else None
-            f.flush() if f else None
+    # the cold start, with the warm iterations if any
+    summary = summaries[0]
+    summary['warm'] = summaries[1:]
+    return summary
 
-            if cooling == args.cooling:
-                f.close() if f else None
-                return
 
-            if cooling >= 0:
-                cooling += 1
+def wait_receivers(receivers, key, timeout):
+    # waits until every receiver has a time for key ('established' or
+    # 'done') or timeout seconds, returns their merged table
+    deadline = time.time() + timeout
+    while True:
+        table = {}
+        for r in receivers:
+            table.update(r.receivers())
+        if all(v[key] is not None for v in table.values()) or time.time() > deadline:
+            return table
+        time.sleep(0.5)
+
+
+def report_receivers(receivers, start, timeout, filename):
+    # completion time of each receiver, i.e. when it got every prefix, and
+    # the spread between the first and the last one
+    print 'waiting receivers'
+    table = wait_receivers(receivers, 'done', timeout)
+    with open(filename, 'w') as f:
+        f.write('router-id, received, completion\n')
+        for rid, v in sorted(table.items()):
+            f.write('{0}, {1}, {2}\n'.format(rid, v['received'],
+                                             '{0:.3f}'.format(v['done'] - start) if v['done'] is not None else ''))
+
+    times = [v['done'] - start for v in table.values() if v['done'] is not None]
+    incomplete = len(table) - len(times)
+    if not times:
+        print 'receivers: none received every prefix'
+        return {'receivers-incomplete': incomplete}
+    first, last = min(times), max(times)
+    print 'receivers: first: {0:.2f}sec, last: {1:.2f}sec, spread: {2:.2f}sec ({3} of {4} incomplete)'.format(
+        first, last, last - first, incomplete, len(table))
+    return {
+        'receivers-first': first,
+        'receivers-last': last,
+        'receivers-spread': last - first,
+        'receivers-incomplete': incomplete,
+    }
+
+
+class ChurnMeter(object):
+    # churn updates sent by the speaker testers, path events seen by the
+    # monitor and prefixes the target hasn't converged on, since the meter
+    # was created
+
+    def __init__(self, speakers, m):
+        self.speakers = speakers
+        self.m = m
+        self.tracker = ChurnTracker([t.host_dir for t in speakers], m.rib)
+        self.sent_start, self.events_start = self.counts()
+
+    def counts(self):
+        sent = sum(t.counters().get('churn', 0) for t in self.speakers)
+        with self.m.rib.lock:
+            return sent, self.m.rib.events
+
+    def sample(self):
+        sent, events = self.counts()
+        return sent - self.sent_start, events - self.events_start, self.tracker.poll()
+
+
+def run_saturate(args, testers, m, q, target_name, filename):
+    # finds the highest churn rate the target sustains: the rate doubles
+    # from --min-rate while the target keeps up, then is bisected between
+    # the last sustained rate and the first one which wasn't
+    speakers = [t for t in testers if isinstance(t, SpeakerTester)]
+    if len(speakers) == 0 or not m.watching:
+        print 'saturate: needs speaker testers and the monitor event stream'
+        return None
+    # the rate is split across testers by their number of churning peers
+    weights = dict((t, sum(1 for n in t.conf.get('neighbors', {}).values() if n.get('churn', t.conf.get('churn'))))
+                   for t in speakers)
+    total = float(sum(weights.values()) or 1)
+
+    def wait_quiet(quiet=1.0):
+        # until the monitor hasn't seen any path event for quiet seconds
+        with m.rib.lock:
+            events = m.rib.events
+        since = time.time()
+        while time.time() - since < quiet:
+            time.sleep(0.1)
+            with m.rib.lock:
+                if m.rib.events != events:
+                    events = m.rib.events
+                    since = time.time()
+        while not q.empty():
+            q.get_nowait()
+
+    def trial(rate):
+        for t in speakers:
+            t.set_control(churn=True, rate=rate * weights[t] / total)
+        meter = ChurnMeter(speakers, m)
+        began = time.time()
+        samples = []
+        # (elapsed, cpu) of the target
+        cpus = []
+        mem = None
+        while True:
+            info = q.get()
+            if info['who'] == target_name:
+                mem = info['mem']
+                cpus.append((info['time'] - began, info['cpu']))
+                continue
+            if info['who'] != m.name:
+                continue
+            elapsed = info['time'] - began
+            sent, observed, pending = meter.sample()
+            samples.append((elapsed, pending, mem))
+            if elapsed >= args.step_duration:
+                break
+        for t in speakers:
+            t.set_control(churn=False, rate=None)
+        wait_quiet()
+
+        # sustained: the testers could offer the rate, the prefixes pending
+        # on the target stay within --max-lag seconds of updates and don't
+        # keep growing over the second half of the step, nor do the target
+        # memory and CPU usage (the last quarter of the step against the
+        # third one, for the CPU, which is noisier)
+        half = [x for x in samples if x[0] >= elapsed / 2]
+        growth = (half[-1][1] - half[0][1]) / max(half[-1][0] - half[0][0], 1e-3)
+        mems = [x[2] for x in half if x[2] is not None]
+        mem_growth = (mems[-1] - mems[0]) / float(mems[0]) if len(mems) > 1 and mems[0] else 0.0
+        third = [c for t, c in cpus if elapsed / 2 <= t < elapsed * 3 / 4]
+        last = [c for t, c in cpus if t >= elapsed * 3 / 4]
+        cpu_growth = 0.0
+        if third and last and sum(third):
+            cpu_growth = (sum(last) / len(last)) / (sum(third) / len(third)) - 1
+        r = {
+            'rate': rate,
+            'offered': sent / elapsed,
+            'processed': observed / elapsed,
+            'lag': pending / float(rate),
+            'pending-growth': growth,
+            'mem-growth': mem_growth,
+            'cpu-growth': cpu_growth,
+        }
+        r['sustained'] = r['offered'] >= 0.9 * rate and r['lag'] <= args.max_lag and \
+            growth <= 0.1 * rate and mem_growth <= args.max_mem_growth and cpu_growth <= args.max_cpu_growth
+        return r
+
+    good, bad = None, None
+    rate = float(args.min_rate)
+    with open(filename, 'w') as f:
+        f.write('rate, offered, processed, lag, pending-growth, mem-growth, cpu-growth, sustained\n')
+        while True:
+            r = trial(rate)
+            print 'saturate: {0:.0f} updates/sec, offered {1:.0f}, processed {2:.0f}, lag {3:.2f}sec: {4}'.format(
+                rate, r['offered'], r['processed'], r['lag'], 'sustained' if r['sustained'] else 'not sustained')
+            f.write('{0:.1f}, {1:.1f}, {2:.1f}, {3:.3f}, {4:.1f}, {5:.4f}, {6:.4f}, {7}\n'.format(
+                rate, r['offered'], r['processed'], r['lag'], r['pending-growth'], r['mem-growth'], r['cpu-growth'],
+                int(r['sustained'])))
+            f.flush()
+            if r['sustained']:
+                good = rate
+            else:
+                bad = rate
+            if bad is None:
+                if rate >= args.max_rate:
+                    print 'saturate: --max-rate reached'
+                    break
+                rate = min(rate * 2, args.max_rate)
+                continue
+            if good is None or bad / good <= 1 + args.precision:
+                break
+            rate = (good + bad) / 2
+
+    if good is None:
+        print 'saturate: even --min-rate {0} updates/sec isn\'t sustained'.format(args.min_rate)
+    else:
+        print 'saturate: knee at {0:.0f} updates/sec'.format(good)
+    return {'max-sustained-rate': good}
+
+
+def run_churn(args, testers, m, q, target_name, recorder, start, filename):
+    # lets the speaker testers churn for --churn-duration seconds and
+    # compares the updates they sent with the path events seen by the
+    # monitor. pending prefixes are those whose last update the target
+    # hasn't exported yet.
+    speakers = [t for t in testers if isinstance(t, SpeakerTester)]
+    if len(speakers) == 0 or not m.watching:
+        print 'churn: needs speaker testers and the monitor event stream'
+        return None
+
+    meter = ChurnMeter(speakers, m)
+    for t in speakers:
+        t.set_control(churn=True)
+    began = time.time()
+
+    cpu, mem, cpu_seconds = 0, 0, None
+    # target CPU seconds used while churning
+    used, last_cpu_seconds, last_time = 0.0, None, None
+    pending_max = 0
+    printed = False
+    with open(filename, 'w') as f:
+        f.write('elapsed, sent, observed, pending, cpu, mem\n')
+        while True:
+            info = q.get()
+            if info['who'] == target_name:
+                cpu, mem, cpu_seconds = info['cpu'], info['mem'], info.get('cpu_seconds')
+                if cpu_seconds is not None:
+                    if last_cpu_seconds is not None:
+                        used += cpu_seconds - last_cpu_seconds
+                    last_cpu_seconds = cpu_seconds
+                elif last_time is not None:
+                    used += cpu / 100.0 * (info['time'] - last_time)
+                last_time = info['time']
+                continue
+            if info['who'] != m.name:
+                continue
+            elapsed = info['time'] - began
+            n, observed, pending = meter.sample()
+            pending_max = max(pending_max, pending)
+            if printed:
+                rm_line()
+            printed = True
+            print 'churn: {0:.2f}sec, sent: {1}, observed: {2}, pending: {3}, cpu: {4:>4.2f}%'.format(
+                elapsed, n, observed, pending, cpu)
+            f.write('{0:.3f}, {1}, {2}, {3}, {4}, {5}\n'.format(elapsed, n, observed, pending, cpu, mem))
+            recorder.append(info['time'] - start, cpu, cpu_seconds, mem,
+                            info['state']['adj-table'].get('accepted', 0))
+            if elapsed >= args.churn_duration:
+                break
+
+    for t in speakers:
+        t.set_control(churn=False)
+
+    summary = {
+        'churn-offered': n / elapsed,
+        'churn-processed': observed / elapsed,
+        'churn-pending': pending,
+        'churn-pending-max': pending_max,
+        'cpu-per-update': used / observed if observed and target_name else None,
+    }
+    print 'churn: offered {0:.1f} updates/sec, processed {1:.1f} updates/sec, pending {2} prefixes (max {3}), cpu per update: {4}'.format(
+        summary['churn-offered'], summary['churn-processed'], pending, pending_max,
+        '{0:.1f}us'.format(summary['cpu-per-update'] * 1e6) if summary['cpu-per-update'] is not None else 'n/a')
+    return summary
+
+
+def warm_reset(testers, m, q, target, timeout):
+    # makes every tester withdraw its routes and waits for the monitor to
+    # drain to zero, then for the target's own RIB (target is None when it
+    # is remote). returns the drain time, None if either still holds routes
+    # after timeout seconds.
+    print 'withdrawing all routes'
+    start = time.time()
+    deadline = start + timeout
+    for t in testers:
+        t.withdraw_all()
+    printed = False
+    recved = None
+    while recved != 0:
+        if time.time() >= deadline:
+            print 'warm reset: the monitor still has {0} routes after {1:.0f}sec'.format(recved, timeout)
+            return None
+        try:
+            info = q.get(timeout=1)
+        except Empty:
+            continue
+        if info['who'] != m.name:
+            continue
+        recved = info['state']['adj-table'].get('accepted', 0)
+        if printed:
+            rm_line()
+        printed = True
+        print 'draining.. {0:.2f}sec, recved: {1}'.format(info['time'] - start, recved)
+    # the monitor only sees what the target exports
+    routes = target.rib_routes() if target else None
+    while routes:
+        if time.time() >= deadline:
+            print 'warm reset: the target still has {0} routes after {1:.0f}sec'.format(routes, timeout)
+            return None
+        time.sleep(1)
+        routes = target.rib_routes()
+    if target and routes is None:
+        print 'warning: can\'t read the size of the {0} RIB, only the monitor was drained'.format(target.name)
+    drain = time.time() - start
+    m.rearm()
+    # samples taken while draining don't belong to the next iteration
+    while not q.empty():
+        q.get_nowait()
+    return drain
+
+SWEEP_KEYS = ['target', 'neighbor_num', 'prefix_num', 'as_path_list_num', 'prefix_list_num',
+              'community_list_num', 'ext_community_list_num']
+
+
+def sweep(args):
+    # runs bench on every combination of the given values. the docker network
+    # and the images are reused, only the containers are recreated.
+    if args.image and len(args.target) > 1:
+        print '-i can\'t be used with more than one target'
+        sys.exit(1)
+    points = results.sweep_points(args, SWEEP_KEYS)
+    table = args.table or '{0}/{1}-sweep.csv'.format(args.dir, args.bench_name)
+    rows = []
+    with open(table, 'w') as f:
+        f.write('target, neighbors, prefixes, as-path-lists, prefix-lists, community-lists, '
+                'ext-community-lists, routes, convergence, peak_mem, cpu_seconds, run\n')
+        for idx, (values, point) in enumerate(points):
+            point.repeat = False
+            point.file = None
+            point.output = None
+            print 'sweep point {0}/{1}: target {2}, {3} neighbors, {4} prefixes, filters {5}'.format(
+                idx + 1, len(points), point.target, point.neighbor_num, point.prefix_num, '/'.join(str(v) for v in values[3:]))
+            summary = bench(point)
+            row = dict(zip(SWEEP_KEYS, values))
+            row.update(summary)
+            rows.append(row)
+            f.write('{0}, {1}, {2}, {3}, {4}, {5}, {6}, {7}, {8:.3f}, {9}, {10:.3f}, {11}\n'.format(
+                *(list(values) + [row['neighbor_num'] * row['prefix_num'],
+                                  row['convergence'], row['peak_mem'], row['cpu_seconds'], row['run']])))
+            f.flush()
+
+    def fmt(v):
+        return '{0:.3f}'.format(v) if v is not None else 'n/a'
+
+    # scaling exponents per target and filter setup against the swept axes,
+    # which are independent: metric ~ peers^a * prefixes^b, prefixes per
+    # peer (the routes exponent is b, the peers one at a fixed total a - b).
+    # an axis which isn't swept gets no exponent.
+    fit_file = os.path.splitext(table)[0] + '-fit.csv'
+    with open(fit_file, 'w') as f:
+        f.write('target, filters, metric, peers-exponent, prefixes-exponent, r2, points\n')
+        groups = {}
+        for row in rows:
+            key = (row['target'], '/'.join(str(row[k]) for k in SWEEP_KEYS[3:]))
+            groups.setdefault(key, []).append(row)
+        for (target, filters), group in sorted(groups.items()):
+            xs = [(r['neighbor_num'], r['prefix_num']) for r in group]
+            for metric in ['convergence', 'peak_mem']:
+                fit = results.loglog_fit(xs, [r[metric] for r in group])
+                if fit is None:
+                    print 'warning: {0} (filters {1}): {2} can\'t be fitted on {3} points, ' \
+                          'sweep more neighbor or prefix counts'.format(target, filters, metric, len(group))
+                    continue
+                (peers_exp, prefixes_exp), r2 = fit
+                f.write('{0}, {1}, {2}, {3}, {4}, {5:.4f}, {6}\n'.format(
+                    target, filters, metric, fmt(peers_exp), fmt(prefixes_exp), r2, len(group)))
+                print '{0} (filters {1}): {2} ~ peers^{3} * prefixes^{4} (r2: {5:.3f})'.format(
+                    target, filters, metric, fmt(peers_exp), fmt(prefixes_exp), r2)
+    print 'sweep table: {0}, fitted exponents: {1}'.format(table, fit_file)
+
+
+def results_dir(args):
+    return '{0}/results'.format(args.dir)
+
+
+def compare(args):
+    baseline = results.find_runs(results_dir(args), args.baseline)
+    candidate = results.find_runs(results_dir(args), args.candidate)
+    for selector, runs in [(args.baseline, baseline), (args.candidate, candidate)]:
+        if len(runs) == 0:
+            print 'no finished run matches', selector
+            sys.exit(1)
+        scenarios = set(r['meta']['scenario-sha1'] for r in runs)
+        if len(scenarios) > 1:
+            print 'warning: runs of {0} use {1} different scenarios'.format(selector, len(scenarios))
+    if baseline[0]['meta']['scenario-sha1'] != candidate[0]['meta']['scenario-sha1']:
+        print 'warning: baseline and candidate use different scenarios'
+
+    rows = results.compare(baseline, candidate, args.threshold, args.alpha)
+    print '{0:<12} {1:>22} {2:>22} {3:>9} {4:>7}'.format('metric', 'baseline', 'candidate', 'change', 'p')
+    for r in rows:
+        print '{0:<12} {1:>14.2f} +-{2:<5.2f} {3:>14.2f} +-{4:<5.2f} {5:>8.1f}% {6:>7} {7}'.format(
+            r['metric'], r['baseline'], r['baseline_stdev'], r['candidate'], r['candidate_stdev'],
+            r['change'], '{0:.3f}'.format(r['p']) if r['p'] is not None else 'n/a',
+            'REGRESSION' if r['regression'] else '')
+    if any(r['regression'] for r in rows):
+        sys.exit(1)
+
+
+def report_latency(testers, m, filename):
+    # only the speaker testers log when they send each prefix
+    dirs = [t.host_dir for t in testers if isinstance(t, SpeakerTester)]
+    if len(dirs) == 0 or not m.watching:
+        print 'latency: needs speaker testers and the monitor event stream'
+        return
+    with m.rib.lock:
+        arrivals = dict(m.rib.routes)
+    overall, peers, missing = latency.collect(dirs, arrivals)
+
+    def fmt(v):
+        return '{0:.2f}ms'.format(v * 1000) if v is not None else 'n/a'
+
+    with open(filename, 'w') as f:
+        f.write('peer, count, p50, p90, p99, max\n')
+        for peer, h in sorted(peers.items()):
+            s = h.summary()
+            f.write('{0}, {1}, {2}, {3}, {4}, {5}\n'.format(peer, s['count'], s['p50'], s['p90'], s['p99'], s['max']))
+    s = overall.summary()
+    print 'latency: {0} prefixes, p50: {1}, p90: {2}, p99: {3}, max: {4} ({5} not received, per peer: {6})'.format(
+        s['count'], fmt(s['p50']), fmt(s['p90']), fmt(s['p99']), fmt(s['max']), missing, filename)
+
+
+def report_replay(testers, m, start, filename):
+    # how far behind the recorded times of the BGP4MP messages the replays
+    # fell, the target holding the sessions back, and how long after the
+    # last message the monitor saw the last path event
+    timed = [(t, t.timed()) for t in testers if isinstance(t, SpeakerMRTTester) and t.timed()]
+    if not timed:
+        return {}
+    meta = {}
+    speed = 1
+    for t, rids in timed:
+        meta.update((rid, t.streams[rid][1]) for rid in rids)
+        speed = float(t.conf.get('speed', 1))
+    print 'waiting BGP4MP replays ({0}x)'.format(speed)
+    expected = max(v['duration'] for v in meta.values()) / speed
+    while True:
+        replays = {}
+        for t, _ in timed:
+            replays.update(t.replays())
+        lag = max([r['lag'] for r in replays.values() if r] or [0])
+        if all(r and 'done' in r for r in replays.values()) or \
+           time.time() > start + expected + lag + REPLAY_GRACE:
+            break
+        time.sleep(1)
+
+    with open(filename, 'w') as f:
+        f.write('router-id, updates, duration, start, done, max-lag, lag\n')
+        for rid, r in sorted(replays.items()):
+            if not r:
+                f.write('{0}, {1}, {2:.3f}, , , , \n'.format(rid, meta[rid]['updates'], meta[rid]['duration']))
+                continue
+            f.write('{0}, {1}, {2:.3f}, {3:.3f}, {4}, {5:.3f}, {6:.3f}\n'.format(
+                rid, meta[rid]['updates'], meta[rid]['duration'], r['start'] - start,
+                '{0:.3f}'.format(r['done'] - start) if 'done' in r else '', r['max-lag'], r['lag']))
+
+    done = [r for r in replays.values() if r and 'done' in r]
+    incomplete = len(replays) - len(done)
+    if not done:
+        print 'replay: none completed'
+        return {'replay-incomplete': incomplete}
+    first = min(r['start'] for r in done)
+    last = max(r['done'] for r in done)
+    extra = {
+        'replay-incomplete': incomplete,
+        # the speed-up actually achieved over the whole recording
+        'replay-speed': max(v['duration'] for v in meta.values()) / max(last - first, 1e-6),
+        'replay-max-lag': max(r['max-lag'] for r in done),
+        'replay-lag': max(r['lag'] for r in done),
+    }
+    if m.rib.last_event is not None:
+        extra['replay-tail'] = max(m.rib.last_event - last, 0)
+    print 'replay: {0:.2f}x achieved, max lag behind the recorded times {1:.2f}sec, {2:.2f}sec at the end, ' \
+          'last update seen {3:.2f}sec after the last message ({4} incomplete, per peer: {5})'.format(
+              extra['replay-speed'], extra['replay-max-lag'], extra['replay-lag'], extra.get('replay-tail', float('nan')),
+              incomplete, filename)
+    return extra
+
+
+def report_bmp(bmp, start, filename):
+    # ingest time (pre-policy Adj-RIB-In) vs post-policy, per peer of the target
+    def rel(t):
+        return t - start if t is not None else float('nan')
+
+    last = {False: None, True: None}
+    with open(filename, 'w') as f:
+        f.write('peer, post-policy, routes, withdrawn, first, last\n')
+        for peer, post, s in bmp.summary():
+            f.write('{0}, {1}, {2}, {3}, {4:.3f}, {5:.3f}\n'.format(
+                peer, int(post), s['routes'], s['withdrawn'], rel(s['first']), rel(s['last'])))
+            if s['last'] is not None and (last[post] is None or s['last'] > last[post]):
+                last[post] = s['last']
+    print 'bmp: pre-policy ingest done at {0:.2f}sec, post-policy at {1:.2f}sec (per peer: {2})'.format(
+        rel(last[False]), rel(last[True]), filename)
+
+def mrt_cache_dir(args):
+    return '{0}/mrt-cache'.format(args.dir)
+
+
+def compile_mrt_stream(args):
+    path, meta = compile_mrt(args.mrt_file, args.output or mrt_cache_dir(args),
+                             args.local_as, args.next_hop, only_best=args.only_best,
+                             count=args.count, skip=args.skip, peer=args.peer)
+    print path
+    print '{0} routes, {1} updates, {2} bytes ({3:.3f} msgs/route, {4:.1f} bytes/route)'.format(
+        meta['routes'], meta['messages'], meta['bytes'], meta['messages-per-route'], meta['bytes-per-route'])
+    if meta.get('timed'):
+        print '{0} BGP4MP updates ({1} withdrawn routes) over {2:.2f}sec, times in {3}{4}'.format(
+            meta['updates'], meta['withdrawn'], meta['duration'], path, TIMES_SUFFIX)
+
+
+def peer_key(value):
+    # PEER_INDEX_TABLE index or peer address
+    return int(value) if value.isdigit() else value
 
-            if info['checked']:
-                cooling = 0
 
 def gen_conf(args):
     neighbor_num = args.neighbor_num
@@ -374,6 +1135,11 @@ def gen_conf(args):
     prefix_list = args.prefix_list_num
     community_list = args.community_list_num
     ext_community_list = args.ext_community_list_num
+    # groups of overlap neighbors announce the same prefixes
+    overlap = max(args.overlap, 1)
+    routes = prefix * ((neighbor_num + overlap - 1) // overlap)
+    if args.overlap_stagger > 0 and args.tester_type != 'speaker':
+        print('warning: --overlap-stagger needs speaker testers, ExaBGP testers announce at once')
 
     local_address_prefix = netaddr.IPNetwork(args.local_address_prefix)
 
@@ -413,13 +1179,11 @@ def gen_conf(args):
         'as': 1001,
         'router-id': str(monitor_router_id),
         'local-address': str(monitor_local_address),
-        'check-points': [prefix * neighbor_num],
+        'check-points': [routes],
     }
 
     offset = 0
 
-    it = netaddr.iter_iprange('90.0.0.0', '100.0.0.0')
-
     conf['policy'] = {}
 
     assignment = []
@@ -429,7 +1193,7 @@ def gen_conf(args):
         conf['policy'][name] = {
             'match': [{
                 'type': 'prefix',
-                'value': list('{0}/32'.format(ip) for ip in islice(it, prefix_list)),
+                'value': path_range('90.0.0.0', prefix_list),
             }],
         }
         assignment.append(name)
@@ -439,7 +1203,7 @@ def gen_conf(args):
         conf['policy'][name] = {
             'match': [{
                 'type': 'as-path',
-                'value': list(range(10000, 10000 + as_path_list)),
+                'value': value_range(10000, as_path_list),
             }],
         }
         assignment.append(name)
@@ -449,7 +1213,7 @@ def gen_conf(args):
         conf['policy'][name] = {
             'match': [{
                 'type': 'community',
-                'value': list('{0}:{1}'.format(i/(1<<16), i%(1<<16)) for i in range(community_list)),
+                'value': value_range(0, community_list),
             }],
         }
         assignment.append(name)
@@ -459,13 +1223,15 @@ def gen_conf(args):
         conf['policy'][name] = {
             'match': [{
                 'type': 'ext-community',
-                'value': list('rt:{0}:{1}'.format(i/(1<<16), i%(1<<16)) for i in range(ext_community_list)),
+                'value': value_range(0, ext_community_list),
             }],
         }
         assignment.append(name)
 
     neighbors = {}
+    router_ids = []
     configured_neighbors_cnt = 0
+    path_start = '100.0.0.0'
     for i in range(3, neighbor_num+3+2):
         if configured_neighbors_cnt == neighbor_num:
             break
@@ -474,25 +1240,174 @@ def gen_conf(args):
             print('skipping tester\'s neighbor with IP {} because it collides with target or monitor'.format(curr_ip))
             continue
         router_id = str(local_address_prefix.ip + i)
+        group, rank = divmod(configured_neighbors_cnt, overlap)
+        if args.synthetic_rib:
+            # every group announces its own slice of the same table
+            paths = rib_slice(group * prefix, prefix, routes, seed=args.rib_seed, unique_attrs=args.unique_attrs)
+        else:
+            if rank == 0:
+                group_start, path_start = path_start, next_start(path_range(path_start, prefix))
+            paths = path_range(group_start, prefix)
         neighbors[router_id] = {
             'as': 1000 + i,
             'router-id': router_id,
             'local-address': router_id,
-            'paths': '${{gen_paths({0})}}'.format(prefix),
+            'paths': paths,
             'filter': {
                 args.filter_type: assignment,
             },
         }
+        if overlap > 1:
+            # the later a peer of a group announces, the shorter its AS path,
+            # so that with --overlap-stagger every new peer takes over the
+            # best path. the <target AS>:<local-pref> communities are the
+            # ones a route server policy would map to a local preference.
+            neighbors[router_id]['attributes'] = {
+                'prepend': overlap - 1 - rank,
+                'med': rank * 10,
+                'origin': ['igp', 'egp', 'incomplete'][rank % 3],
+                'communities': ['{0}:{1}'.format(conf['target']['as'], 100 + rank * 10)],
+            }
+            if args.overlap_stagger > 0:
+                neighbors[router_id]['delay'] = rank * args.overlap_stagger
+        router_ids.append(router_id)
         configured_neighbors_cnt += 1
 
-    conf['testers'] = [{
-        'name': 'tester',
-        'type': 'normal',
-        'neighbors': neighbors,
-    }]
+    conf['testers'] = gen_tester_shards(args, neighbors, router_ids) if router_ids else []
+
+    mrt_neighbors = {}
+    if args.mrt_file:
+        # one neighbor per peer of the collector, with its AS, replaying
+        # its own RIB entries, or the UPDATE messages it sent for BGP4MP
+        # files, told apart by their address
+        with MRTReader(args.mrt_file) as reader:
+            peers = [dict(p, key=idx) for idx, p in enumerate(reader.peer_index())]
+        if not peers:
+            peers = [{'address': address, 'as': asn, 'key': address}
+                     for address, asn in update_peers(args.mrt_file)]
+        indexes = range(len(peers)) if args.mrt_peers == 'all' else [int(v) for v in args.mrt_peers.split(',')]
+        if any(idx >= len(peers) for idx in indexes):
+            print 'invalid MRT peer index: {0} has {1} peers'.format(args.mrt_file, len(peers))
+            sys.exit(1)
+        selected = []
+        for i in count(3):
+            if not indexes:
+                break
+            curr_ip = local_address_prefix.ip + i
+            if curr_ip in [target_local_address, monitor_local_address] or str(curr_ip) in neighbors:
+                continue
+            idx = indexes.pop(0)
+            if peers[idx]['as'] in [conf['target']['as'], conf['monitor']['as']]:
+                print('skipping MRT peer {0} (AS{1}) because its AS is the target\'s or the monitor\'s'.format(
+                    idx, peers[idx]['as']))
+                continue
+            mrt_neighbors[str(curr_ip)] = {
+                'as': peers[idx]['as'],
+                'router-id': str(curr_ip),
+                'local-address': str(curr_ip),
+                'mrt-peer': peers[idx]['key'],
+                'filter': {
+                    args.filter_type: assignment,
+                },
+            }
+            selected.append(peers[idx]['key'])
+        conf['testers'].append({
+            'name': 'mrt',
+            'type': 'mrt',
+            'mrt_injector': 'speaker',
+            'mrt-file': os.path.abspath(os.path.expanduser(args.mrt_file)),
+            'neighbors': mrt_neighbors,
+        })
+        routes += peer_prefixes(args.mrt_file, selected)
+        conf['monitor']['check-points'] = [routes]
+
+    if args.receivers > 0:
+        # the as-path lists match none of the announced paths, every
+        # receiver gets every route. the identical policies let the target
+        # share the export work across receivers, distinct ones defeat it.
+        receivers = {}
+        for i in count(3):
+            if len(receivers) == args.receivers:
+                break
+            curr_ip = local_address_prefix.ip + i
+            if curr_ip in [target_local_address, monitor_local_address] or \
+               str(curr_ip) in neighbors or str(curr_ip) in mrt_neighbors:
+                continue
+            idx = len(receivers) if args.receiver_policy == 'distinct' else 0
+            name = 'r{0}'.format(idx)
+            conf['policy'][name] = {
+                'match': [{
+                    'type': 'as-path',
+                    'value': [4200000000 + idx],
+                }],
+            }
+            receivers[str(curr_ip)] = {
+                'as': 1000 + i,
+                'router-id': str(curr_ip),
+                'local-address': str(curr_ip),
+                'filter': {
+                    'out': [name],
+                },
+            }
+        conf['receivers'] = [{
+            'name': 'receivers',
+            'type': 'sink',
+            'expect': routes,
+            'neighbors': receivers,
+        }]
+
+    # saturate paces the churn itself, the rate is only a default
+    if args.churn_rate > 0 or getattr(args, 'saturate', False):
+        for tester in conf['testers']:
+            tester['churn'] = {
+                'rate': args.churn_rate or 1,
+                'distribution': args.churn_distribution,
+                'prefixes': args.churn_prefixes,
+                'actions': args.churn_actions.split(','),
+            }
     return gen_mako_macro() + yaml.dump(conf, default_flow_style=False)
 
 
+def tester_shards_num(args, neighbor_num):
+    if args.tester_shards == 'auto':
+        # one shard per core, leaving a core to the target and one to the monitor
+        num = max(os.sysconf('SC_NPROCESSORS_ONLN') - 2, 1)
+    else:
+        num = int(args.tester_shards)
+    return max(min(num, neighbor_num), 1)
+
+
+def gen_tester_shards(args, neighbors, router_ids):
+    # splits the neighbors evenly across tester containers. with
+    # --pin-testers each shard gets its own cores (when there are enough),
+    # out of the ones left to the target and the monitor.
+    num = tester_shards_num(args, len(router_ids))
+    if num == 1:
+        shards = [{'name': 'tester', 'type': args.tester_type, 'neighbors': neighbors}]
+    else:
+        shards = []
+        for i in range(num):
+            ids = router_ids[i * len(router_ids) // num:(i + 1) * len(router_ids) // num]
+            shards.append({
+                'name': 'tester{0}'.format(i),
+                'type': args.tester_type,
+                'neighbors': dict((r, neighbors[r]) for r in ids),
+            })
+
+    if args.pin_testers:
+        ncpu = os.sysconf('SC_NPROCESSORS_ONLN')
+        cores = range(2, ncpu) if ncpu > 2 else range(ncpu)
+        for i, shard in enumerate(shards):
+            if num <= len(cores):
+                mine = cores[i * len(cores) // num:(i + 1) * len(cores) // num]
+            else:
+                mine = [cores[i % len(cores)]]
+            shard['cpus'] = ','.join(str(c) for c in mine)
+            if args.tester_type == 'speaker':
+                shard['workers'] = len(mine)
+    return shards
+
+
 def config(args):
     conf = gen_conf(args)
 
@@ -511,23 +1426,66 @@ if __name__ == '__main__':
     parser_prepare = s.add_parser('prepare', help='prepare env')
     parser_prepare.add_argument('-f', '--force', action='store_true', help='build even if the container already exists')
     parser_prepare.add_argument('-n', '--no-cache', action='store_true')
+    parser_prepare.add_argument('-w', '--build-workers', default=3, type=int,
+                                help='number of images built concurrently')
     parser_prepare.set_defaults(func=prepare)
 
     parser_update = s.add_parser('update', help='rebuild bgp docker images')
-    parser_update.add_argument('image', choices=['exabgp', 'exabgp_mrtparse', 'gobgp', 'bird', 'quagga', 'frr', 'all'])
+    parser_update.add_argument('image', choices=['exabgp', 'exabgp_mrtparse', 'speaker', 'gobgp', 'bird', 'quagga', 'frr', 'all'])
     parser_update.add_argument('-c', '--checkout', default='HEAD')
     parser_update.add_argument('-n', '--no-cache', action='store_true')
+    parser_update.add_argument('-w', '--build-workers', default=3, type=int,
+                               help='number of images built concurrently')
     parser_update.set_defaults(func=update)
 
-    def add_gen_conf_args(parser):
-        parser.add_argument('-n', '--neighbor-num', default=100, type=int)
-        parser.add_argument('-p', '--prefix-num', default=100, type=int)
+    def add_gen_conf_args(parser, sweep=False):
+        # sweep takes lists or ranges of counts
+        num = value_list(int) if sweep else int
+        parser.add_argument('-n', '--neighbor-num', default='100', type=num)
+        parser.add_argument('-p', '--prefix-num', default='100', type=num)
         parser.add_argument('-l', '--filter-type', choices=['in', 'out'], default='in')
-        parser.add_argument('-a', '--as-path-list-num', default=0, type=int)
-        parser.add_argument('-e', '--prefix-list-num', default=0, type=int)
-        parser.add_argument('-c', '--community-list-num', default=0, type=int)
-        parser.add_argument('-x', '--ext-community-list-num', default=0, type=int)
+        parser.add_argument('-a', '--as-path-list-num', default='0', type=num)
+        parser.add_argument('-e', '--prefix-list-num', default='0', type=num)
+        parser.add_argument('-c', '--community-list-num', default='0', type=num)
+        parser.add_argument('-x', '--ext-community-list-num', default='0', type=num)
         parser.add_argument('-s', '--single-table', action='store_true')
+        parser.add_argument('--tester-type', choices=['normal', 'speaker'], default='normal',
+                            help='normal: one ExaBGP process per neighbor; '
+                                 'speaker: all neighbors driven by one asyncio BGP speaker')
+        parser.add_argument('--tester-shards', default='1', metavar='N|auto',
+                            help='split the neighbors across N tester containers; '
+                                 'auto: one per host core minus two')
+        parser.add_argument('--pin-testers', action='store_true',
+                            help='pin each tester container to its own cores, '
+                                 'leaving the first two to the target and the monitor')
+        parser.add_argument('--churn-rate', default=0, type=float,
+                            help='updates/sec sent by each peer while churning (speaker testers only)')
+        parser.add_argument('--churn-distribution', choices=['constant', 'poisson', 'burst'], default='constant')
+        parser.add_argument('--churn-prefixes', default=0.1, type=float,
+                            help='fraction of the prefixes of each peer which flap')
+        parser.add_argument('--churn-actions', default='withdraw,med,as-path,community',
+                            help='comma separated list of withdraw, med, as-path and community')
+        parser.add_argument('--synthetic-rib', action='store_true',
+                            help='announce a synthetic table with DFZ-like prefix lengths, AS paths and '
+                                 'communities instead of consecutive /32s')
+        parser.add_argument('--rib-seed', default=0, type=int,
+                            help='seed of the synthetic table')
+        parser.add_argument('--unique-attrs', default=0.3, type=float,
+                            help='ratio of unique attribute sets to routes in the synthetic table')
+        parser.add_argument('--overlap', default=1, type=int,
+                            help='number of neighbors announcing the same prefixes with different attributes')
+        parser.add_argument('--overlap-stagger', default=0, type=float,
+                            help='seconds between the announcements of the overlapping neighbors '
+                                 '(speaker testers only)')
+        parser.add_argument('--mrt-file',
+                            help='also replay the peers of this TABLE_DUMP_V2 or BGP4MP file, one neighbor each')
+        parser.add_argument('--mrt-peers', default='all', metavar='all|INDEX,...',
+                            help='PEER_INDEX_TABLE indexes of the peers to replay (BGP4MP files: '
+                                 'in order of appearance)')
+        parser.add_argument('--receivers', default=0, type=int,
+                            help='number of receiving peers counting the routes exported to them')
+        parser.add_argument('--receiver-policy', choices=['identical', 'distinct'], default='identical',
+                            help='out-policy of the receivers: one shared by all or one per receiver')
         parser.add_argument('--target-config-file', type=str,
                             help='target BGP daemon\'s configuration file')
         parser.add_argument('--local-address-prefix', type=str, default='10.10.0.0/16',
@@ -543,22 +1501,107 @@ if __name__ == '__main__':
         parser.add_argument('--monitor-router-id', type=str,
                             help='monitor\' router ID; default: same as --monitor-local-address')
 
+    def add_bench_args(parser, sweep=False):
+        if sweep:
+            parser.add_argument('-t', '--target', type=value_list(str, TARGETS), default='gobgp',
+                            help='comma separated list of targets')
+        else:
+            parser.add_argument('-t', '--target', choices=TARGETS, default='gobgp')
+        parser.add_argument('-i', '--image', help='specify custom docker image')
+        parser.add_argument('--docker-network-name', help='Docker network name; this is the name given by \'docker network ls\'')
+        parser.add_argument('--bridge-name', help='Linux bridge name of the '
+                            'interface corresponding to the Docker network; '
+                            'use this argument only if bgperf can\'t '
+                            'determine the Linux bridge name starting from '
+                            'the Docker network name in case of tests of '
+                            'remote targets.')
+        if not sweep:
+            parser.add_argument('-r', '--repeat', action='store_true', help='use existing tester/monitor container')
+            parser.add_argument('-f', '--file', metavar='CONFIG_FILE')
+        parser.add_argument('-g', '--cooling', default=0, type=float,
+                            help='seconds to keep on measuring after a check-point is reached')
+        if not sweep:
+            parser.add_argument('-o', '--output', metavar='STAT_FILE')
+        parser.add_argument('--stats-interval', default=1.0, type=float,
+                            help='target CPU/memory sampling interval in seconds (>= 0.05 with cgroup sampling)')
+        parser.add_argument('--stats-source', choices=['auto', 'cgroup', 'docker'], default='auto',
+                            help='read target usage from its cgroup files or from the docker stats API')
+        parser.add_argument('--bmp', action='store_true',
+                            help='run a BMP station the target reports to (gobgp, frr >= 7.2)')
+        parser.add_argument('--bmp-port', default=11019, type=int)
+        parser.add_argument('--latency', action='store_true',
+                            help='report per-prefix propagation latency (speaker testers only)')
+        parser.add_argument('--provision-workers', default=8, type=int,
+                            help='number of containers created and started concurrently')
+        parser.add_argument('--churn-duration', default=0, type=float,
+                            help='seconds of churn after each convergence (see --churn-rate)')
+        parser.add_argument('--iterations', default=1, type=int,
+                            help='after the first run, withdraw every route, wait for the monitor '
+                                 'to drain and re-announce them against the same target, this many times in all')
+        parser.add_argument('--reset-timeout', default=300, type=float,
+                            help='seconds the monitor and the target have to drain in each warm reset')
+        parser.add_argument('--speed', default=1, type=float,
+                            help='speed-up of the replay of BGP4MP messages (mrt speaker testers), '
+                                 '0 for as fast as possible')
+        parser.add_argument('--trace', action='store_true',
+                            help='save a timeline of the run (trace.json, for Perfetto or chrome://tracing)')
+        parser.add_argument('--profile', action='store_true',
+                            help='profile the target: pprof for gobgp, perf record for the others')
+        parser.add_argument('--profile-window', default=10, type=float,
+                            help='seconds covered by each CPU profile')
+        parser.add_argument('--receiver-timeout', default=60, type=float,
+                            help='seconds to wait for the receivers to get every route')
+        parser.add_argument('--label', help='label the saved run, e.g. with the target version')
+
     parser_bench = s.add_parser('bench', help='run benchmarks')
-    parser_bench.add_argument('-t', '--target', choices=['gobgp', 'bird', 'quagga', 'frr'], default='gobgp')
-    parser_bench.add_argument('-i', '--image', help='specify custom docker image')
-    parser_bench.add_argument('--docker-network-name', help='Docker network name; this is the name given by \'docker network ls\'')
-    parser_bench.add_argument('--bridge-name', help='Linux bridge name of the '
-                              'interface corresponding to the Docker network; '
-                              'use this argument only if bgperf can\'t '
-                              'determine the Linux bridge name starting from '
-                              'the Docker network name in case of tests of '
-                              'remote targets.')
-    parser_bench.add_argument('-r', '--repeat', action='store_true', help='use existing tester/monitor container')
-    parser_bench.add_argument('-f', '--file', metavar='CONFIG_FILE')
-    parser_bench.add_argument('-g', '--cooling', default=0, type=int)
-    parser_bench.add_argument('-o', '--output', metavar='STAT_FILE')
+    add_bench_args(parser_bench)
     add_gen_conf_args(parser_bench)
-    parser_bench.set_defaults(func=bench)
+    parser_bench.set_defaults(func=bench, saturate=False)
+
+    parser_saturate = s.add_parser('saturate', help='find the maximum churn rate the target sustains')
+    parser_saturate.add_argument('--min-rate', default=100, type=float, help='first rate tried, in updates/sec')
+    parser_saturate.add_argument('--max-rate', default=1000000, type=float)
+    parser_saturate.add_argument('--step-duration', default=10, type=float, help='seconds spent on each rate')
+    parser_saturate.add_argument('--max-lag', default=1, type=float,
+                                 help='prefixes pending on the target allowed at the end of a step, '
+                                      'in seconds of updates')
+    parser_saturate.add_argument('--max-mem-growth', default=0.05, type=float,
+                                 help='target memory growth allowed over the second half of a step')
+    parser_saturate.add_argument('--max-cpu-growth', default=0.1, type=float,
+                                 help='target CPU usage growth allowed over the second half of a step')
+    parser_saturate.add_argument('--precision', default=0.05, type=float,
+                                 help='bisection stops when the bounds are this close (relative)')
+    add_bench_args(parser_saturate)
+    add_gen_conf_args(parser_saturate)
+    parser_saturate.set_defaults(func=bench, saturate=True)
+
+    parser_sweep = s.add_parser('sweep', help='run benchmarks over ranges of parameters')
+    parser_sweep.add_argument('--table', metavar='CSV_FILE', help='default: <dir>/<bench-name>-sweep.csv')
+    add_bench_args(parser_sweep, sweep=True)
+    add_gen_conf_args(parser_sweep, sweep=True)
+    parser_sweep.set_defaults(func=sweep, saturate=False)
+
+    parser_compare = s.add_parser('compare', help='compare saved runs against a baseline')
+    parser_compare.add_argument('baseline', metavar='BASELINE', help='run id or label')
+    parser_compare.add_argument('candidate', metavar='CANDIDATE', help='run id or label')
+    parser_compare.add_argument('--threshold', default=5.0, type=float,
+                                help='minimum slowdown in percent reported as a regression')
+    parser_compare.add_argument('--alpha', default=0.05, type=float,
+                                help='significance level of the Welch t-test (with 2+ runs on each side)')
+    parser_compare.set_defaults(func=compare)
+
+    parser_compile_mrt = s.add_parser('compile-mrt', help='compile a MRT file into a BGP UPDATE stream')
+    parser_compile_mrt.add_argument('mrt_file', metavar='MRT_FILE')
+    parser_compile_mrt.add_argument('--local-as', type=int, required=True, help='AS number of the injecting neighbor')
+    parser_compile_mrt.add_argument('--next-hop', required=True, help='local address of the injecting neighbor')
+    parser_compile_mrt.add_argument('--only-best', action='store_true')
+    parser_compile_mrt.add_argument('--count', type=int)
+    parser_compile_mrt.add_argument('--skip', type=int, default=0)
+    parser_compile_mrt.add_argument('--peer', type=peer_key,
+                                    help='only use the entries of this PEER_INDEX_TABLE index, or the '
+                                         'BGP4MP messages of this peer address')
+    parser_compile_mrt.add_argument('-o', '--output', metavar='CACHE_DIR', help='default: <dir>/mrt-cache')
+    parser_compile_mrt.set_defaults(func=compile_mrt_stream)
 
     parser_config = s.add_parser('config', help='generate config')
     parser_config.add_argument('-o', '--output', default='bgperf.yml', type=str)
@@ -567,4 +1610,10 @@ if __name__ == '__main__':
 
 
     args = parser.parse_args()
+    if getattr(args, 'stats_interval', 1.0) < 0.05:
+        parser.error('--stats-interval must be 0.05 or more')
+    if getattr(args, 'repeat', False) and args.iterations > 1:
+        parser.error('--iterations needs the testers started by this run, not with --repeat')
+    if getattr(args, 'tester_shards', 'auto') != 'auto' and not args.tester_shards.isdigit():
+        parser.error('--tester-shards must be a number or auto')
     args.func(args)
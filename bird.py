@@ -14,33 +14,41 @@
 # limitations under the License.
 
 from base import *
+from policy import iter_values
 
 class BIRD(Container):
 
     CONTAINER_NAME = None
     GUEST_DIR = '/root/config'
+    GIT_REPO = 'https://gitlab.labs.nic.cz/labs/bird.git'
 
     def __init__(self, host_dir, conf, image='bgperf/bird'):
         super(BIRD, self).__init__(self.CONTAINER_NAME, image, host_dir, self.GUEST_DIR, conf)
 
     @classmethod
     def build_image(cls, force=False, tag='bgperf/bird', checkout='HEAD', nocache=False):
+        checkout = cls.resolve_checkout(checkout)
         cls.dockerfile = '''
 FROM ubuntu:latest
 WORKDIR /root
 RUN apt-get update && apt-get install -qy git autoconf libtool gawk make \
 flex bison libncurses-dev libreadline6-dev
 RUN apt-get install -qy flex
-RUN git clone https://gitlab.labs.nic.cz/labs/bird.git bird
+RUN apt-get install -qy linux-tools-generic
+RUN git clone {1} bird
 RUN cd bird && git checkout {0} && autoreconf -i && ./configure && make && make install
-'''.format(checkout)
-        super(BIRD, cls).build_image(force, tag, nocache)
+'''.format(checkout, cls.GIT_REPO)
+        super(BIRD, cls).build_image(force, tag, nocache, checkout)
 
 
 class BIRDTarget(BIRD, Target):
 
     CONTAINER_NAME = 'bgperf_bird_target'
     CONFIG_FILE_NAME = 'bird.conf'
+    PROFILE_PROCESS = 'bird'
+    # one line per table: 'N of M routes for K networks'
+    RIB_COUNT_CMD = 'birdc show route count'
+    RIB_COUNT_PATTERN = r'(\d+) networks'
 
     def write_config(self, scenario_global_conf):
         config = '''router id {0};
@@ -70,13 +78,16 @@ export all;
 '''
 
         def gen_neighbor_config(n):
+            # named after the neighbor address: several neighbors can share an
+            # AS, e.g. the peers of a collector replayed from an MRT file
+            name = n['local-address'].replace('.', '_').replace(':', '_')
             return ('''table table_{0};
 protocol pipe pipe_{0} {{
     table master;
     mode transparent;
     peer table table_{0};
 {1}
-}}'''.format(n['as'], gen_filter_assignment(n)) if not self.conf['single-table'] else '') + '''protocol bgp bgp_{0} {{
+}}'''.format(name, gen_filter_assignment(n)) if not self.conf['single-table'] else '') + '''protocol bgp bgp_{4} {{
     local as {1};
     neighbor {2} as {0};
     {3};
@@ -84,55 +95,46 @@ protocol pipe pipe_{0} {{
     export all;
     rs client;
 }}
-'''.format(n['as'], self.conf['as'], n['local-address'], 'secondary' if self.conf['single-table'] else 'table table_{0}'.format(n['as']))
+'''.format(n['as'], self.conf['as'], n['local-address'],
+           'secondary' if self.conf['single-table'] else 'table table_{0}'.format(name), name)
             return n1 + n2
 
-        def gen_prefix_filter(name, match):
-            return '''function {0}()
+        # the match values are written one at a time, they can be too many to hold
+
+        def write_prefix_filter(f, name, match):
+            f.write('''function {0}()
 prefix set prefixes;
 {{
 prefixes = [
-{1}
+'''.format(name))
+            for i, p in enumerate(iter_values(match)):
+                f.write('{0}{1}'.format(',\n' if i else '', p))
+            f.write('''
 ];
 if net ~ prefixes then return false;
 return true;
-}}
-'''.format(name, ',\n'.join(match['value']))
-
-        def gen_aspath_filter(name, match):
-            c = '''function {0}()
-{{
-'''.format(name)
-            c += '\n'.join('if (bgp_path ~ [= * {0} * =]) then return false;'.format(v) for v in match['value'])
-            c += '''
-return true;
 }
-'''
-            return c
+''')
 
-        def gen_community_filter(name, match):
-            c = '''function {0}()
+        def write_function(f, name, match, fmt):
+            f.write('''function {0}()
 {{
-'''.format(name)
-            c += '\n'.join('if ({0}, {1}) ~ bgp_community then return false;'.format(*v.split(':')) for v in match['value'])
-            c += '''
-return true;
+'''.format(name))
+            for v in iter_values(match):
+                f.write(fmt(v) + '\n')
+            f.write('''return true;
 }
-'''
-            return c
+''')
 
-        def gen_ext_community_filter(name, match):
-            c = '''function {0}()
-{{
-'''.format(name)
-            c += '\n'.join('if ({0}, {1}, {2}) ~ bgp_ext_community then return false;'.format(*v.split(':')) for v in match['value'])
-            c += '''
-return true;
-}
-'''
-            return c
+        def write_aspath_filter(f, name, match):
+            write_function(f, name, match, lambda v: 'if (bgp_path ~ [= * {0} * =]) then return false;'.format(v))
 
+        def write_community_filter(f, name, match):
+            write_function(f, name, match, lambda v: 'if ({0}, {1}) ~ bgp_community then return false;'.format(*v.split(':')))
 
+        def write_ext_community_filter(f, name, match):
+            write_function(f, name, match,
+                           lambda v: 'if ({0}, {1}, {2}) ~ bgp_ext_community then return false;'.format(*v.split(':')))
 
         def gen_filter(name, match):
             c = ['function {0}()'.format(name), '{']
@@ -151,17 +153,17 @@ return true;
                     for i, match in enumerate(v['match']):
                         n = '{0}_match_{1}'.format(k, i)
                         if match['type'] == 'prefix':
-                            f.write(gen_prefix_filter(n, match))
+                            write_prefix_filter(f, n, match)
                         elif match['type'] == 'as-path':
-                            f.write(gen_aspath_filter(n, match))
+                            write_aspath_filter(f, n, match)
                         elif match['type'] == 'community':
-                            f.write(gen_community_filter(n, match))
+                            write_community_filter(f, n, match)
                         elif match['type'] == 'ext-community':
-                            f.write(gen_ext_community_filter(n, match))
+                            write_ext_community_filter(f, n, match)
                         match_info.append((match['type'], n))
                     f.write(gen_filter(k, match_info))
 
-            for n in sorted(list(flatten(t.get('neighbors', {}).values() for t in scenario_global_conf['testers'])) + [scenario_global_conf['monitor']], key=lambda n: n['as']):
+            for n in sorted(scenario_neighbors(scenario_global_conf), key=lambda n: (n['as'], n['local-address'])):
                 f.write(gen_neighbor_config(n))
             f.flush()
 
@@ -0,0 +1,150 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# BMP (RFC 7854) station recording when each prefix of each peer of the
+# target is reported, pre-policy (Adj-RIB-In) and post-policy.
+
+import socket
+import struct
+import time
+try:
+    from SocketServer import ThreadingTCPServer, BaseRequestHandler
+except ImportError:
+    from socketserver import ThreadingTCPServer, BaseRequestHandler
+from threading import Thread, Lock
+
+import bgp
+
+BMP_VERSION = 3
+BMP_COMMON_HEADER_LEN = 6
+BMP_PER_PEER_HEADER_LEN = 42
+
+BMP_MSG_ROUTE_MONITORING = 0
+BMP_MSG_STATISTICS_REPORT = 1
+BMP_MSG_PEER_DOWN_NOTIFICATION = 2
+BMP_MSG_PEER_UP_NOTIFICATION = 3
+BMP_MSG_INITIATION = 4
+BMP_MSG_TERMINATION = 5
+
+BMP_PEER_FLAG_IPV6 = 0x80
+BMP_PEER_FLAG_POST_POLICY = 0x40
+
+DEFAULT_PORT = 11019
+
+
+class PeerTable(object):
+    # arrival time of the prefixes reported for one peer. prefixes are kept
+    # in their packed wire format to keep the table small.
+
+    def __init__(self):
+        self.first = {}
+        self.withdrawn = 0
+        self.last_time = None
+
+    def add(self, packed, now):
+        if packed not in self.first:
+            self.first[packed] = now
+        self.last_time = now
+
+    def withdraw(self, packed, now):
+        self.withdrawn += 1
+        self.last_time = now
+
+    def summary(self):
+        times = self.first.values()
+        return {
+            'routes': len(times),
+            'withdrawn': self.withdrawn,
+            'first': min(times) if times else None,
+            'last': max(times) if times else None,
+        }
+
+
+class _Handler(BaseRequestHandler):
+
+    def handle(self):
+        collector = self.server.collector
+        sock = self.request
+        buf = b''
+        while True:
+            data = sock.recv(1 << 16)
+            if not data:
+                return
+            now = time.time()
+            buf += data
+            while len(buf) >= BMP_COMMON_HEADER_LEN:
+                version, length, msg_type = struct.unpack_from('!BIB', buf, 0)
+                if version != BMP_VERSION:
+                    return
+                if len(buf) < length:
+                    break
+                collector.handle_message(msg_type, buf[BMP_COMMON_HEADER_LEN:length], now)
+                buf = buf[length:]
+
+
+class BMPCollector(object):
+
+    def __init__(self, address='0.0.0.0', port=DEFAULT_PORT):
+        self.address = address
+        self.port = port
+        self.lock = Lock()
+        # (peer address, post-policy) -> PeerTable
+        self.tables = {}
+        self.server = None
+
+    def start(self):
+        ThreadingTCPServer.allow_reuse_address = True
+        ThreadingTCPServer.daemon_threads = True
+        self.server = ThreadingTCPServer((self.address, self.port), _Handler)
+        self.server.collector = self
+        t = Thread(target=self.server.serve_forever)
+        t.daemon = True
+        t.start()
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def handle_message(self, msg_type, body, now):
+        if msg_type != BMP_MSG_ROUTE_MONITORING or len(body) < BMP_PER_PEER_HEADER_LEN:
+            return
+        flags = struct.unpack_from('!B', body, 1)[0]
+        if flags & BMP_PEER_FLAG_IPV6:
+            peer = socket.inet_ntop(socket.AF_INET6, body[10:26])
+        else:
+            peer = socket.inet_ntoa(body[22:26])
+        post_policy = bool(flags & BMP_PEER_FLAG_POST_POLICY)
+
+        pdu = body[BMP_PER_PEER_HEADER_LEN:]
+        length, msg_type = bgp.parse_header(pdu)
+        if msg_type != bgp.BGP_MSG_UPDATE:
+            return
+        withdrawn, _, nlri = bgp.split_update(pdu[bgp.BGP_HEADER_LEN:length])
+
+        with self.lock:
+            key = (peer, post_policy)
+            table = self.tables.get(key)
+            if table is None:
+                table = self.tables[key] = PeerTable()
+            for p in bgp.split_prefixes(withdrawn):
+                table.withdraw(p, now)
+            for p in bgp.split_prefixes(nlri):
+                table.add(p, now)
+
+    def summary(self):
+        # [(peer, post-policy, summary dict)], sorted by peer
+        with self.lock:
+            return sorted((peer, post, table.summary()) for (peer, post), table in self.tables.items())
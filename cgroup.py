@@ -0,0 +1,134 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Reads the resource usage of a container directly from its cgroup files
+# (cgroup v2 unified hierarchy or cgroup v1), which is much cheaper than the
+# docker stats API and allows sub-second sampling.
+
+import os
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def _read_int(path):
+    return int(_read(path).strip())
+
+
+def _read_kv(path):
+    r = {}
+    for line in _read(path).split('\n'):
+        fields = line.split()
+        if len(fields) == 2:
+            r[fields[0]] = int(fields[1])
+    return r
+
+
+class CgroupSampler(object):
+
+    def __init__(self, ctn_id, pid=None):
+        self.ctn_id = ctn_id
+        self.v2 = os.path.exists(os.path.join(CGROUP_ROOT, 'cgroup.controllers'))
+        if self.v2:
+            self.dirs = {'': self._find_dir('', pid)}
+        else:
+            self.dirs = dict((c, self._find_dir(c, pid)) for c in ['cpuacct', 'memory'])
+            for c in ['blkio', 'pids']:
+                try:
+                    self.dirs[c] = self._find_dir(c, pid)
+                except IOError:
+                    self.dirs[c] = None
+
+    def _find_dir(self, controller, pid):
+        # controller is '' for cgroup v2
+        candidates = []
+        if pid:
+            for line in _read('/proc/{0}/cgroup'.format(pid)).split('\n'):
+                fields = line.split(':', 2)
+                if len(fields) != 3:
+                    continue
+                if (self.v2 and fields[0] == '0') or (not self.v2 and controller in fields[1].split(',')):
+                    candidates.append(fields[2].lstrip('/'))
+        candidates += ['system.slice/docker-{0}.scope'.format(self.ctn_id),
+                       'docker/{0}'.format(self.ctn_id)]
+        base = CGROUP_ROOT
+        if not self.v2:
+            for name in os.listdir(CGROUP_ROOT):
+                if controller in name.split(','):
+                    base = os.path.join(CGROUP_ROOT, name)
+                    break
+        for c in candidates:
+            d = os.path.join(base, c)
+            # the path in /proc/<pid>/cgroup is '/' when bgperf runs in its own cgroup namespace
+            if c and os.path.isdir(d):
+                return d
+        raise IOError('cgroup of container {0} not found'.format(self.ctn_id))
+
+    def sample(self):
+        # cpu in seconds, memory in bytes, io in bytes
+        if self.v2:
+            return self._sample_v2(self.dirs[''])
+        return self._sample_v1()
+
+    def _sample_v2(self, d):
+        cpu = _read_kv(os.path.join(d, 'cpu.stat'))
+        mem = _read_kv(os.path.join(d, 'memory.stat'))
+        io_read, io_write = 0, 0
+        if os.path.exists(os.path.join(d, 'io.stat')):
+            for line in _read(os.path.join(d, 'io.stat')).split('\n'):
+                for kv in line.split()[1:]:
+                    k, v = kv.split('=')
+                    if k == 'rbytes':
+                        io_read += int(v)
+                    elif k == 'wbytes':
+                        io_write += int(v)
+        pids = os.path.join(d, 'pids.current')
+        return {
+            'cpu_seconds': cpu['usage_usec'] / 1e6,
+            'mem': _read_int(os.path.join(d, 'memory.current')),
+            'rss': mem.get('anon', 0),
+            'cache': mem.get('file', 0),
+            'major_faults': mem.get('pgmajfault', 0),
+            'io_read': io_read,
+            'io_write': io_write,
+            'pids': _read_int(pids) if os.path.exists(pids) else 0,
+        }
+
+    def _sample_v1(self):
+        mem = _read_kv(os.path.join(self.dirs['memory'], 'memory.stat'))
+        io_read, io_write = 0, 0
+        blkio = os.path.join(self.dirs['blkio'] or '', 'blkio.throttle.io_service_bytes')
+        if self.dirs['blkio'] and os.path.exists(blkio):
+            for line in _read(blkio).split('\n'):
+                fields = line.split()
+                if len(fields) == 3 and fields[1] == 'Read':
+                    io_read += int(fields[2])
+                elif len(fields) == 3 and fields[1] == 'Write':
+                    io_write += int(fields[2])
+        pids = os.path.join(self.dirs['pids'] or '', 'pids.current')
+        return {
+            'cpu_seconds': _read_int(os.path.join(self.dirs['cpuacct'], 'cpuacct.usage')) / 1e9,
+            'mem': _read_int(os.path.join(self.dirs['memory'], 'memory.usage_in_bytes')),
+            'rss': mem.get('total_rss', mem.get('rss', 0)),
+            'cache': mem.get('total_cache', mem.get('cache', 0)),
+            'major_faults': mem.get('total_pgmajfault', mem.get('pgmajfault', 0)),
+            'io_read': io_read,
+            'io_write': io_write,
+            'pids': _read_int(pids) if self.dirs['pids'] and os.path.exists(pids) else 0,
+        }
@@ -0,0 +1,70 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Convergence of the churn of the speaker testers.
+#
+# speakerd logs the prefixes of every churn UPDATE it sends, one log per peer
+# in the send log format (latency.py). A prefix is pending from its last
+# update until the monitor sees an event for it afterwards, so that updates
+# the target coalesces into one export count once.
+
+import os
+
+import bgp
+from latency import parse_send_log, CHURN_LOG_SUFFIX
+
+
+class ChurnTracker(object):
+
+    def __init__(self, log_dirs, rib):
+        # rib: the RibWatch of the monitor
+        self.log_dirs = log_dirs
+        self.rib = rib
+        # path -> offset of the next record. only the churn from now on counts
+        self.logs = {}
+        self.scan(skip=True)
+        # prefix -> time of its last update not seen by the monitor yet
+        self.pending = {}
+        # number of updates logged
+        self.sent = 0
+
+    def scan(self, skip=False):
+        for d in self.log_dirs:
+            for name in os.listdir(d):
+                path = os.path.join(d, name)
+                if name.endswith(CHURN_LOG_SUFFIX) and path not in self.logs:
+                    self.logs[path] = os.path.getsize(path) if skip else 0
+
+    def poll(self):
+        # reads the updates logged since the last poll, returns the number of
+        # pending prefixes
+        self.scan()
+        for path, offset in self.logs.items():
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+            records, used = parse_send_log(data)
+            self.logs[path] = offset + used
+            self.sent += len(records)
+            for now, nlri in records:
+                for p in bgp.unpack_prefixes(nlri):
+                    if now > self.pending.get(p, 0):
+                        self.pending[p] = now
+        with self.rib.lock:
+            seen = self.rib.seen
+            converged = [p for p, sent in self.pending.items() if seen.get(p, 0) >= sent]
+        for p in converged:
+            del self.pending[p]
+        return len(self.pending)
@@ -0,0 +1,96 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Packed UPDATE encoder: prefixes sharing the same path attributes are put
+# together into UPDATE messages filled up to the maximum message size.
+#
+# Like bgp.py, this module is copied into tester containers and must stay
+# standard library only and Python 2/3 compatible.
+
+import bgp
+
+# fixed part of an UPDATE: header, withdrawn routes length, total path attribute length
+UPDATE_OVERHEAD = bgp.BGP_HEADER_LEN + 4
+
+
+class UpdateEncoder(object):
+
+    def __init__(self, max_size=bgp.BGP_MAX_MSG_LEN, max_pending=None):
+        # max_pending bounds the number of attribute sets waiting for more
+        # prefixes; every pending message is sent out when it is exceeded.
+        self.max_size = max_size
+        self.max_pending = max_pending
+        self.routes = 0
+        self.messages = 0
+        self.bytes = 0
+        self._pending = {}
+
+    def _message(self, attrs, nlri):
+        msg = bgp.update_message(attrs=attrs, nlri=nlri)
+        self.messages += 1
+        self.bytes += len(msg)
+        return msg
+
+    def add(self, prefix, attrs):
+        # queue prefix ('10.0.0.0/24') announced with attrs (packed path
+        # attributes). returns the list of messages that became full.
+        return self.add_packed(bgp.pack_prefix(prefix), attrs)
+
+    def add_packed(self, prefix, attrs):
+        # same as add() with an already packed prefix. both forms are str on
+        # Python 2, they can't be told apart by type.
+        room = self.max_size - UPDATE_OVERHEAD - len(attrs)
+        if room < len(prefix):
+            raise ValueError('path attributes too large for a {0} bytes message'.format(self.max_size))
+        self.routes += 1
+        pending = self._pending.get(attrs)
+        if pending is None:
+            msgs = []
+            if self.max_pending and len(self._pending) >= self.max_pending:
+                msgs = self.flush()
+            self._pending[attrs] = [len(prefix), [prefix]]
+            return msgs
+        if pending[0] + len(prefix) > room:
+            msg = self._message(attrs, pending[1])
+            self._pending[attrs] = [len(prefix), [prefix]]
+            return [msg]
+        pending[0] += len(prefix)
+        pending[1].append(prefix)
+        return []
+
+    def flush(self):
+        msgs = [self._message(attrs, pending[1]) for attrs, pending in self._pending.items()]
+        self._pending = {}
+        return msgs
+
+    def encode(self, routes, packed=False):
+        # routes: iterable of (prefix, attrs), the prefixes already packed
+        # with packed. yields UPDATE messages
+        add = self.add_packed if packed else self.add
+        for prefix, attrs in routes:
+            for msg in add(prefix, attrs):
+                yield msg
+        for msg in self.flush():
+            yield msg
+
+    def stats(self):
+        routes = float(max(self.routes, 1))
+        return {
+            'routes': self.routes,
+            'messages': self.messages,
+            'bytes': self.bytes,
+            'messages-per-route': self.messages / routes,
+            'bytes-per-route': self.bytes / routes,
+        }
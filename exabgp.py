@@ -18,42 +18,42 @@ from base import *
 class ExaBGP(Container):
 
     GUEST_DIR = '/root/config'
+    GIT_REPO = 'https://github.com/Exa-Networks/exabgp'
 
     def __init__(self, name, host_dir, conf, image='bgperf/exabgp'):
         super(ExaBGP, self).__init__('bgperf_exabgp_' + name, image, host_dir, self.GUEST_DIR, conf)
 
     @classmethod
     def build_image(cls, force=False, tag='bgperf/exabgp', checkout='HEAD', nocache=False):
+        checkout = cls.resolve_checkout(checkout)
         cls.dockerfile = '''
 FROM ubuntu:latest
 WORKDIR /root
 RUN apt-get update && apt-get install -qy git python python-setuptools gcc python-dev
 RUN easy_install pip
-RUN git clone https://github.com/Exa-Networks/exabgp && \
+RUN git clone {1} exabgp && \
 (cd exabgp && git checkout {0} && pip install six && pip install -r requirements.txt && python setup.py install)
 RUN ln -s /root/exabgp /exabgp
-'''.format(checkout)
-        super(ExaBGP, cls).build_image(force, tag, nocache)
+'''.format(checkout, cls.GIT_REPO)
+        super(ExaBGP, cls).build_image(force, tag, nocache, checkout)
 
 
 class ExaBGP_MRTParse(Container):
+    # bgperf/exabgp with mrtparse, checkout being the mrtparse commit
 
     GUEST_DIR = '/root/config'
+    GIT_REPO = 'https://github.com/t2mune/mrtparse.git'
 
     def __init__(self, name, host_dir, conf, image='bgperf/exabgp_mrtparse'):
         super(ExaBGP_MRTParse, self).__init__('bgperf_exabgp_mrtparse_' + name, image, host_dir, self.GUEST_DIR, conf)
 
     @classmethod
     def build_image(cls, force=False, tag='bgperf/exabgp_mrtparse', checkout='HEAD', nocache=False):
+        checkout = cls.resolve_checkout(checkout)
         cls.dockerfile = '''
-FROM ubuntu:latest
+FROM bgperf/exabgp
 WORKDIR /root
-RUN apt-get update && apt-get install -qy git python python-setuptools gcc python-dev
-RUN easy_install pip
-RUN git clone https://github.com/Exa-Networks/exabgp && \
-(cd exabgp && git checkout {0} && pip install six && pip install -r requirements.txt && python setup.py install)
-RUN ln -s /root/exabgp /exabgp
-RUN git clone https://github.com/t2mune/mrtparse.git && \
-(cd mrtparse && python setup.py install)
-'''.format(checkout)
-        super(ExaBGP_MRTParse, cls).build_image(force, tag, nocache)
+RUN git clone {1} mrtparse && \
+(cd mrtparse && git checkout {0} && python setup.py install)
+'''.format(checkout, cls.GIT_REPO)
+        super(ExaBGP_MRTParse, cls).build_image(force, tag, nocache, checkout)
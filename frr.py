@@ -14,16 +14,19 @@
 # limitations under the License.
 
 from base import *
+from policy import iter_values
 
 class FRRouting(Container):
     CONTAINER_NAME = None
     GUEST_DIR = '/root/config'
+    GIT_REPO = 'https://github.com/FRRouting/frr.git'
 
     def __init__(self, host_dir, conf, image='bgperf/frr'):
         super(FRRouting, self).__init__(self.CONTAINER_NAME, image, host_dir, self.GUEST_DIR, conf)
 
     @classmethod
     def build_image(cls, force=False, tag='bgperf/frr', checkout='HEAD', nocache=False):
+        checkout = cls.resolve_checkout(checkout)
         cls.dockerfile = '''
 FROM ubuntu:16.04
 WORKDIR /root
@@ -38,8 +41,10 @@ RUN apt-get update && apt-get install -y \
     git autoconf automake libtool make gawk libreadline-dev \
     texinfo dejagnu pkg-config libpam0g-dev libjson-c-dev bison flex \
     python-pytest libc-ares-dev python3-dev libsystemd-dev
+# perf, for --profile
+RUN apt-get install -y linux-tools-generic
 
-RUN git clone https://github.com/FRRouting/frr.git frr
+RUN git clone {1} frr
 # build, including examples and documentation to disable '--disable-doc'
 RUN cd frr && git checkout {0} && ./bootstrap.sh && \
 ./configure \
@@ -59,14 +64,19 @@ RUN cd frr && git checkout {0} && ./bootstrap.sh && \
     --with-pkg-git-version \
     --with-pkg-extra-version=-bgperf_frr
 RUN cd frr && make -j2 && make check && make install
-'''.format(checkout)
-        super(FRRouting, cls).build_image(force, tag, nocache)
+'''.format(checkout, cls.GIT_REPO)
+        super(FRRouting, cls).build_image(force, tag, nocache, checkout)
 
 
 class FRRoutingTarget(FRRouting, Target):
 
     CONTAINER_NAME = 'bgperf_frrouting_target'
     CONFIG_FILE_NAME = 'bgpd.conf'
+    PROFILE_PROCESS = 'bgpd'
+    RIB_COUNT_CMD = "vtysh -c 'show ip bgp summary'"
+    RIB_COUNT_PATTERN = r'RIB entries (\d+)'
+
+    bmp = None
 
     def write_config(self, scenario_global_conf):
 
@@ -86,13 +96,26 @@ neighbor {0} timers 30 90
             if 'filter' in n:
                 for p in (n['filter']['in'] if 'in' in n['filter'] else []):
                     c += 'neighbor {0} route-map {1} export\n'.format(local_addr, p)
+                # route-server-client: 'import' applies to the routes exported to the client
+                for p in (n['filter']['out'] if 'out' in n['filter'] else []):
+                    c += 'neighbor {0} route-map {1} import\n'.format(local_addr, p)
             return c
 
         with open('{0}/{1}'.format(self.host_dir, self.CONFIG_FILE_NAME), 'w') as f:
             f.write(config)
-            for n in list(flatten(t.get('neighbors', {}).values() for t in scenario_global_conf['testers'])) + [scenario_global_conf['monitor']]:
+            for n in scenario_neighbors(scenario_global_conf):
                 f.write(gen_neighbor_config(n))
 
+            # BMP requires FRR 7.2 or later (bgpd -M bmp)
+            self.bmp = scenario_global_conf.get('bmp')
+            if self.bmp:
+                f.write('''bmp targets bgperf
+ bmp connect {0} port {1} min-retry 100 max-retry 1000
+ bmp monitor ipv4 unicast pre-policy
+ bmp monitor ipv4 unicast post-policy
+exit
+'''.format(self.bmp['address'], self.bmp['port']))
+
             if 'policy' in scenario_global_conf:
                 seq = 10
                 for k, v in scenario_global_conf['policy'].iteritems():
@@ -100,16 +123,20 @@ neighbor {0} timers 30 90
                     for i, match in enumerate(v['match']):
                         n = '{0}_match_{1}'.format(k, i)
                         if match['type'] == 'prefix':
-                            f.write(''.join('ip prefix-list {0} deny {1}\n'.format(n, p) for p in match['value']))
+                            for p in iter_values(match):
+                                f.write('ip prefix-list {0} deny {1}\n'.format(n, p))
                             f.write('ip prefix-list {0} permit any\n'.format(n))
                         elif match['type'] == 'as-path':
-                            f.write(''.join('ip as-path access-list {0} deny _{1}_\n'.format(n, p) for p in match['value']))
+                            for p in iter_values(match):
+                                f.write('ip as-path access-list {0} deny _{1}_\n'.format(n, p))
                             f.write('ip as-path access-list {0} permit .*\n'.format(n))
                         elif match['type'] == 'community':
-                            f.write(''.join('ip community-list standard {0} permit {1}\n'.format(n, p) for p in match['value']))
+                            for p in iter_values(match):
+                                f.write('ip community-list standard {0} permit {1}\n'.format(n, p))
                             f.write('ip community-list standard {0} permit\n'.format(n))
                         elif match['type'] == 'ext-community':
-                            f.write(''.join('ip extcommunity-list standard {0} permit {1} {2}\n'.format(n, *p.split(':', 1)) for p in match['value']))
+                            for p in iter_values(match):
+                                f.write('ip extcommunity-list standard {0} permit {1} {2}\n'.format(n, *p.split(':', 1)))
                             f.write('ip extcommunity-list standard {0} permit\n'.format(n))
 
                         match_info.append((match['type'], n))
@@ -133,7 +160,8 @@ neighbor {0} timers 30 90
              'ulimit -n 65536',
              'mkdir /etc/frr',
              'cp {guest_dir}/{config_file_name} /etc/frr/{config_file_name} && chown frr:frr /etc/frr/{config_file_name}',
-             '/usr/lib/frr/bgpd -u frr -f /etc/frr/{config_file_name}']
+             '/usr/lib/frr/bgpd -u frr -f /etc/frr/{config_file_name}{modules}']
         ).format(
             guest_dir=self.guest_dir,
-            config_file_name=self.CONFIG_FILE_NAME)
+            config_file_name=self.CONFIG_FILE_NAME,
+            modules=' -M bmp' if self.bmp else '')
@@ -14,17 +14,22 @@
 # limitations under the License.
 
 from base import *
+from policy import iter_values
+import json
+import urllib2
 
 class GoBGP(Container):
 
     CONTAINER_NAME = None
     GUEST_DIR = '/root/config'
+    GIT_REPO = 'https://github.com/osrg/gobgp'
 
     def __init__(self, host_dir, conf, image='bgperf/gobgp'):
         super(GoBGP, self).__init__(self.CONTAINER_NAME, image, host_dir, self.GUEST_DIR, conf)
 
     @classmethod
     def build_image(cls, force=False, tag='bgperf/gobgp', checkout='HEAD', nocache=False):
+        checkout = cls.resolve_checkout(checkout)
         cls.dockerfile = '''
 FROM golang:1.6
 WORKDIR /root
@@ -34,13 +39,17 @@ RUN cd $GOPATH/src/github.com/osrg/gobgp && git checkout {0}
 RUN go install github.com/osrg/gobgp/gobgpd
 RUN go install github.com/osrg/gobgp/gobgp
 '''.format(checkout)
-        super(GoBGP, cls).build_image(force, tag, nocache)
+        super(GoBGP, cls).build_image(force, tag, nocache, checkout)
 
 
 class GoBGPTarget(GoBGP, Target):
 
     CONTAINER_NAME = 'bgperf_gobgp_target'
     CONFIG_FILE_NAME = 'gobgpd.conf'
+    PPROF_PORT = 6060
+    PROFILE_SUFFIX = '.pprof'
+    RIB_COUNT_CMD = 'gobgp global rib -a ipv4 summary'
+    RIB_COUNT_PATTERN = r'Destination: (\d+)'
 
     def write_config(self, scenario_global_conf):
 
@@ -51,45 +60,25 @@ class GoBGPTarget(GoBGP, Target):
                 'router-id': self.conf['router-id']
             },
         }
+        # the defined sets are streamed into the file after the rest of the
+        # config, their values can be too many to hold: (name, match) by type
+        defined_sets = {'prefix': [], 'as-path': [], 'community': [], 'ext-community': []}
         if 'policy' in scenario_global_conf:
             config['policy-definitions'] = []
-            config['defined-sets'] = {
-                    'prefix-sets': [],
-                    'bgp-defined-sets': {
-                        'as-path-sets': [],
-                        'community-sets': [],
-                        'ext-community-sets': [],
-                    },
-            }
             for k, v in scenario_global_conf['policy'].iteritems():
                 conditions = {
                     'bgp-conditions': {},
                 }
                 for i, match in enumerate(v['match']):
                     n = '{0}_match_{1}'.format(k, i)
+                    defined_sets[match['type']].append((n, match))
                     if match['type'] == 'prefix':
-                        config['defined-sets']['prefix-sets'].append({
-                            'prefix-set-name': n,
-                            'prefix-list': [{'ip-prefix': p} for p in match['value']]
-                        })
                         conditions['match-prefix-set'] = {'prefix-set': n}
                     elif match['type'] == 'as-path':
-                        config['defined-sets']['bgp-defined-sets']['as-path-sets'].append({
-                            'as-path-set-name': n,
-                            'as-path-list': match['value'],
-                        })
                         conditions['bgp-conditions']['match-as-path-set'] = {'as-path-set': n}
                     elif match['type'] == 'community':
-                        config['defined-sets']['bgp-defined-sets']['community-sets'].append({
-                            'community-set-name': n,
-                            'community-list': match['value'],
-                        })
                         conditions['bgp-conditions']['match-community-set'] = {'community-set': n}
                     elif match['type'] == 'ext-community':
-                        config['defined-sets']['bgp-defined-sets']['ext-community-sets'].append({
-                            'ext-community-set-name': n,
-                            'ext-community-list': match['value'],
-                        })
                         conditions['bgp-conditions']['match-ext-community-set'] = {'ext-community-set': n}
 
                 config['policy-definitions'].append({
@@ -97,6 +86,23 @@ class GoBGPTarget(GoBGP, Target):
                     'statements': [{'name': k, 'conditions': conditions, 'actions': {'route-disposition': {'accept-route': True}}}],
                 })
 
+        def write_sets(f, indent, key, sets, name_key, list_key, fmt):
+            # YAML block sequence written one value at a time, scalars
+            # being JSON encoded (a subset of YAML)
+            if not sets:
+                f.write('{0}{1}: []\n'.format(indent, key))
+                return
+            f.write('{0}{1}:\n'.format(indent, key))
+            for name, match in sets:
+                f.write('{0}- {1}: {2}\n'.format(indent, name_key, json.dumps(name)))
+                values = iter_values(match)
+                first = next(values, None)
+                if first is None:
+                    f.write('{0}  {1}: []\n'.format(indent, list_key))
+                    continue
+                f.write('{0}  {1}:\n'.format(indent, list_key))
+                for value in chain([first], values):
+                    f.write('{0}  - {1}\n'.format(indent, fmt(value)))
 
         def gen_neighbor_config(n):
             c = {'config': {'neighbor-address': n['local-address'], 'peer-as': n['as']},
@@ -113,16 +119,47 @@ class GoBGPTarget(GoBGP, Target):
                 c['apply-policy'] = {'config': a}
             return c
 
-        config['neighbors'] = [gen_neighbor_config(n) for n in list(flatten(t.get('neighbors', {}).values() for t in scenario_global_conf['testers'])) + [scenario_global_conf['monitor']]]
+        config['neighbors'] = [gen_neighbor_config(n) for n in scenario_neighbors(scenario_global_conf)]
+
+        if 'bmp' in scenario_global_conf:
+            config['bmp-servers'] = [{'config': {
+                'address': scenario_global_conf['bmp']['address'],
+                'port': scenario_global_conf['bmp']['port'],
+                'route-monitoring-policy': 'both',
+            }}]
+
         with open('{0}/{1}'.format(self.host_dir, self.CONFIG_FILE_NAME), 'w') as f:
             f.write(yaml.dump(config, default_flow_style=False))
+            if 'policy' in scenario_global_conf:
+                f.write('defined-sets:\n')
+                write_sets(f, '  ', 'prefix-sets', defined_sets['prefix'], 'prefix-set-name', 'prefix-list',
+                           lambda v: 'ip-prefix: {0}'.format(json.dumps(v)))
+                f.write('  bgp-defined-sets:\n')
+                write_sets(f, '    ', 'as-path-sets', defined_sets['as-path'], 'as-path-set-name', 'as-path-list', json.dumps)
+                write_sets(f, '    ', 'community-sets', defined_sets['community'], 'community-set-name', 'community-list', json.dumps)
+                write_sets(f, '    ', 'ext-community-sets', defined_sets['ext-community'], 'ext-community-set-name',
+                           'ext-community-list', json.dumps)
 
     def get_startup_cmd(self):
         return '\n'.join(
             ['#!/bin/bash',
              'ulimit -n 65536',
-             'gobgpd -t yaml -f {guest_dir}/{config_file_name} -l {debug_level} > {guest_dir}/gobgpd.log 2>&1']
+             'gobgpd -t yaml -f {guest_dir}/{config_file_name} -l {debug_level}{pprof} > {guest_dir}/gobgpd.log 2>&1']
         ).format(
             guest_dir=self.guest_dir,
             config_file_name=self.CONFIG_FILE_NAME,
-            debug_level='info')
+            debug_level='info',
+            # pprof is only served on localhost by default
+            pprof=' --pprof-host 0.0.0.0:{0}'.format(self.PPROF_PORT) if self.conf.get('profile') else '')
+
+    def pprof(self, path, endpoint, timeout):
+        url = 'http://{0}:{1}/debug/pprof/{2}'.format(self.conf['local-address'], self.PPROF_PORT, endpoint)
+        data = urllib2.urlopen(url, timeout=timeout).read()
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def profile_cpu(self, path, seconds):
+        self.pprof(path, 'profile?seconds={0}'.format(int(max(seconds, 1))), seconds + 30)
+
+    def profile_heap(self, path):
+        self.pprof(path, 'heap', 30)
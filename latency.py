@@ -0,0 +1,193 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Per-prefix propagation latency: testers log when they send each prefix,
+# the receiving side records when it arrives, both are joined by prefix into
+# fixed-size histograms.
+#
+# This module is copied into tester containers: standard library only,
+# Python 2/3 compatible.
+
+import heapq
+import math
+import os
+import struct
+from array import array
+
+import bgp
+
+# send log: one record per UPDATE, the send time and the packed NLRI
+SEND_LOG_SUFFIX = '.sent'
+# churn log: the same records, for the churn UPDATEs (see churn.py)
+CHURN_LOG_SUFFIX = '.churn'
+_SEND_LOG_RECORD = struct.Struct('!dH')
+
+
+class SendLog(object):
+
+    def __init__(self, path):
+        # a log left by a previous run in the same directory is overwritten
+        self.f = open(path, 'wb')
+
+    def truncate(self):
+        # before the routes are announced again (--iterations)
+        self.f.seek(0)
+        self.f.truncate()
+
+    def write(self, now, nlri):
+        self.f.write(_SEND_LOG_RECORD.pack(now, len(nlri)) + nlri)
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+def parse_send_log(data):
+    # returns ([(send time, packed NLRI)], length of the complete records at
+    # the start of data)
+    records = []
+    i = 0
+    while i + _SEND_LOG_RECORD.size <= len(data):
+        now, length = _SEND_LOG_RECORD.unpack_from(data, i)
+        end = i + _SEND_LOG_RECORD.size + length
+        if end > len(data):
+            break
+        records.append((now, data[i + _SEND_LOG_RECORD.size:end]))
+        i = end
+    return records, i
+
+
+def read_send_log(path, chunk=1 << 12):
+    # yields (send time, prefix). the file is only open while a chunk of it
+    # is read, so that the logs of thousands of peers can be read in step.
+    offset = 0
+    while True:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(chunk)
+        records, used = parse_send_log(data)
+        for now, nlri in records:
+            for p in bgp.unpack_prefixes(nlri):
+                yield now, p
+        if used == 0:
+            if len(data) < chunk:
+                # the end of the log, or a record being written
+                return
+            # a record larger than the chunk
+            chunk *= 2
+        offset += used
+
+
+class Histogram(object):
+    # log-scale histogram: buckets grow by 'precision' (1% by default) from
+    # min_value to max_value seconds, so its size doesn't depend on the
+    # number of recorded values.
+
+    def __init__(self, min_value=1e-5, max_value=3600.0, precision=0.01):
+        self.min_value = min_value
+        self.max_value = max_value
+        self.base = math.log(1 + precision)
+        self.counts = array('L', [0] * (self._index(max_value) + 1))
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def _index(self, v):
+        if v <= self.min_value:
+            return 0
+        return int(math.log(v / self.min_value) / self.base) + 1
+
+    def _value(self, idx):
+        # upper bound of the bucket
+        return self.min_value * math.exp(self.base * idx)
+
+    def record(self, v):
+        v = max(v, 0.0)
+        self.counts[min(self._index(v), len(self.counts) - 1)] += 1
+        self.count += 1
+        self.total += v
+        self.min = v if self.min is None else min(self.min, v)
+        self.max = v if self.max is None else max(self.max, v)
+
+    def merge(self, other):
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.count += other.count
+        self.total += other.total
+        for v in (other.min, other.max):
+            if v is not None:
+                self.min = v if self.min is None else min(self.min, v)
+                self.max = v if self.max is None else max(self.max, v)
+
+    def percentile(self, q):
+        if self.count == 0:
+            return None
+        rank = int(math.ceil(q / 100.0 * self.count))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return min(self._value(i), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
+
+
+def _peer_log(path, peer):
+    for sent, prefix in read_send_log(path):
+        yield sent, peer, prefix
+
+
+def collect(send_log_dirs, arrivals):
+    # joins the send logs found in send_log_dirs with arrivals
+    # (prefix -> arrival time). returns (overall histogram, {peer: histogram},
+    # number of sent prefixes which never arrived). a prefix sent more than
+    # once, by several peers (--overlap) or again after a session reset,
+    # counts once, from its first announcement, for the peer which made it.
+    # the logs are merged in send time order and the arrival of a prefix is
+    # cleared once counted, so that only the prefixes which never arrived
+    # are held: arrivals is used up.
+    logs = []
+    peers = {}
+    for d in send_log_dirs:
+        for name in sorted(os.listdir(d)):
+            if not name.endswith(SEND_LOG_SUFFIX):
+                continue
+            peer = name[:-len(SEND_LOG_SUFFIX)]
+            peers[peer] = Histogram()
+            logs.append(_peer_log(os.path.join(d, name), peer))
+    missing = set()
+    for sent, peer, prefix in heapq.merge(*logs):
+        arrived = arrivals.get(prefix, False)
+        if arrived is False:
+            missing.add(prefix)
+        elif arrived is not None:
+            peers[peer].record(arrived - sent)
+            arrivals[prefix] = None
+    overall = Histogram()
+    for h in peers.values():
+        overall.merge(h)
+    return overall, peers, len(missing)
@@ -19,7 +19,9 @@ from  settings import dckr
 import yaml
 import json
 from threading import Thread
+from Queue import Empty
 import time
+from ribwatch import RibWatch
 
 class Monitor(GoBGP):
 
@@ -55,26 +57,66 @@ gobgpd -t yaml -f {1}/{2} -l {3} > {1}/gobgpd.log 2>&1
         return ctn
 
     def wait_established(self, neighbor):
+        begin = time.time()
         while True:
             neigh = json.loads(self.local('gobgp neighbor {0} -j'.format(neighbor)))
             if neigh['state']['session-state'] == 'established':
-                return
+                break
             time.sleep(1)
+        self.timeline.complete('establish', self.name, begin)
+        self.watch()
+
+    def watch(self):
+        # follows the RIB event stream of gobgpd from the time the session
+        # with the target is established
+        self.rib = RibWatch(self.config['monitor'].get('check-points', []))
+        self.watching = True
+
+        def watch():
+            try:
+                for chunk in self.local('gobgp monitor global rib -j', stream=True):
+                    self.rib.feed(chunk, time.time())
+            finally:
+                self.watching = False
+
+        t = Thread(target=watch)
+        t.daemon = True
+        t.start()
+
+    def rearm(self):
+        self.rib.rearm(self.config['monitor'].get('check-points', []))
+
+    def accepted(self):
+        if self.watching:
+            with self.rib.lock:
+                return len(self.rib.routes)
+        # the event stream isn't available, fall back to polling
+        info = json.loads(self.local('gobgp neighbor -j'))[0]
+        return int(info['state'].get('adj-table', {}).get('accepted', 0))
+
+    def stats(self, queue, interval=0.1):
+        def info(now, accepted, checked):
+            return {'who': self.name, 'time': now, 'checked': checked,
+                    'state': {'adj-table': {'accepted': accepted}}}
 
-    def stats(self, queue):
         def stats():
-            cps = self.config['monitor']['check-points'] if 'check-points' in self.config['monitor'] else []
-            while True:
-                info = json.loads(self.local('gobgp neighbor -j'))[0]
-                info['who'] = self.name
-                state = info['state']
-                if 'adj-table' in state and 'accepted' in state['adj-table'] and len(cps) > 0 and int(cps[0]) == int(state['adj-table']['accepted']):
-                    cps.pop(0)
-                    info['checked'] = True
-                else:
-                    info['checked'] = False
-                queue.put(info)
-                time.sleep(1)
+            while not self.stats_stopped.is_set():
+                try:
+                    now, accepted = self.rib.crossings.get(timeout=interval)
+                    queue.put(info(now, accepted, True))
+                    continue
+                except Empty:
+                    pass
+                accepted = self.accepted()
+                checked = False
+                with self.rib.lock:
+                    cps = self.rib.cps
+                    if not self.watching and len(cps) > 0 and int(cps[0]) == accepted:
+                        cps.pop(0)
+                        checked = True
+                queue.put(info(time.time(), accepted, checked))
+                if not self.watching:
+                    time.sleep(1)
 
         t = Thread(target=stats)
         t.daemon = True
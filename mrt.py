@@ -0,0 +1,364 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Streaming MRT (RFC 6396) reader for TABLE_DUMP_V2 and BGP4MP files.
+#
+# The file is read through mmap. The offsets of its records are saved once
+# in a sidecar index file, so that skipping or counting records doesn't
+# require to parse the file again.
+
+import bz2
+import gzip
+import hashlib
+import mmap
+import os
+import shutil
+import socket
+import struct
+from array import array
+
+try:
+    range = xrange
+except NameError:
+    pass
+
+MRT_HEADER_LEN = 12
+
+MRT_TYPE_TABLE_DUMP_V2 = 13
+MRT_TYPE_BGP4MP = 16
+MRT_TYPE_BGP4MP_ET = 17
+
+TABLE_DUMP_V2_PEER_INDEX_TABLE = 1
+TABLE_DUMP_V2_RIB_IPV4_UNICAST = 2
+TABLE_DUMP_V2_RIB_IPV4_MULTICAST = 3
+TABLE_DUMP_V2_RIB_IPV6_UNICAST = 4
+TABLE_DUMP_V2_RIB_IPV6_MULTICAST = 5
+
+BGP4MP_STATE_CHANGE = 0
+BGP4MP_MESSAGE = 1
+BGP4MP_MESSAGE_AS4 = 4
+BGP4MP_STATE_CHANGE_AS4 = 5
+BGP4MP_MESSAGE_LOCAL = 6
+BGP4MP_MESSAGE_AS4_LOCAL = 7
+
+INDEX_MAGIC = b'BGPERFMRTIDX'
+INDEX_VERSION = 1
+# magic, version, source size, source mtime, peer index table offset, record count
+_INDEX_HEADER = struct.Struct('!12sIQdqQ')
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'bgperf', 'mrt')
+
+
+def _offsets():
+    a = array('L')
+    if a.itemsize != 8:
+        a = array('Q')
+    return a
+
+
+def _sidecar_path(path, suffix):
+    # next to the MRT file when possible, in CACHE_DIR otherwise
+    candidate = path + suffix
+    if os.access(os.path.dirname(os.path.abspath(path)), os.W_OK):
+        return candidate
+    if not os.path.exists(CACHE_DIR):
+        os.makedirs(CACHE_DIR)
+    st = os.stat(path)
+    return os.path.join(CACHE_DIR, '{0}.{1}.{2}{3}'.format(
+        os.path.basename(path), st.st_size, int(st.st_mtime), suffix))
+
+
+def _decompressed(path):
+    # mmap needs the raw file. compressed dumps are inflated once.
+    if path.endswith('.gz'):
+        opener = gzip.open
+    elif path.endswith('.bz2'):
+        opener = bz2.BZ2File
+    else:
+        return path
+    raw = _sidecar_path(path, '.raw')
+    if not os.path.exists(raw) or os.path.getmtime(raw) < os.path.getmtime(path):
+        tmp = raw + '.tmp'
+        src = opener(path, 'rb')
+        try:
+            with open(tmp, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+        finally:
+            src.close()
+        os.rename(tmp, raw)
+    return raw
+
+
+def _ip(afi_ipv6, data):
+    if afi_ipv6:
+        return socket.inet_ntop(socket.AF_INET6, data)
+    return socket.inet_ntoa(data)
+
+
+class MRTRecord(object):
+
+    def __init__(self, timestamp, type, subtype, data, offset):
+        self.timestamp = timestamp
+        self.type = type
+        self.subtype = subtype
+        self.data = data
+        self.offset = offset
+
+    def is_rib(self):
+        return self.type == MRT_TYPE_TABLE_DUMP_V2 and \
+            self.subtype in (TABLE_DUMP_V2_RIB_IPV4_UNICAST, TABLE_DUMP_V2_RIB_IPV4_MULTICAST,
+                             TABLE_DUMP_V2_RIB_IPV6_UNICAST, TABLE_DUMP_V2_RIB_IPV6_MULTICAST)
+
+    def is_bgp4mp_message(self):
+        return self.type in (MRT_TYPE_BGP4MP, MRT_TYPE_BGP4MP_ET) and \
+            self.subtype in (BGP4MP_MESSAGE, BGP4MP_MESSAGE_AS4,
+                             BGP4MP_MESSAGE_LOCAL, BGP4MP_MESSAGE_AS4_LOCAL)
+
+    def parse_rib(self):
+        # returns (sequence, prefix, [(peer index, originated time, raw path attributes)])
+        d = self.data
+        seq, plen = struct.unpack_from('!IB', d, 0)
+        ipv6 = self.subtype in (TABLE_DUMP_V2_RIB_IPV6_UNICAST, TABLE_DUMP_V2_RIB_IPV6_MULTICAST)
+        n = (plen + 7) // 8
+        addr = d[5:5 + n] + b'\x00' * ((16 if ipv6 else 4) - n)
+        prefix = '{0}/{1}'.format(_ip(ipv6, addr), plen)
+        i = 5 + n
+        count = struct.unpack_from('!H', d, i)[0]
+        i += 2
+        entries = []
+        for _ in range(count):
+            peer, originated, alen = struct.unpack_from('!HIH', d, i)
+            i += 8
+            entries.append((peer, originated, d[i:i + alen]))
+            i += alen
+        return seq, prefix, entries
+
+    def parse_bgp4mp(self):
+        # returns a dict describing the peer; 'message' holds the raw BGP
+        # message of MESSAGE records, 'state' the (old, new) state of STATE_CHANGE records
+        d = self.data
+        i = 0
+        if self.type == MRT_TYPE_BGP4MP_ET:
+            i = 4
+        as4 = self.subtype in (BGP4MP_MESSAGE_AS4, BGP4MP_STATE_CHANGE_AS4, BGP4MP_MESSAGE_AS4_LOCAL)
+        if as4:
+            peer_as, local_as = struct.unpack_from('!II', d, i)
+            i += 8
+        else:
+            peer_as, local_as = struct.unpack_from('!HH', d, i)
+            i += 4
+        ifindex, afi = struct.unpack_from('!HH', d, i)
+        i += 4
+        alen = 16 if afi == 2 else 4
+        r = {
+            'peer-as': peer_as,
+            'local-as': local_as,
+            'ifindex': ifindex,
+            'peer-address': _ip(afi == 2, d[i:i + alen]),
+            'local-address': _ip(afi == 2, d[i + alen:i + 2 * alen]),
+        }
+        i += 2 * alen
+        if self.subtype in (BGP4MP_STATE_CHANGE, BGP4MP_STATE_CHANGE_AS4):
+            r['state'] = struct.unpack_from('!HH', d, i)
+        else:
+            r['message'] = d[i:]
+        return r
+
+
+class MRTReader(object):
+
+    def __init__(self, path, use_index=True):
+        self.path = _decompressed(os.path.expanduser(path))
+        self._file = open(self.path, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size > 0 else b''
+        self.peer_index_offset = -1
+        self.offsets = None
+        if use_index:
+            self.index_path = _sidecar_path(self.path, '.idx')
+            if not self._load_index():
+                self._build_index()
+                self._save_index()
+
+    def close(self):
+        if self.size > 0:
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def digest(self):
+        # sha1 of the file content, cached in a sidecar file
+        path = _sidecar_path(self.path, '.sha1')
+        key = '{0} {1!r}'.format(self.size, os.path.getmtime(self.path))
+        if os.path.exists(path):
+            with open(path) as f:
+                cached = f.read().split()
+            if len(cached) == 3 and ' '.join(cached[:2]) == key:
+                return cached[2]
+        h = hashlib.sha1()
+        chunk = 1 << 24
+        for i in range(0, self.size, chunk):
+            h.update(self._map[i:i + chunk])
+        with open(path, 'w') as f:
+            f.write('{0} {1}\n'.format(key, h.hexdigest()))
+        return h.hexdigest()
+
+    def _scan(self, offset=0):
+        # yields (offset, type, subtype, length) of every record
+        m = self._map
+        while offset + MRT_HEADER_LEN <= self.size:
+            _, t, s, length = struct.unpack_from('!IHHI', m, offset)
+            yield offset, t, s, length
+            offset += MRT_HEADER_LEN + length
+
+    def _build_index(self):
+        offsets = _offsets()
+        for offset, t, s, _ in self._scan():
+            if t == MRT_TYPE_TABLE_DUMP_V2 and s == TABLE_DUMP_V2_PEER_INDEX_TABLE:
+                self.peer_index_offset = offset
+                continue
+            offsets.append(offset)
+        self.offsets = offsets
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return False
+        with open(self.index_path, 'rb') as f:
+            header = f.read(_INDEX_HEADER.size)
+            if len(header) != _INDEX_HEADER.size:
+                return False
+            magic, ver, size, mtime, peer_index, count = _INDEX_HEADER.unpack(header)
+            if magic != INDEX_MAGIC or ver != INDEX_VERSION or size != self.size or \
+               mtime != os.path.getmtime(self.path):
+                return False
+            offsets = _offsets()
+            try:
+                offsets.fromfile(f, count)
+            except EOFError:
+                return False
+        if struct.pack('=H', 1) != struct.pack('!H', 1):
+            offsets.byteswap()
+        self.peer_index_offset = peer_index
+        self.offsets = offsets
+        return True
+
+    def _save_index(self):
+        offsets = self.offsets
+        if struct.pack('=H', 1) != struct.pack('!H', 1):
+            offsets = _offsets()
+            offsets.extend(self.offsets)
+            offsets.byteswap()
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(_INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, self.size,
+                                       os.path.getmtime(self.path),
+                                       self.peer_index_offset, len(offsets)))
+            offsets.tofile(f)
+        os.rename(tmp, self.index_path)
+
+    def _record(self, offset):
+        ts, t, s, length = struct.unpack_from('!IHHI', self._map, offset)
+        start = offset + MRT_HEADER_LEN
+        return MRTRecord(ts, t, s, self._map[start:start + length], offset)
+
+    def count(self):
+        # number of records, the PEER_INDEX_TABLE excluded
+        if self.offsets is not None:
+            return len(self.offsets)
+        return sum(1 for _ in self.records())
+
+    def __len__(self):
+        return self.count()
+
+    def peer_index(self):
+        # returns the list of peers of the PEER_INDEX_TABLE as dicts
+        if self.offsets is None and self.peer_index_offset < 0:
+            for offset, t, s, _ in self._scan():
+                if t == MRT_TYPE_TABLE_DUMP_V2 and s == TABLE_DUMP_V2_PEER_INDEX_TABLE:
+                    self.peer_index_offset = offset
+                    break
+        if self.peer_index_offset < 0:
+            return []
+        d = self._record(self.peer_index_offset).data
+        i = 4
+        vlen = struct.unpack_from('!H', d, i)[0]
+        i += 2 + vlen
+        count = struct.unpack_from('!H', d, i)[0]
+        i += 2
+        peers = []
+        for _ in range(count):
+            peer_type = struct.unpack_from('!B', d, i)[0]
+            bgp_id = socket.inet_ntoa(d[i + 1:i + 5])
+            i += 5
+            ipv6 = peer_type & 0x01
+            alen = 16 if ipv6 else 4
+            address = _ip(ipv6, d[i:i + alen])
+            i += alen
+            if peer_type & 0x02:
+                peer_as = struct.unpack_from('!I', d, i)[0]
+                i += 4
+            else:
+                peer_as = struct.unpack_from('!H', d, i)[0]
+                i += 2
+            peers.append({'bgp-id': bgp_id, 'address': address, 'as': peer_as})
+        return peers
+
+    def peer_index_record(self):
+        if self.peer_index_offset < 0:
+            return None
+        return self._record(self.peer_index_offset)
+
+    def records(self, skip=0, count=None):
+        # yields MRTRecords, the PEER_INDEX_TABLE excluded
+        if self.offsets is not None:
+            end = len(self.offsets) if count is None else min(skip + count, len(self.offsets))
+            for i in range(skip, end):
+                yield self._record(self.offsets[i])
+            return
+        n = 0
+        for offset, t, s, _ in self._scan():
+            if t == MRT_TYPE_TABLE_DUMP_V2 and s == TABLE_DUMP_V2_PEER_INDEX_TABLE:
+                continue
+            n += 1
+            if n <= skip:
+                continue
+            if count is not None and n > skip + count:
+                return
+            yield self._record(offset)
+
+    def write_slice(self, path, skip=0, count=None):
+        # writes the PEER_INDEX_TABLE followed by the selected records
+        with open(path, 'wb') as f:
+            pi = self.peer_index_record()
+            if pi:
+                f.write(self._map[pi.offset:pi.offset + MRT_HEADER_LEN + len(pi.data)])
+            if self.offsets is not None:
+                end = len(self.offsets) if count is None else min(skip + count, len(self.offsets))
+                if skip >= end:
+                    return
+                first = self.offsets[skip]
+                last = self.offsets[end - 1]
+                if not first < self.peer_index_offset < last:
+                    # records are contiguous in the file, copy them at once
+                    length = struct.unpack_from('!I', self._map, last + 8)[0]
+                    f.write(self._map[first:last + MRT_HEADER_LEN + length])
+                    return
+            for r in self.records(skip, count):
+                f.write(self._map[r.offset:r.offset + MRT_HEADER_LEN + len(r.data)])
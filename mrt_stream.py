@@ -0,0 +1,345 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Compile MRT RIB dumps into ready to send streams of BGP UPDATE messages.
+#
+# Streams are content-addressed: their name is derived from the sha1 of the
+# MRT file and the injection options, so that a stream compiled once is just
+# replayed by the following runs. The streams of several peers of the
+# PEER_INDEX_TABLE are compiled in a single pass over the file.
+#
+# The UPDATE messages of BGP4MP archives are kept as recorded, one peer
+# (by address) per stream, with a '.times' sidecar holding the recorded time
+# of the messages: (seconds since the first message, stream offset) pairs,
+# the offset being the end of the messages recorded at that time.
+
+import hashlib
+import json
+import os
+import socket
+import struct
+
+import bgp
+import mrt
+from encoder import UpdateEncoder
+
+STREAM_VERSION = 3
+STREAM_SUFFIX = '.bgp'
+META_SUFFIX = '.json'
+TIMES_SUFFIX = '.times'
+TIME_ENTRY = struct.Struct('!dQ')
+
+# attribute sets waiting to be packed with more prefixes
+MAX_PENDING = 1 << 16
+
+_DROPPED_ATTRIBUTES = set([
+    bgp.BGP_ATTR_TYPE_LOCAL_PREF,
+    bgp.BGP_ATTR_TYPE_ORIGINATOR_ID,
+    bgp.BGP_ATTR_TYPE_CLUSTER_LIST,
+    bgp.BGP_ATTR_TYPE_MP_REACH_NLRI,
+    bgp.BGP_ATTR_TYPE_MP_UNREACH_NLRI,
+    bgp.BGP_ATTR_TYPE_AS4_PATH,
+    bgp.BGP_ATTR_TYPE_AS4_AGGREGATOR,
+])
+
+
+def _first_as(value):
+    if len(value) >= 6 and bytearray(value)[0] == bgp.BGP_AS_SEQUENCE:
+        return struct.unpack_from('!I', value, 2)[0]
+    return None
+
+
+def _as_path_as4(value):
+    # 2-octet AS numbers of a session without the 4-octet AS capability
+    out = b''
+    i = 0
+    while i + 2 <= len(value):
+        seg_type, seg_len = struct.unpack_from('!BB', value, i)
+        asns = struct.unpack_from('!{0}H'.format(seg_len), value, i + 2)
+        out += struct.pack('!BB{0}I'.format(seg_len), seg_type, seg_len, *asns)
+        i += 2 + seg_len * 2
+    return out
+
+
+def rewrite_attributes(raw, local_as, next_hop, as4=True):
+    # attributes as announced by an eBGP speaker of AS local_as using a
+    # 4-octet AS session: local_as prepended (unless the path already starts
+    # with it, i.e. a collector peer replayed with its own AS), next-hop set
+    # to next_hop and attributes which only make sense inside the
+    # collector's AS dropped. as4 is False for BGP4MP messages of 2-octet AS
+    # sessions, whose AS4_PATH isn't merged.
+    out = []
+    has_next_hop = False
+    for flags, code, value in bgp.parse_attributes(raw):
+        if code in _DROPPED_ATTRIBUTES:
+            continue
+        if code == bgp.BGP_ATTR_TYPE_AGGREGATOR and not as4:
+            value = struct.pack('!I', struct.unpack_from('!H', value)[0]) + value[2:]
+        elif code == bgp.BGP_ATTR_TYPE_AS_PATH:
+            if not as4:
+                value = _as_path_as4(value)
+            if _first_as(value) != local_as:
+                value = bgp.as_path_prepend(value, local_as)
+        elif code == bgp.BGP_ATTR_TYPE_NEXT_HOP:
+            value = socket.inet_aton(next_hop)
+            has_next_hop = True
+        out.append(bgp.path_attribute(flags, code, value))
+    if not has_next_hop:
+        out.append(bgp.path_attribute(bgp.BGP_ATTR_FLAG_TRANSITIVE, bgp.BGP_ATTR_TYPE_NEXT_HOP,
+                                      socket.inet_aton(next_hop)))
+    return b''.join(out)
+
+
+def _preference(entry):
+    # smaller is better: AS path length, origin, MED, peer index
+    peer, _, raw = entry
+    as_path_len, origin, med = 0, bgp.BGP_ORIGIN_INCOMPLETE, 0
+    for _, code, value in bgp.parse_attributes(raw):
+        if code == bgp.BGP_ATTR_TYPE_AS_PATH:
+            as_path_len = bgp.as_path_length(value)
+        elif code == bgp.BGP_ATTR_TYPE_ORIGIN:
+            origin = bytearray(value)[0]
+        elif code == bgp.BGP_ATTR_TYPE_MULTI_EXIT_DISC:
+            med = struct.unpack('!I', value)[0]
+    return as_path_len, origin, med, peer
+
+
+def best_entry(entries):
+    return min(entries, key=_preference)
+
+
+def stream_key(digest, options):
+    return hashlib.sha1(json.dumps([STREAM_VERSION, digest, options], sort_keys=True).encode()).hexdigest()
+
+
+class _Stream(object):
+    # a stream being compiled, written aside until it is complete
+
+    def __init__(self, path, meta_path, options, max_pending):
+        self.path = path
+        self.meta_path = meta_path
+        self.options = options
+        self.enc = UpdateEncoder(max_pending=max_pending)
+        self.rewritten = {}
+        self.f = open(path + '.tmp', 'wb')
+        self.written = 0
+        # BGP4MP messages: recorded time of the first and the last one
+        self.times = None
+        self.t0 = self.t = None
+        self.updates = self.announced = self.withdrawn = 0
+
+    def _write(self, msg):
+        self.f.write(msg)
+        self.written += len(msg)
+
+    def _attributes(self, raw, as4=True):
+        key = raw if as4 else (raw, False)
+        attrs = self.rewritten.get(key)
+        if attrs is None:
+            if len(self.rewritten) > MAX_PENDING:
+                self.rewritten.clear()
+            attrs = self.rewritten[key] = rewrite_attributes(raw, self.options['local-as'],
+                                                             self.options['next-hop'], as4)
+        return attrs
+
+    def add(self, packed, raw):
+        for msg in self.enc.add_packed(packed, self._attributes(raw)):
+            self._write(msg)
+
+    def add_message(self, t, withdrawn, raw, nlri, as4):
+        # an UPDATE message recorded at time t, sent as such after the RIB
+        # entries of the stream
+        if self.times is None:
+            for msg in self.enc.flush():
+                self._write(msg)
+            self.times = open(self.path + TIMES_SUFFIX + '.tmp', 'wb')
+            self.t0 = self.t = t
+        elif t > self.t:
+            # records of several peers may be slightly out of order
+            self.times.write(TIME_ENTRY.pack(self.t - self.t0, self.written))
+            self.t = t
+        attrs = self._attributes(raw, as4) if nlri else b''
+        self._write(bgp.update_message(withdrawn=[withdrawn], attrs=attrs, nlri=[nlri]))
+        self.updates += 1
+        self.announced += bgp.count_prefixes(nlri)
+        self.withdrawn += bgp.count_prefixes(withdrawn)
+
+    def finish(self, mrt_file, digest):
+        for msg in self.enc.flush():
+            self._write(msg)
+        self.f.close()
+        if self.times is not None:
+            self.times.write(TIME_ENTRY.pack(self.t - self.t0, self.written))
+            self.times.close()
+            os.rename(self.path + TIMES_SUFFIX + '.tmp', self.path + TIMES_SUFFIX)
+        os.rename(self.path + '.tmp', self.path)
+        self.enc.routes += self.announced
+        self.enc.messages += self.updates
+        self.enc.bytes = self.written
+        meta = self.enc.stats()
+        meta['timed'] = self.times is not None
+        if self.times is not None:
+            meta.update({'updates': self.updates, 'withdrawn': self.withdrawn, 'duration': self.t - self.t0})
+        meta.update(self.options)
+        meta['mrt-file'] = os.path.abspath(os.path.expanduser(mrt_file))
+        meta['sha1'] = digest
+        with open(self.meta_path, 'w') as f:
+            json.dump(meta, f, indent=2, sort_keys=True)
+
+
+def _timestamp(record):
+    t = float(record.timestamp)
+    if record.type == mrt.MRT_TYPE_BGP4MP_ET:
+        t += struct.unpack_from('!I', record.data, 0)[0] / 1e6
+    return t
+
+
+def _update(record):
+    # (peer address, UPDATE body, 4-octet AS) of the BGP4MP records of
+    # UPDATE messages received from a peer, None for the others
+    if not record.is_bgp4mp_message() or \
+       record.subtype not in (mrt.BGP4MP_MESSAGE, mrt.BGP4MP_MESSAGE_AS4):
+        return None
+    r = record.parse_bgp4mp()
+    msg = r['message']
+    if len(msg) < bgp.BGP_HEADER_LEN or struct.unpack_from('!B', msg, 18)[0] != bgp.BGP_MSG_UPDATE:
+        return None
+    return r['peer-address'], msg[bgp.BGP_HEADER_LEN:], record.subtype == mrt.BGP4MP_MESSAGE_AS4
+
+
+def _compile(reader, streams, only_best, count, skip):
+    # one pass over the RIB entries for every stream, by peer index, and
+    # over the BGP4MP UPDATE messages, by peer address
+    by_peer = {}
+    for s in streams:
+        by_peer.setdefault(s.options['peer'], []).append(s)
+    for record in reader.records(skip, count):
+        update = _update(record)
+        if update is not None:
+            address, body, as4 = update
+            withdrawn, raw, nlri = bgp.split_update(body)
+            if not withdrawn and not nlri:
+                # End-of-RIB or IPv6 (MP_REACH_NLRI) only
+                continue
+            t = _timestamp(record)
+            for s in by_peer.get(None, []) + by_peer.get(address, []):
+                s.add_message(t, withdrawn, raw, nlri, as4)
+            continue
+        if record.type != mrt.MRT_TYPE_TABLE_DUMP_V2 or \
+           record.subtype != mrt.TABLE_DUMP_V2_RIB_IPV4_UNICAST:
+            continue
+        _, prefix, entries = record.parse_rib()
+        if not entries:
+            continue
+        packed = bgp.pack_prefix(prefix)
+        groups = {None: entries}
+        if len(by_peer) > 1 or None not in by_peer:
+            for e in entries:
+                groups.setdefault(e[0], []).append(e)
+        for peer, peer_streams in by_peer.items():
+            selected = groups.get(peer)
+            if not selected:
+                continue
+            if only_best:
+                selected = [best_entry(selected)]
+            for s in peer_streams:
+                for _, _, raw in selected:
+                    s.add(packed, raw)
+
+
+def compile_mrt(mrt_file, cache_dir, local_as, next_hop, only_best=False, count=None, skip=0, peer=None):
+    # returns (stream path, stream metadata). only IPv4 unicast RIB entries
+    # and BGP4MP UPDATE messages are compiled. without only_best, every path
+    # of a prefix is sent in turn.
+    return compile_mrt_peers(mrt_file, cache_dir, [(peer, local_as, next_hop)], only_best, count, skip)[0]
+
+
+def compile_mrt_peers(mrt_file, cache_dir, peers, only_best=False, count=None, skip=0):
+    # peers: list of (PEER_INDEX_TABLE index or BGP4MP peer address, None for
+    # all of them, local AS, next-hop). returns a (stream path, stream metadata) per peer, the
+    # streams which aren't in the cache being compiled together.
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    with mrt.MRTReader(mrt_file) as reader:
+        digest = reader.digest()
+        paths = []
+        todo = {}
+        for peer, local_as, next_hop in peers:
+            options = {
+                'local-as': local_as,
+                'next-hop': next_hop,
+                'only-best': bool(only_best),
+                'count': count,
+                'skip': skip,
+                'peer': peer,
+            }
+            key = stream_key(digest, options)
+            path = os.path.join(cache_dir, key + STREAM_SUFFIX)
+            meta_path = os.path.join(cache_dir, key + META_SUFFIX)
+            paths.append((path, meta_path))
+            if key not in todo and not (os.path.exists(path) and os.path.exists(meta_path)):
+                todo[key] = (path, meta_path, options)
+
+        if todo:
+            max_pending = max(MAX_PENDING // len(todo), 1024)
+            streams = [_Stream(path, meta_path, options, max_pending)
+                       for path, meta_path, options in todo.values()]
+            _compile(reader, streams, only_best, count, skip)
+            for s in streams:
+                s.finish(mrt_file, digest)
+
+    results = []
+    for path, meta_path in paths:
+        with open(meta_path) as f:
+            results.append((path, json.load(f)))
+    return results
+
+
+def update_peers(mrt_file, count=None, skip=0):
+    # [(address, AS)] of the peers of the BGP4MP UPDATE messages, in order of
+    # appearance
+    peers = {}
+    with mrt.MRTReader(mrt_file) as reader:
+        for record in reader.records(skip, count):
+            if _update(record) is not None:
+                r = record.parse_bgp4mp()
+                if r['peer-address'] not in peers:
+                    peers[r['peer-address']] = (len(peers), r['peer-as'])
+    return [(address, asn) for address, (_, asn) in sorted(peers.items(), key=lambda p: p[1][0])]
+
+
+def peer_prefixes(mrt_file, peers, count=None, skip=0):
+    # number of IPv4 unicast prefixes with an entry of at least one of peers
+    # (indexes or addresses), or left announced by its BGP4MP messages
+    peers = set(peers)
+    rib = set()
+    with mrt.MRTReader(mrt_file) as reader:
+        for record in reader.records(skip, count):
+            update = _update(record)
+            if update is not None:
+                address, body, _ = update
+                if address in peers:
+                    withdrawn, _, nlri = bgp.split_update(body)
+                    rib.difference_update(bgp.split_prefixes(withdrawn))
+                    rib.update(bgp.split_prefixes(nlri))
+                continue
+            if record.type != mrt.MRT_TYPE_TABLE_DUMP_V2 or \
+               record.subtype != mrt.TABLE_DUMP_V2_RIB_IPV4_UNICAST:
+                continue
+            _, prefix, entries = record.parse_rib()
+            if any(e[0] in peers for e in entries):
+                rib.add(bgp.pack_prefix(prefix))
+    return len(rib)
@@ -13,9 +13,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from tester import Tester
+from tester import Tester, SpeakerTester
 from gobgp import GoBGP
 from exabgp import ExaBGP_MRTParse
+from mrt import MRTReader
+from mrt_stream import compile_mrt_peers, TIMES_SUFFIX
 import os
 import yaml
 from  settings import dckr
@@ -24,11 +26,14 @@ import shutil
 
 class MRTTester(object):
 
-    def get_mrt_file(self, conf, name):
+    def get_mrt_file(self, conf, name, skip=0, count=None):
         # conf: tester or neighbor configuration
+        # only the entries selected by skip and count are copied to the container
         if 'mrt-file' in conf:
             mrt_file_path = os.path.expanduser(conf['mrt-file'])
 
+            if skip or count is not None:
+                name = '{0}.{1}-{2}'.format(name, skip, count)
             guest_mrt_file_path = '{guest_dir}/{filename}'.format(
                 guest_dir=self.guest_dir,
                 filename=name + '.mrt'
@@ -38,7 +43,8 @@ class MRTTester(object):
                 filename=name + '.mrt'
             )
             if not os.path.isfile(host_mrt_file_path):
-                shutil.copyfile(mrt_file_path, host_mrt_file_path)
+                with MRTReader(mrt_file_path) as reader:
+                    reader.write_slice(host_mrt_file_path, skip, count)
             return guest_mrt_file_path
 
 class ExaBGPMrtTester(Tester, ExaBGP_MRTParse, MRTTester):
@@ -142,6 +148,10 @@ class GoBGPMRTTester(Tester, GoBGP, MRTTester):
         super(GoBGPMRTTester, self).__init__(name, host_dir, conf, image)
 
     def configure_neighbors(self, target_conf):
+        # gobgp injects the MRT file into its global RIB: one neighbor only
+        if len(self.conf.get('neighbors', {})) > 1:
+            print 'warning: {0}: only the first neighbor is used, replay several peers with mrt_injector: speaker'.format(
+                self.name)
         conf = self.conf.get('neighbors', {}).values()[0]
 
         config = {
@@ -168,9 +178,12 @@ class GoBGPMRTTester(Tester, GoBGP, MRTTester):
     def get_startup_cmd(self):
         conf = self.conf.get('neighbors', {}).values()[0]
 
-        mrtfile = self.get_mrt_file(conf, conf['router-id'])
+        # count and skip are applied by get_mrt_file() using the MRT index
+        skip = int(conf.get('skip', 0))
+        count = int(conf['count']) if 'count' in conf else None
+        mrtfile = self.get_mrt_file(conf, conf['router-id'], skip, count)
         if not mrtfile:
-            mrtfile = self.get_mrt_file(self.conf, self.name)
+            mrtfile = self.get_mrt_file(self.conf, self.name, skip, count)
 
         startup = '''#!/bin/bash
 ulimit -n 65536
@@ -181,12 +194,97 @@ gobgpd -t yaml -f {1}/{2} -l {3} > {1}/gobgpd.log 2>&1 &
         if conf.get('only-best', False):
             cmd.append('--only-best')
         cmd += ['inject', 'global', mrtfile]
-        if 'count' in conf:
-            cmd.append(str(conf['count']))
-        if 'skip' in conf:
-            cmd.append(str(conf['skip']))
+        self.inject_cmd = ' '.join(cmd)
 
-        startup += '\n' + ' '.join(cmd)
+        startup += '\n' + self.inject_cmd
 
         startup += '\n' + 'pkill -SIGHUP gobgpd'
         return startup
+
+    def withdraw_all(self):
+        self.local('gobgp global rib -a ipv4 del all')
+
+    def announce_all(self):
+        self.local(self.inject_cmd)
+
+
+class SpeakerMRTTester(SpeakerTester):
+
+    CONTAINER_NAME_PREFIX = 'bgperf_speaker_mrttester_'
+
+    # used when bgperf doesn't give a cache directory in 'mrt-cache-dir'
+    DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'bgperf', 'streams')
+
+    def __init__(self, name, host_dir, conf, image='bgperf/speaker'):
+        super(SpeakerMRTTester, self).__init__(name, host_dir, conf, image)
+        # control generation of the last announcement, see replays()
+        self.announced = 0
+
+    def configure_neighbors(self, target_conf):
+        # the streams of the neighbors sharing an MRT file and its options,
+        # e.g. replaying the peers of a collector dump ('mrt-peer'), are
+        # compiled in a single pass over the file
+        groups = {}
+        for p in self.conf.get('neighbors', {}).values():
+            conf = p if 'mrt-file' in p else self.conf
+            key = (conf['mrt-file'], p.get('only-best', False), p.get('count'), p.get('skip', 0))
+            groups.setdefault(key, []).append(p)
+
+        self.streams = {}
+        for (mrt_file, only_best, count, skip), peers in groups.items():
+            streams = compile_mrt_peers(mrt_file, self.conf.get('mrt-cache-dir', self.DEFAULT_CACHE_DIR),
+                                        [(p.get('mrt-peer'), p['as'], p['local-address']) for p in peers],
+                                        only_best=only_best, count=count, skip=skip)
+            for p, stream in zip(peers, streams):
+                self.streams[p['router-id']] = stream
+
+        super(SpeakerMRTTester, self).configure_neighbors(target_conf)
+
+    def link(self, src, filename):
+        dst = '{0}/{1}'.format(self.host_dir, filename)
+        if os.path.exists(dst):
+            os.remove(dst)
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
+
+    def neighbor_config(self, p):
+        # the neighbor replays the UPDATE stream compiled from its MRT file,
+        # taken from the cache when it has already been compiled. the BGP4MP
+        # messages are sent at their recorded times, 'speed' times faster
+        # (0: as fast as possible).
+        src, meta = self.streams[p['router-id']]
+
+        filename = '{0}.bgp'.format(p['router-id'])
+        self.link(src, filename)
+
+        c = super(SpeakerMRTTester, self).neighbor_config(p)
+        c['stream'] = filename
+        c['stream-stats'] = meta
+        if meta.get('timed'):
+            c['stream-times'] = filename + TIMES_SUFFIX
+            self.link(src + TIMES_SUFFIX, c['stream-times'])
+            c['speed'] = self.conf.get('speed', 1)
+        return c
+
+    def announce_all(self):
+        super(SpeakerMRTTester, self).announce_all()
+        self.announced = self.control['generation']
+
+    def replays(self):
+        # replay counters of the timed neighbors, by router-id, None until
+        # they start replaying the last announcement
+        counters = self.counters().get('replay', {})
+        replays = {}
+        for rid in self.timed():
+            r = counters.get(rid)
+            replays[rid] = r if r and r.get('generation', 0) >= self.announced else None
+        return replays
+
+    def timed(self):
+        # router-ids of the neighbors replaying BGP4MP messages at their
+        # recorded times
+        if not self.conf.get('speed', 1):
+            return []
+        return [rid for rid, (_, meta) in self.streams.items() if meta.get('timed')]
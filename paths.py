@@ -0,0 +1,105 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Path specifications of tester neighbors.
+#
+# The 'paths' of a neighbor in scenario.yaml is either an explicit list of
+# prefixes or a compact range descriptor which is expanded lazily:
+#
+#   paths: {start: 100.0.0.0, count: 10000, prefix-len: 32, stride: 1}
+#
+# announces 'count' prefixes of length 'prefix-len', starting from 'start',
+# two consecutive prefixes being 'stride' prefix-sized blocks apart, or a
+# slice of a synthetic RIB, see ribgen.py.
+#
+# This module is copied into tester containers: standard library only,
+# Python 2/3 compatible.
+
+import socket
+import struct
+
+import ribgen
+
+try:
+    range = xrange
+except NameError:
+    pass
+
+
+def _ip2int(ip):
+    return struct.unpack('!I', socket.inet_aton(ip))[0]
+
+
+def _int2ip(i):
+    return socket.inet_ntoa(struct.pack('!I', i))
+
+
+def path_range(start, count, prefix_len=32, stride=1):
+    return {'start': str(start), 'count': count, 'prefix-len': prefix_len, 'stride': stride}
+
+
+def is_path_range(paths):
+    return isinstance(paths, dict) and 'start' in paths
+
+
+def _range_params(paths):
+    prefix_len = int(paths.get('prefix-len', 32))
+    if not 0 < prefix_len <= 32:
+        raise ValueError('invalid prefix-len: {0}'.format(prefix_len))
+    size = 1 << (32 - prefix_len)
+    start = _ip2int(paths['start']) & ~(size - 1) & 0xffffffff
+    step = size * int(paths.get('stride', 1))
+    count = int(paths['count'])
+    if step <= 0 or start + step * (count - 1) > 0xffffffff:
+        raise ValueError('path range out of IPv4 address space: {0}'.format(paths))
+    return start, count, prefix_len, step
+
+
+def count_paths(paths):
+    if is_path_range(paths) or ribgen.is_rib_slice(paths):
+        return int(paths['count'])
+    return len(paths or [])
+
+
+def iter_paths(paths):
+    # yields 'a.b.c.d/len' strings without materializing the list
+    if ribgen.is_rib_slice(paths):
+        for prefix, _ in ribgen.iter_routes(paths):
+            yield prefix
+        return
+    if not is_path_range(paths):
+        for p in paths or []:
+            yield p
+        return
+    start, count, prefix_len, step = _range_params(paths)
+    for i in range(count):
+        yield '{0}/{1}'.format(_int2ip(start + i * step), prefix_len)
+
+
+def iter_routes(paths):
+    # yields (prefix, attributes) pairs, attributes being the (AS path, MED,
+    # communities) of a synthetic RIB route, None otherwise
+    if ribgen.is_rib_slice(paths):
+        for route in ribgen.iter_routes(paths):
+            yield route
+        return
+    for prefix in iter_paths(paths):
+        yield prefix, None
+
+
+def next_start(paths):
+    # first address after the range, to chain ranges without overlap
+    start, count, prefix_len, step = _range_params(paths)
+    return _int2ip(start + count * step)
@@ -0,0 +1,66 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Match values of the policies in scenario.yaml.
+#
+# The 'value' of a match is either an explicit list or a compact range
+# descriptor which is expanded lazily, so that the target config writers
+# never hold a whole list:
+#
+#   prefix:        value: {start: 90.0.0.0, count: 500000, prefix-len: 32}
+#   as-path:       value: {start: 10000, count: 100}        # 10000, 10001, ...
+#   community:     value: {start: 0, count: 100}            # 0:0, 0:1, ...
+#   ext-community: value: {start: 0, count: 100}            # rt:0:0, rt:0:1, ...
+#
+# prefix ranges are path ranges, see paths.py.
+
+from paths import iter_paths, is_path_range
+
+try:
+    range = xrange
+except NameError:
+    pass
+
+
+def value_range(start, count):
+    return {'start': start, 'count': count}
+
+
+def count_values(match):
+    if is_path_range(match['value']):
+        return int(match['value']['count'])
+    return len(match['value'] or [])
+
+
+def iter_values(match):
+    value = match['value']
+    if not is_path_range(value):
+        for v in value or []:
+            yield v
+        return
+    if match['type'] == 'prefix':
+        for p in iter_paths(value):
+            yield p
+        return
+    start = int(value['start'])
+    for i in range(start, start + int(value['count'])):
+        if match['type'] == 'as-path':
+            yield i
+        elif match['type'] == 'community':
+            yield '{0}:{1}'.format(i >> 16, i & 0xffff)
+        elif match['type'] == 'ext-community':
+            yield 'rt:{0}:{1}'.format(i >> 16, i & 0xffff)
+        else:
+            raise ValueError('no value range for match type {0}'.format(match['type']))
@@ -0,0 +1,94 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Profiles of the target aligned with the benchmark timeline: back to back
+# CPU profiles and a heap profile at each check-point, named after the
+# elapsed time they cover and listed in profiles.csv.
+
+import os
+import time
+from threading import Thread, Lock, Event
+
+
+class Profiler(object):
+
+    def __init__(self, target, directory, start, window=10.0):
+        self.target = target
+        self.dir = directory
+        self.start_time = start
+        self.window = window
+        self.stopped = Event()
+        self.lock = Lock()
+        self.thread = None
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.index = open(os.path.join(directory, 'profiles.csv'), 'w')
+        self.index.write('kind, start, end, file\n')
+
+    def elapsed(self):
+        return time.time() - self.start_time
+
+    def record(self, kind, begin, end, name):
+        with self.lock:
+            if not self.index.closed:
+                self.index.write('{0}, {1:.3f}, {2:.3f}, {3}\n'.format(kind, begin, end, name))
+                self.index.flush()
+
+    def cpu(self):
+        while not self.stopped.is_set():
+            begin = self.elapsed()
+            tmp = os.path.join(self.dir, 'cpu.tmp')
+            try:
+                self.target.profile_cpu(tmp, self.window)
+            except NotImplementedError:
+                print 'profile: {0} can\'t be profiled'.format(self.target.name)
+                return
+            except Exception as e:
+                print 'profile: cpu profile of {0} failed: {1}'.format(self.target.name, e)
+                return
+            end = self.elapsed()
+            name = 'cpu-{0:08.2f}-{1:08.2f}{2}'.format(begin, end, self.target.PROFILE_SUFFIX)
+            os.rename(tmp, os.path.join(self.dir, name))
+            self.record('cpu', begin, end, name)
+
+    def heap(self, elapsed):
+        name = 'heap-{0:08.2f}{1}'.format(elapsed, self.target.PROFILE_SUFFIX)
+        try:
+            self.target.profile_heap(os.path.join(self.dir, name))
+        except NotImplementedError:
+            return
+        except Exception as e:
+            print 'profile: heap profile of {0} failed: {1}'.format(self.target.name, e)
+            return
+        self.record('heap', elapsed, elapsed, name)
+
+    def start(self):
+        self.thread = Thread(target=self.cpu)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def checkpoint(self, elapsed):
+        # not to delay the measurement
+        t = Thread(target=self.heap, args=(elapsed,))
+        t.daemon = True
+        t.start()
+
+    def stop(self):
+        # the current window is completed
+        self.stopped.set()
+        if self.thread:
+            self.thread.join(self.window + 30)
+        with self.lock:
+            self.index.close()
@@ -14,17 +14,20 @@
 # limitations under the License.
 
 from base import *
+from policy import iter_values
 
 class Quagga(Container):
 
     CONTAINER_NAME = None
     GUEST_DIR = '/root/config'
+    GIT_REPO = 'git://git.sv.gnu.org/quagga.git'
 
     def __init__(self, host_dir, conf, image='bgperf/quagga'):
         super(Quagga, self).__init__(self.CONTAINER_NAME, image, host_dir, self.GUEST_DIR, conf)
 
     @classmethod
     def build_image(cls, force=False, tag='bgperf/quagga', checkout='HEAD', nocache=False):
+        checkout = cls.resolve_checkout(checkout)
         cls.dockerfile = '''
 FROM ubuntu:latest
 WORKDIR /root
@@ -32,18 +35,22 @@ RUN useradd -M quagga
 RUN mkdir /var/log/quagga && chown quagga:quagga /var/log/quagga
 RUN mkdir /var/run/quagga && chown quagga:quagga /var/run/quagga
 RUN apt-get update && apt-get install -qy git autoconf libtool gawk make telnet libreadline6-dev
-RUN git clone git://git.sv.gnu.org/quagga.git quagga
+RUN apt-get install -qy linux-tools-generic
+RUN git clone {1} quagga
 RUN cd quagga && git checkout {0} && ./bootstrap.sh && \
 ./configure --disable-doc --localstatedir=/var/run/quagga && make && make install
 RUN ldconfig
-'''.format(checkout)
-        super(Quagga, cls).build_image(force, tag, nocache)
+'''.format(checkout, cls.GIT_REPO)
+        super(Quagga, cls).build_image(force, tag, nocache, checkout)
 
 
 class QuaggaTarget(Quagga, Target):
 
     CONTAINER_NAME = 'bgperf_quagga_target'
     CONFIG_FILE_NAME = 'bgpd.conf'
+    PROFILE_PROCESS = 'bgpd'
+    RIB_COUNT_CMD = "vtysh -c 'show ip bgp summary'"
+    RIB_COUNT_PATTERN = r'RIB entries (\d+)'
 
     def write_config(self, scenario_global_conf):
 
@@ -63,11 +70,14 @@ neighbor {0} timers 30 90
             if 'filter' in n:
                 for p in (n['filter']['in'] if 'in' in n['filter'] else []):
                     c += 'neighbor {0} route-map {1} export\n'.format(local_addr, p)
+                # route-server-client: 'import' applies to the routes exported to the client
+                for p in (n['filter']['out'] if 'out' in n['filter'] else []):
+                    c += 'neighbor {0} route-map {1} import\n'.format(local_addr, p)
             return c
 
         with open('{0}/{1}'.format(self.host_dir, self.CONFIG_FILE_NAME), 'w') as f:
             f.write(config)
-            for n in list(flatten(t.get('neighbors', {}).values() for t in scenario_global_conf['testers'])) + [scenario_global_conf['monitor']]:
+            for n in scenario_neighbors(scenario_global_conf):
                 f.write(gen_neighbor_config(n))
 
             if 'policy' in scenario_global_conf:
@@ -77,16 +87,20 @@ neighbor {0} timers 30 90
                     for i, match in enumerate(v['match']):
                         n = '{0}_match_{1}'.format(k, i)
                         if match['type'] == 'prefix':
-                            f.write(''.join('ip prefix-list {0} deny {1}\n'.format(n, p) for p in match['value']))
+                            for p in iter_values(match):
+                                f.write('ip prefix-list {0} deny {1}\n'.format(n, p))
                             f.write('ip prefix-list {0} permit any\n'.format(n))
                         elif match['type'] == 'as-path':
-                            f.write(''.join('ip as-path access-list {0} deny _{1}_\n'.format(n, p) for p in match['value']))
+                            for p in iter_values(match):
+                                f.write('ip as-path access-list {0} deny _{1}_\n'.format(n, p))
                             f.write('ip as-path access-list {0} permit .*\n'.format(n))
                         elif match['type'] == 'community':
-                            f.write(''.join('ip community-list standard {0} permit {1}\n'.format(n, p) for p in match['value']))
+                            for p in iter_values(match):
+                                f.write('ip community-list standard {0} permit {1}\n'.format(n, p))
                             f.write('ip community-list standard {0} permit\n'.format(n))
                         elif match['type'] == 'ext-community':
-                            f.write(''.join('ip extcommunity-list standard {0} permit {1} {2}\n'.format(n, *p.split(':', 1)) for p in match['value']))
+                            for p in iter_values(match):
+                                f.write('ip extcommunity-list standard {0} permit {1} {2}\n'.format(n, *p.split(':', 1)))
                             f.write('ip extcommunity-list standard {0} permit\n'.format(n))
 
                         match_info.append((match['type'], n))
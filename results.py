@@ -0,0 +1,290 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Persistent store of benchmark runs.
+#
+# Every run gets a directory under <dir>/results holding meta.json (scenario
+# hash, target image, arguments, host), one append-only file of doubles per
+# time series column, and summary.json once the run is over.
+
+import copy
+import errno
+import json
+import math
+import os
+import platform
+import time
+from array import array
+from itertools import product
+
+COLUMNS = ['elapsed', 'cpu', 'cpu_seconds', 'mem', 'recved']
+COLUMN_SUFFIX = '.f64'
+
+# metrics compared by 'bgperf.py compare'; all of them are better when lower
+METRICS = ['convergence', 'peak_mem', 'cpu_seconds']
+
+
+def host_info():
+    info = {
+        'hostname': platform.node(),
+        'kernel': platform.release(),
+        'machine': platform.machine(),
+        'cpus': os.sysconf('SC_NPROCESSORS_ONLN'),
+    }
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemTotal:'):
+                    info['mem'] = int(line.split()[1]) * 1024
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    info['cpu_model'] = line.split(':', 1)[1].strip()
+                    break
+    except IOError:
+        pass
+    return info
+
+
+class RunRecorder(object):
+
+    def __init__(self, results_dir, name, meta):
+        if not os.path.exists(results_dir):
+            os.makedirs(results_dir)
+        # runs started within the same second (short sweep points or
+        # iterations) get a counter suffix
+        base = '{0}-{1}'.format(time.strftime('%Y%m%d-%H%M%S'), name)
+        n = 0
+        while True:
+            self.run_id = base if n == 0 else '{0}.{1}'.format(base, n)
+            self.dir = os.path.join(results_dir, self.run_id)
+            try:
+                os.mkdir(self.dir)
+                break
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+                n += 1
+        meta = dict(meta)
+        meta['run'] = self.run_id
+        meta['time'] = time.time()
+        meta['host'] = host_info()
+        with open(os.path.join(self.dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2, sort_keys=True, default=str)
+        self.files = dict((c, open(os.path.join(self.dir, c + COLUMN_SUFFIX), 'ab')) for c in COLUMNS)
+        self.peak_mem = 0
+        self.first_cpu_seconds = None
+        self.cpu_seconds = 0.0
+        self.prev = None
+
+    def append(self, elapsed, cpu, cpu_seconds, mem, recved):
+        # cpu_seconds is None when the target usage doesn't come from its
+        # cgroup; the CPU percentage is integrated instead
+        if cpu_seconds is not None:
+            if self.first_cpu_seconds is None:
+                self.first_cpu_seconds = cpu_seconds
+            self.cpu_seconds = cpu_seconds - self.first_cpu_seconds
+        elif self.prev is not None:
+            self.cpu_seconds += cpu / 100.0 * (elapsed - self.prev)
+        self.prev = elapsed
+        self.peak_mem = max(self.peak_mem, mem)
+        row = {'elapsed': elapsed, 'cpu': cpu, 'cpu_seconds': self.cpu_seconds, 'mem': mem, 'recved': recved}
+        for c in COLUMNS:
+            array('d', [float(row[c])]).tofile(self.files[c])
+            self.files[c].flush()
+
+    def finish(self, convergence, **extra):
+        for f in self.files.values():
+            f.close()
+        summary = {
+            'convergence': convergence,
+            'peak_mem': self.peak_mem,
+            'cpu_seconds': self.cpu_seconds,
+        }
+        summary.update(extra)
+        with open(os.path.join(self.dir, 'summary.json'), 'w') as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+        return summary
+
+
+def load_run(run_dir):
+    run = {}
+    for name in ['meta', 'summary']:
+        path = os.path.join(run_dir, name + '.json')
+        if os.path.exists(path):
+            with open(path) as f:
+                run[name] = json.load(f)
+    return run
+
+
+def load_series(run_dir, column):
+    a = array('d')
+    path = os.path.join(run_dir, column + COLUMN_SUFFIX)
+    with open(path, 'rb') as f:
+        a.fromfile(f, os.path.getsize(path) // a.itemsize)
+    return a
+
+
+def find_runs(results_dir, selector):
+    # selector is a run id or a label; returns the completed runs matching it
+    if not os.path.isdir(results_dir):
+        return []
+    runs = []
+    for name in sorted(os.listdir(results_dir)):
+        run = load_run(os.path.join(results_dir, name))
+        if 'summary' not in run or 'meta' not in run:
+            continue
+        if name == selector or run['meta'].get('label') == selector:
+            runs.append(run)
+    return runs
+
+
+def _mean_stdev(values):
+    n = len(values)
+    mean = sum(values) / float(n)
+    if n < 2:
+        return mean, 0.0
+    return mean, math.sqrt(sum((v - mean) ** 2 for v in values) / (n - 1))
+
+
+def _betacf(a, b, x):
+    # continued fraction of the incomplete beta function (Lentz's method)
+    tiny = 1e-300
+    qab, qap, qam = a + b, a + 1.0, a - 1.0
+    c, d = 1.0, 1.0 - qab * x / qap
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, 200):
+        m2 = 2 * m
+        aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + aa / c
+        c = c if abs(c) > tiny else tiny
+        h *= d * c
+        aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + aa / c
+        c = c if abs(c) > tiny else tiny
+        delta = d * c
+        h *= delta
+        if abs(delta - 1.0) < 3e-12:
+            break
+    return h
+
+
+def _betai(a, b, x):
+    # regularized incomplete beta function I_x(a, b)
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    lbeta = math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b)
+    front = math.exp(lbeta + a * math.log(x) + b * math.log(1.0 - x))
+    if x < (a + 1.0) / (a + b + 2.0):
+        return front * _betacf(a, b, x) / a
+    return 1.0 - front * _betacf(b, a, 1.0 - x) / b
+
+
+def welch_test(xs, ys):
+    # two-sided p-value of Welch's t-test, None with less than 2 samples each
+    if len(xs) < 2 or len(ys) < 2:
+        return None
+    mx, sx = _mean_stdev(xs)
+    my, sy = _mean_stdev(ys)
+    vx, vy = sx ** 2 / len(xs), sy ** 2 / len(ys)
+    if vx + vy == 0:
+        return 0.0 if mx != my else 1.0
+    t = (my - mx) / math.sqrt(vx + vy)
+    df = (vx + vy) ** 2 / ((vx ** 2 / (len(xs) - 1) if vx else 0) + (vy ** 2 / (len(ys) - 1) if vy else 0))
+    return _betai(df / 2.0, 0.5, df / (df + t * t))
+
+
+def compare(baseline, candidate, threshold=5.0, alpha=0.05):
+    # returns a list of dicts, one per metric. a metric regresses when the
+    # candidate is worse by more than threshold percent and, when there are
+    # enough runs to tell, the difference is statistically significant.
+    rows = []
+    for metric in METRICS:
+        xs = [r['summary'][metric] for r in baseline if r['summary'].get(metric) is not None]
+        ys = [r['summary'][metric] for r in candidate if r['summary'].get(metric) is not None]
+        if not xs or not ys:
+            continue
+        mx, sx = _mean_stdev(xs)
+        my, sy = _mean_stdev(ys)
+        change = (my - mx) / mx * 100.0 if mx else float('inf') if my else 0.0
+        p = welch_test(xs, ys)
+        rows.append({
+            'metric': metric,
+            'baseline': mx, 'baseline_stdev': sx, 'baseline_runs': len(xs),
+            'candidate': my, 'candidate_stdev': sy, 'candidate_runs': len(ys),
+            'change': change,
+            'p': p,
+            'regression': change > threshold and (p is None or p < alpha),
+        })
+    return rows
+
+
+def sweep_points(args, keys):
+    # [(values, point)] for every combination of the value lists of keys in
+    # args (the parsed options of sweep), point being a copy of args holding
+    # those values
+    points = []
+    for values in product(*[getattr(args, k) for k in keys]):
+        point = copy.copy(args)
+        for k, v in zip(keys, values):
+            setattr(point, k, v)
+        points.append((values, point))
+    return points
+
+
+def loglog_fit(xs, ys):
+    # least squares fit of log(y) = c + sum(e_i * log(x_i)) where xs holds one
+    # tuple of positive values per observation. returns ([e_i], r2), e_i being
+    # None for the variables which don't vary, or None without enough points.
+    points = [(x, y) for x, y in zip(xs, ys) if y > 0 and all(v > 0 for v in x)]
+    if not points:
+        return None
+    width = len(points[0][0])
+    lx = [[math.log(v) for v in x] for x, _ in points]
+    ly = [math.log(y) for _, y in points]
+    varying = [i for i in range(width) if max(r[i] for r in lx) - min(r[i] for r in lx) > 1e-12]
+    if len(points) < len(varying) + 2:
+        return None
+
+    # normal equations of [1, log x_i...], solved by gaussian elimination
+    rows = [[1.0] + [r[i] for i in varying] for r in lx]
+    n = len(varying) + 1
+    a = [[sum(r[i] * r[j] for r in rows) for j in range(n)] + [sum(r[i] * y for r, y in zip(rows, ly))]
+         for i in range(n)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda i: abs(a[i][col]))
+        if abs(a[pivot][col]) < 1e-12:
+            return None
+        a[col], a[pivot] = a[pivot], a[col]
+        for i in range(n):
+            if i != col:
+                k = a[i][col] / a[col][col]
+                a[i] = [v - k * w for v, w in zip(a[i], a[col])]
+    coefs = [a[i][n] / a[i][i] for i in range(n)]
+
+    mean = sum(ly) / len(ly)
+    ss_tot = sum((y - mean) ** 2 for y in ly)
+    ss_res = sum((y - sum(c * v for c, v in zip(coefs, r))) ** 2 for r, y in zip(rows, ly))
+    exponents = [None] * width
+    for i, c in zip(varying, coefs[1:]):
+        exponents[i] = c
+    return exponents, 1.0 - ss_res / ss_tot if ss_tot > 0 else 1.0
@@ -0,0 +1,234 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Seeded synthetic RIB: 'total' routes whose prefix lengths, AS path lengths
+# and community counts follow histograms (DFZ-like by default), sharing a
+# given ratio of unique attribute sets. The paths of a tester neighbor can be
+# a slice of it:
+#
+#   paths: {rib: {seed: 1, total: 1000000, unique-attrs: 0.3}, offset: 0, count: 10000}
+#
+# rib also takes prefix-lengths ({24: 0.6, 23: 0.1, ...}), as-path-lengths
+# (counting the AS of the neighbor), communities (number of communities per
+# route) and med (fraction of the attribute sets with a MED).
+#
+# Every route is computed from its index alone: the neighbors taking disjoint
+# slices of a RIB announce distinct prefixes, a seed always gives the same
+# table, and nothing is materialized.
+#
+# Like paths.py, this module is copied into tester containers: standard
+# library only, Python 2/3 compatible.
+
+import json
+import socket
+import struct
+
+try:
+    range = xrange
+except NameError:
+    pass
+
+DFZ_PREFIX_LENGTHS = {
+    24: 0.6, 23: 0.1, 22: 0.125, 21: 0.045, 20: 0.045, 19: 0.03, 18: 0.015,
+    17: 0.01, 16: 0.025, 15: 0.002, 14: 0.0015, 13: 0.001, 12: 0.0005,
+}
+DFZ_AS_PATH_LENGTHS = {2: 0.05, 3: 0.25, 4: 0.35, 5: 0.2, 6: 0.1, 7: 0.03, 8: 0.02}
+DFZ_COMMUNITIES = {0: 0.35, 1: 0.15, 2: 0.15, 3: 0.1, 4: 0.08, 5: 0.06, 8: 0.06, 12: 0.05}
+UNIQUE_ATTRS = 0.3
+MED = 0.25
+
+# first octets the prefixes are taken from: no 0/8, 10/8 (the bgperf
+# local addresses by default), 127/8 or multicast and reserved space
+FIRST_OCTETS = [o for o in range(1, 224) if o not in (10, 127)]
+
+# AS numbers of the generated paths, clear of the ones of bgperf (1000 and
+# up for the target, monitor and testers, 10000 and up for the as-path lists)
+AS2_RANGE = (20000, 64495)
+AS4_RANGE = (131072, 399999)
+AS4_SHARE = 0.3
+
+# the prefix lengths repeat in a shuffled pattern of SLOTS routes
+SLOTS = 10000
+
+MASK64 = (1 << 64) - 1
+
+
+def _mix(x):
+    # splitmix64 finalizer, the same on every Python version
+    x = (x + 0x9e3779b97f4a7c15) & MASK64
+    x = ((x ^ (x >> 30)) * 0xbf58476d1ce4e5b9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94d049bb133111eb) & MASK64
+    return x ^ (x >> 31)
+
+
+def _gcd(a, b):
+    while b:
+        a, b = b, a % b
+    return a
+
+
+def _coprime(x, n):
+    # multiplier of a bijective affine map modulo n
+    a = x % n | 1
+    while _gcd(a, n) != 1:
+        a += 2
+    return a % n if n > 1 else 1
+
+
+def _histogram(h, default):
+    # {value: weight} from scenario.yaml or speaker.json (string keys)
+    h = h or default
+    total = float(sum(h.values()))
+    if total <= 0:
+        raise ValueError('empty histogram: {0}'.format(h))
+    return sorted((int(k), v / total) for k, v in h.items() if v > 0)
+
+
+def _slots(weights, n):
+    # n slots split according to weights, by largest remainder
+    counts = [int(w * n) for _, w in weights]
+    rest = sorted(range(len(weights)), key=lambda i: weights[i][1] * n - counts[i], reverse=True)
+    for i in rest[:n - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+
+def rib_slice(offset, count, total, seed=0, **params):
+    # paths of a neighbor announcing the routes [offset, offset + count) of
+    # the RIB, params being the other rib keys with '_' for '-'
+    rib = {'seed': seed, 'total': total}
+    rib.update((k.replace('_', '-'), v) for k, v in params.items())
+    return {'rib': rib, 'offset': offset, 'count': count}
+
+
+def is_rib_slice(paths):
+    return isinstance(paths, dict) and 'rib' in paths
+
+
+class RibGenerator(object):
+
+    def __init__(self, rib):
+        self.seed = _mix(int(rib.get('seed', 0)))
+        self.total = int(rib['total'])
+
+        lengths = _histogram(rib.get('prefix-lengths'), DFZ_PREFIX_LENGTHS)
+        counts = _slots(lengths, SLOTS)
+        pattern = []
+        for (length, _), n in zip(lengths, counts):
+            if not 8 <= length <= 32:
+                raise ValueError('invalid prefix length: {0}'.format(length))
+            pattern += [length] * n
+        for i in range(len(pattern) - 1, 0, -1):
+            j = _mix(self.seed ^ i) % (i + 1)
+            pattern[i], pattern[j] = pattern[j], pattern[i]
+        # slot -> (prefix length, rank among the slots of that length)
+        ranks = {}
+        self.pattern = []
+        for length in pattern:
+            self.pattern.append((length, ranks.get(length, 0)))
+            ranks[length] = ranks.get(length, 0) + 1
+        self.per_pattern = ranks
+
+        # prefix length -> (space size, affine map of the prefix indexes)
+        self.spaces = {}
+        cycles = (self.total + SLOTS - 1) // SLOTS
+        for length, n in ranks.items():
+            size = len(FIRST_OCTETS) << (length - 8)
+            if cycles * n > size:
+                raise ValueError('not enough /{0} prefixes for {1} routes, lower its share in '
+                                 'prefix-lengths'.format(length, self.total))
+            self.spaces[length] = (size, _coprime(_mix(self.seed ^ length), size),
+                                   _mix(self.seed + length) % size)
+
+        self.path_lengths = _histogram(rib.get('as-path-lengths'), DFZ_AS_PATH_LENGTHS)
+        self.communities = _histogram(rib.get('communities'), DFZ_COMMUNITIES)
+        self.med = float(rib.get('med', MED))
+        self.sets = max(1, min(self.total, int(round(self.total * float(rib.get('unique-attrs', UNIQUE_ATTRS))))))
+        self.last = (None, None)
+
+    def prefix(self, i):
+        cycle, slot = divmod(i, SLOTS)
+        length, rank = self.pattern[slot]
+        size, a, b = self.spaces[length]
+        x = (a * (cycle * self.per_pattern[length] + rank) + b) % size
+        bits = length - 8
+        hi, lo = divmod(x, 1 << bits)
+        if bits:
+            # scrambles the low bits, keeping the map bijective
+            mask = (1 << bits) - 1
+            lo = (lo ^ _mix(self.seed ^ hi)) & mask
+            lo = (lo * 0x9e3779b1) & mask
+            lo ^= lo >> (bits // 2 + 1)
+        addr = FIRST_OCTETS[hi] << 24 | lo << (32 - length)
+        return '{0}/{1}'.format(socket.inet_ntoa(struct.pack('!I', addr)), length)
+
+    def _draw(self, state, histogram):
+        x = _mix(state) / float(MASK64 + 1)
+        for value, w in histogram:
+            x -= w
+            if x < 0:
+                return value
+        return histogram[-1][0]
+
+    def _asn(self, state):
+        x = _mix(state)
+        lo, hi = AS4_RANGE if (x & 0xffff) < AS4_SHARE * 0x10000 else AS2_RANGE
+        return lo + (x >> 16) % (hi - lo + 1)
+
+    def attribute_set(self, n):
+        # (AS path without the neighbor AS, MED or None, communities)
+        if self.last[0] == n:
+            return self.last[1]
+        state = _mix(self.seed ^ (n << 8))
+        as_path = tuple(self._asn(state + 16 + k) for k in range(max(self._draw(state ^ 1, self.path_lengths) - 1, 0)))
+        med = None
+        if _mix(state ^ 2) % 10000 < self.med * 10000:
+            med = _mix(state ^ 3) % 1001
+        # tagged by an AS of the path, as the transit providers do
+        tags = [a for a in as_path if a <= 0xffff] or [AS2_RANGE[0] + n % (AS2_RANGE[1] - AS2_RANGE[0])]
+        communities = set()
+        for k in range(self._draw(state ^ 4, self.communities)):
+            x = _mix(state + 64 + k)
+            communities.add('{0}:{1}'.format(tags[x % len(tags)], (x >> 16) & 0xffff))
+        attrs = (as_path, med, tuple(sorted(communities)))
+        self.last = (n, attrs)
+        return attrs
+
+    def attributes(self, i):
+        # runs of consecutive routes share an attribute set, as the prefixes
+        # of an origin do
+        return self.attribute_set(i * self.sets // self.total)
+
+    def routes(self, offset, count):
+        if offset < 0 or offset + count > self.total:
+            raise ValueError('routes {0}-{1} out of a {2} routes RIB'.format(offset, offset + count, self.total))
+        for i in range(offset, offset + count):
+            yield self.prefix(i), self.attributes(i)
+
+
+_generators = {}
+
+
+def generator(rib):
+    # the neighbors of a tester share the generator of their RIB
+    key = json.dumps(rib, sort_keys=True)
+    if key not in _generators:
+        _generators[key] = RibGenerator(rib)
+    return _generators[key]
+
+
+def iter_routes(paths):
+    # yields the (prefix, attribute set) pairs of a RIB slice
+    return generator(paths['rib']).routes(int(paths.get('offset', 0)), int(paths['count']))
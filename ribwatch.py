@@ -0,0 +1,87 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# RIB of the monitor, followed through the JSON event stream of
+# 'gobgp monitor global rib -j' (the MonitorTable gRPC API): one JSON list
+# of paths, or a single path, per line.
+
+import json
+from threading import Lock
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+
+class RibWatch(object):
+
+    def __init__(self, check_points=()):
+        self.lock = Lock()
+        # routes[prefix] is the arrival time of prefix
+        self.routes = {}
+        # (time, number of routes) of every check-point crossed
+        self.crossings = Queue()
+        self.cps = list(check_points)
+        # number of path events (announcements and withdrawals) received
+        self.events = 0
+        # announcements of prefixes already there, i.e. best path changes
+        # of the target, and the time of the last announcement
+        self.changes = 0
+        self.last_change = None
+        # time of the last path event, and of the last one of each prefix
+        self.last_event = None
+        self.seen = {}
+        self.buf = ''
+
+    def feed(self, chunk, now):
+        # chunk: output of the event stream, which may end in the middle of a line
+        self.buf += chunk
+        lines = self.buf.split('\n')
+        self.buf = lines.pop()
+        for line in lines:
+            line = line.strip()
+            if line.startswith('[') or line.startswith('{'):
+                self.update(json.loads(line), now)
+
+    def update(self, paths, now):
+        if isinstance(paths, dict):
+            paths = [paths]
+        with self.lock:
+            self.events += len(paths)
+            self.last_event = now
+            for p in paths:
+                nlri = p.get('nlri', {})
+                prefix = nlri.get('prefix') if isinstance(nlri, dict) else p.get('prefix')
+                if prefix is None:
+                    continue
+                self.seen[prefix] = now
+                if p.get('withdrawal', False):
+                    self.routes.pop(prefix, None)
+                    continue
+                if prefix not in self.routes:
+                    self.routes[prefix] = now
+                else:
+                    self.changes += 1
+                self.last_change = now
+            n = len(self.routes)
+            # a check-point is detected on the update which crosses it
+            while len(self.cps) > 0 and n >= int(self.cps[0]):
+                self.cps.pop(0)
+                self.crossings.put((now, n))
+
+    def rearm(self, check_points):
+        # the check-points are crossed again after a warm reset
+        with self.lock:
+            self.cps[:] = check_points
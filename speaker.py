@@ -0,0 +1,39 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from base import *
+
+class Speaker(Container):
+
+    GUEST_DIR = '/root/config'
+    # files copied into the container's config directory to run speakerd
+    PROGRAM_FILES = ['speakerd.py', 'bgp.py', 'encoder.py', 'paths.py', 'ribgen.py', 'latency.py']
+
+    def __init__(self, name, host_dir, conf, image='bgperf/speaker'):
+        super(Speaker, self).__init__('bgperf_speaker_' + name, image, host_dir, self.GUEST_DIR, conf)
+
+    @classmethod
+    def build_image(cls, force=False, tag='bgperf/speaker', checkout='HEAD', nocache=False):
+        cls.dockerfile = '''
+FROM ubuntu:latest
+WORKDIR /root
+RUN apt-get update && apt-get install -qy python3
+'''
+        super(Speaker, cls).build_image(force, tag, nocache)
+
+    def install_program(self):
+        src_dir = os.path.dirname(os.path.abspath(__file__))
+        for name in self.PROGRAM_FILES:
+            shutil.copyfile(os.path.join(src_dir, name), os.path.join(self.host_dir, name))
@@ -0,0 +1,582 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Minimal asyncio BGP speaker run inside the bgperf speaker tester container.
+#
+# A single process drives every BGP session of the tester from one event
+# loop (or one loop per worker process with -w), sending UPDATE messages
+# prepared before the sessions are opened. bgperf drives the established
+# sessions through a control file (e.g. withdraw and re-announce every route).
+
+import asyncio
+import json
+import os
+import random
+import struct
+import sys
+import time
+from argparse import ArgumentParser
+
+import bgp
+from encoder import UpdateEncoder
+from paths import iter_routes
+from latency import SendLog, SEND_LOG_SUFFIX, CHURN_LOG_SUFFIX
+
+CONNECT_RETRY = 5
+STREAM_CHUNK = 1 << 20
+CONTROL_INTERVAL = 0.2
+CHURN_ACTIONS = ['withdraw', 'med', 'as-path', 'community']
+# (seconds since the first message, end offset in the stream) entries of
+# the '.times' file of a stream of BGP4MP messages, see mrt_stream.py
+TIME_ENTRY = struct.Struct('!dQ')
+ORIGINS = {'igp': bgp.BGP_ORIGIN_IGP, 'egp': bgp.BGP_ORIGIN_EGP, 'incomplete': bgp.BGP_ORIGIN_INCOMPLETE}
+
+
+def log(fmt, *args):
+    print('{0:.6f} | {1} | {2}'.format(time.time(), os.getpid(), fmt.format(*args)), flush=True)
+
+
+def attributes_packer(neighbor):
+    # packs the attributes of the routes of neighbor, once per attribute set.
+    # the 'attributes' of the neighbor, e.g. {"prepend": 2, "med": 10,
+    # "origin": "egp", "communities": ["1000:120"]}, apply to all of them.
+    next_hop = neighbor['local-address']
+    own = neighbor.get('attributes') or {}
+    head = (neighbor['as'],) * (1 + own.get('prepend', 0))
+    origin = ORIGINS[own.get('origin', 'igp')]
+    default = bgp.path_attributes(next_hop, as_path=head, origin=origin, med=own.get('med'),
+                                  communities=own.get('communities', ()))
+    packed = {}
+
+    def pack(attributes):
+        if attributes is None:
+            return default
+        if attributes not in packed:
+            as_path, med, communities = attributes
+            packed[attributes] = bgp.path_attributes(
+                next_hop, as_path=head + as_path, origin=origin, med=own.get('med') if med is None else med,
+                communities=tuple(own.get('communities', ())) + communities)
+        return packed[attributes]
+    return pack
+
+
+def prepare_updates(neighbor, max_size=bgp.BGP_MAX_MSG_LEN):
+    # returns (messages, encoder) so that callers can report encoder.stats()
+    pack = attributes_packer(neighbor)
+    enc = UpdateEncoder(max_size)
+    return list(enc.encode((p, pack(a)) for p, a in iter_routes(neighbor.get('paths')))), enc
+
+
+async def read_message(reader):
+    header = await reader.readexactly(bgp.BGP_HEADER_LEN)
+    length, msg_type = bgp.parse_header(header)
+    body = await reader.readexactly(length - bgp.BGP_HEADER_LEN)
+    return msg_type, body
+
+
+class TokenBucket(object):
+
+    def __init__(self, rate, burst=None):
+        self.set_rate(rate, burst)
+        self.tokens = self.burst
+        self.time = asyncio.get_running_loop().time()
+
+    def set_rate(self, rate, burst=None):
+        self.rate = float(rate)
+        # 100ms worth of tokens by default
+        self.burst = burst or max(self.rate / 10, 1.0)
+
+    async def take(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            self.tokens = min(self.burst, self.tokens + (now - self.time) * self.rate)
+            self.time = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Control(object):
+    # polls the control file written by bgperf, e.g.
+    # {"generation": 2, "announce": true, "churn": true, "rate": 1000}.
+    # every change bumps generation. rate, in updates/sec for the whole
+    # tester, paces the churn of every session through a token bucket
+    # instead of their own rate; this process gets its share of it. the
+    # counters of this process are written back in counters.<pid>.json,
+    # the sink sessions' ones by router-id.
+
+    def __init__(self, path, share=1.0):
+        self.path = path
+        self.share = share
+        self.generation = 0
+        self.announce = True
+        self.churn = False
+        self.bucket = None
+        self.changed = asyncio.Event()
+        self.counters = {'churn': 0, 'established': {}, 'received': {}, 'done': {}, 'replay': {}}
+        # packed prefix -> number, shared by the PrefixSets of the sinks
+        self.prefix_ids = {}
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                c = json.load(f)
+        except (OSError, ValueError):
+            return
+        if c.get('generation', 0) == self.generation:
+            return
+        self.generation = c['generation']
+        self.announce = c.get('announce', True)
+        self.churn = c.get('churn', False)
+        rate = c.get('rate')
+        if not rate:
+            self.bucket = None
+        elif self.bucket:
+            self.bucket.set_rate(rate * self.share)
+        else:
+            self.bucket = TokenBucket(rate * self.share)
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    def dump_counters(self):
+        filename = 'counters.{0}.json'.format(os.getpid())
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(self.counters, f)
+        os.rename(filename + '.tmp', filename)
+
+    async def poll(self):
+        while True:
+            self.load()
+            self.dump_counters()
+            await asyncio.sleep(CONTROL_INTERVAL)
+
+
+class PrefixSet(object):
+    # the distinct prefixes received by a sink: one bit per prefix, numbered
+    # by a table shared by the sinks of the process, which mostly receive
+    # the same prefixes
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.bits = bytearray()
+        self.count = 0
+
+    def add(self, prefix):
+        i = self.ids.setdefault(prefix, len(self.ids))
+        if i >> 3 >= len(self.bits):
+            self.bits.extend(bytearray(max((i >> 3) + 1 - len(self.bits), len(self.bits))))
+        if not self.bits[i >> 3] & (1 << (i & 7)):
+            self.bits[i >> 3] |= 1 << (i & 7)
+            self.count += 1
+
+    def discard(self, prefix):
+        i = self.ids.get(prefix)
+        if i is not None and i >> 3 < len(self.bits) and self.bits[i >> 3] & (1 << (i & 7)):
+            self.bits[i >> 3] &= ~(1 << (i & 7)) & 0xff
+            self.count -= 1
+
+
+class Churn(object):
+    # flaps a random subset of the prefixes of a neighbor, one prefix per
+    # UPDATE: withdraw (then re-announce), MED, AS path or community change.
+    # conf: {"rate": updates/sec, "distribution": "constant" | "poisson" |
+    # "burst", "burst": size, "prefixes": fraction, "actions": [...]}.
+    # every update is written to log, for bgperf to tell which prefixes the
+    # target hasn't converged on yet.
+
+    def __init__(self, neighbor, conf, log=None):
+        self.rng = random.Random(conf.get('seed', neighbor['router-id']))
+        routes = list(iter_routes(neighbor.get('paths')))
+        num = min(len(routes), max(1, int(len(routes) * conf.get('prefixes', 0.1))))
+        routes = self.rng.sample(routes, num)
+        self.prefixes = [bgp.pack_prefix(p) for p, _ in routes]
+        # the original attributes of each flapped prefix
+        pack = attributes_packer(neighbor)
+        self.routes = dict(zip(self.prefixes, (pack(a) for _, a in routes)))
+        self.rate = float(conf.get('rate', 1))
+        self.distribution = conf.get('distribution', 'constant')
+        self.burst = int(conf.get('burst', 100))
+        self.actions = conf.get('actions', CHURN_ACTIONS)
+        self.asn = neighbor['as']
+        self.next_hop = neighbor['local-address']
+        self.withdrawn = set()
+        self.log = log
+        self.flushed = time.time()
+
+    def logged(self, nlri, msg):
+        # msg, once its packed NLRI (or withdrawn prefixes) are logged
+        if self.log:
+            now = time.time()
+            self.log.write(now, nlri)
+            if now - self.flushed >= CONTROL_INTERVAL:
+                self.flush()
+        return msg
+
+    def flush(self):
+        if self.log:
+            self.log.flush()
+            self.flushed = time.time()
+
+    def next_batch(self):
+        # returns (number of updates, seconds until the next batch)
+        if self.distribution == 'burst':
+            return self.burst, self.burst / self.rate
+        if self.distribution == 'poisson':
+            return 1, self.rng.expovariate(self.rate)
+        return 1, 1.0 / self.rate
+
+    def next_update(self):
+        prefix = self.rng.choice(self.prefixes)
+        if prefix in self.withdrawn:
+            self.withdrawn.discard(prefix)
+            return self.logged(prefix, bgp.update_message(attrs=self.routes[prefix], nlri=[prefix]))
+        action = self.rng.choice(self.actions)
+        if action == 'withdraw':
+            self.withdrawn.add(prefix)
+            return self.logged(prefix, bgp.update_message(withdrawn=[prefix]))
+        as_path, med, communities = [self.asn], None, ()
+        if action == 'med':
+            med = self.rng.randint(0, 1000)
+        elif action == 'as-path':
+            as_path += [self.rng.randint(64512, 65534) for _ in range(self.rng.randint(1, 4))]
+        elif action == 'community':
+            communities = ['{0}:{1}'.format(self.asn & 0xffff, self.rng.randint(0, 0xffff))]
+        attrs = bgp.path_attributes(self.next_hop, as_path=as_path, med=med, communities=communities)
+        return self.logged(prefix, bgp.update_message(attrs=attrs, nlri=[prefix]))
+
+    def restore(self, max_size):
+        # the flapped prefixes with their original attributes
+        self.withdrawn.clear()
+        return list(UpdateEncoder(max_size).encode(((p, self.routes[p]) for p in self.prefixes), packed=True))
+
+
+class Session(object):
+
+    def __init__(self, conf, neighbor, updates, control):
+        self.control = control
+        self.target = conf['target']
+        self.hold_time = conf.get('hold-time', 90)
+        self.extended_message = neighbor.get('extended-message', False)
+        self.neighbor = neighbor
+        # prepared UPDATE messages, by maximum message size
+        self.updates = {bgp.BGP_MAX_MSG_LEN: updates}
+        self.churn = None
+        if neighbor.get('churn') and neighbor.get('paths'):
+            self.churn = Churn(neighbor, neighbor['churn'], SendLog(neighbor['router-id'] + CHURN_LOG_SUFFIX))
+        self.send_log = None
+        if neighbor.get('send-log', False):
+            self.send_log = SendLog(neighbor['router-id'] + SEND_LOG_SUFFIX)
+        # control generation of the announcements in the send log
+        self.logged = None
+        # a sink announces nothing and counts the distinct prefixes the
+        # target exports to it, until 'expect' of them are received
+        self.sink = neighbor.get('sink', False)
+        self.expect = neighbor.get('expect')
+        self.received = PrefixSet(control.prefix_ids) if self.sink else None
+
+    def get_updates(self, max_size):
+        if max_size not in self.updates:
+            self.updates[max_size], _ = prepare_updates(self.neighbor, max_size)
+        return self.updates[max_size]
+
+    def receive(self, body):
+        # re-announcements and implicit replacements don't count again
+        rid = self.neighbor['router-id']
+        withdrawn, _, nlri = bgp.split_update(body)
+        for p in bgp.split_prefixes(withdrawn):
+            self.received.discard(p)
+        for p in bgp.split_prefixes(nlri):
+            self.received.add(p)
+        self.control.counters['received'][rid] = self.received.count
+        done = self.control.counters['done']
+        if self.expect and rid not in done and self.received.count >= self.expect:
+            done[rid] = time.time()
+            log('{0} received {1} prefixes', rid, self.received.count)
+
+    async def keepalive(self, writer, interval):
+        while True:
+            await asyncio.sleep(interval)
+            writer.write(bgp.keepalive_message())
+
+    async def send_stream(self, writer):
+        # replays a precompiled stream of UPDATE messages, as fast as possible
+        # unless it has recorded times to follow
+        if self.neighbor.get('stream-times') and self.neighbor.get('speed', 1):
+            await self.replay_stream(writer, float(self.neighbor.get('speed', 1)))
+            return
+        sent = 0
+        with open(self.neighbor['stream'], 'rb') as f:
+            while True:
+                chunk = f.read(STREAM_CHUNK)
+                if not chunk:
+                    break
+                writer.write(chunk)
+                sent += len(chunk)
+                await writer.drain()
+        log('{0} sent {1} bytes from {2}', self.neighbor['router-id'], sent, self.neighbor['stream'])
+
+    async def replay_stream(self, writer, speed):
+        # sends the messages of the stream at their recorded times, speed
+        # times faster. lag is how far behind them the session is, the target
+        # holding the writes back once the socket buffers are full. the
+        # control generation tells the replays of each announcement apart.
+        rid = self.neighbor['router-id']
+        with open(self.neighbor['stream-times'], 'rb') as f:
+            times = f.read()
+        replay = {'start': time.time(), 'lag': 0.0, 'max-lag': 0.0, 'generation': self.control.generation}
+        self.control.counters['replay'][rid] = replay
+        sent = 0
+        with open(self.neighbor['stream'], 'rb') as f:
+            for i in range(0, len(times), TIME_ENTRY.size):
+                t, end = TIME_ENTRY.unpack_from(times, i)
+                scheduled = replay['start'] + t / speed
+                delay = scheduled - time.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                while sent < end:
+                    chunk = f.read(min(end - sent, STREAM_CHUNK))
+                    if not chunk:
+                        break
+                    writer.write(chunk)
+                    sent += len(chunk)
+                    await writer.drain()
+                replay['lag'] = max(time.time() - scheduled, 0.0)
+                replay['max-lag'] = max(replay['max-lag'], replay['lag'])
+        replay['done'] = time.time()
+        log('{0} replayed {1} bytes from {2} at {3}x, max lag {4:.3f}s', rid, sent, self.neighbor['stream'],
+            speed, replay['max-lag'])
+
+    def withdrawals(self, max_size):
+        if 'stream' in self.neighbor:
+            with open(self.neighbor['stream'], 'rb') as f:
+                return [bgp.withdrawal_message(m) for m in bgp.read_messages(f) if bgp.update_nlri(m)]
+        return [bgp.withdrawal_message(u) for u in self.get_updates(max_size)]
+
+    async def announce(self, writer, max_size):
+        if 'stream' in self.neighbor:
+            await self.send_stream(writer)
+            return
+        # staggered announcements of overlapping peers
+        if self.neighbor.get('delay'):
+            await asyncio.sleep(self.neighbor['delay'])
+        updates = self.get_updates(max_size)
+        if self.send_log and self.logged != self.control.generation:
+            # a new iteration, not the same one after a session reset
+            if self.logged is not None:
+                self.send_log.truncate()
+            self.logged = self.control.generation
+        for update in updates:
+            writer.write(update)
+            if self.send_log:
+                self.send_log.write(time.time(), bgp.update_nlri(update))
+            if writer.transport.get_write_buffer_size() > 1 << 20:
+                await writer.drain()
+        await writer.drain()
+        if self.send_log:
+            self.send_log.flush()
+        log('{0} sent {1} updates', self.neighbor['router-id'], len(updates))
+
+    async def withdraw(self, writer, max_size):
+        withdrawals = self.withdrawals(max_size)
+        for msg in withdrawals:
+            writer.write(msg)
+            if writer.transport.get_write_buffer_size() > 1 << 20:
+                await writer.drain()
+        await writer.drain()
+        log('{0} sent {1} withdrawals', self.neighbor['router-id'], len(withdrawals))
+
+    async def send_churn(self, writer):
+        loop = asyncio.get_running_loop()
+        next_time = loop.time()
+        while True:
+            if self.control.bucket:
+                await self.control.bucket.take()
+                writer.write(self.churn.next_update())
+                self.control.counters['churn'] += 1
+                if writer.transport.get_write_buffer_size() > 1 << 20:
+                    await writer.drain()
+                next_time = loop.time()
+                continue
+            num, delay = self.churn.next_batch()
+            for _ in range(num):
+                writer.write(self.churn.next_update())
+            self.control.counters['churn'] += num
+            if writer.transport.get_write_buffer_size() > 1 << 20:
+                # the target doesn't keep up, the offered rate drops
+                await writer.drain()
+                next_time = max(next_time, loop.time())
+            next_time += delay
+            await asyncio.sleep(max(next_time - loop.time(), 0))
+
+    async def stop_churn(self, writer, task, max_size):
+        task.cancel()
+        msgs = self.churn.restore(max_size)
+        if self.control.announce:
+            for msg in msgs:
+                writer.write(self.churn.logged(bgp.update_nlri(msg), msg))
+            self.churn.flush()
+            await writer.drain()
+
+    async def follow_control(self, writer, max_size, announced):
+        churn = None
+        try:
+            while True:
+                # taken first, so that a change made while handling this one isn't missed
+                changed = self.control.changed
+                churning = self.churn is not None and self.control.churn and self.control.announce
+                if churn and not churning:
+                    await self.stop_churn(writer, churn, max_size)
+                    churn = None
+                if self.control.announce != announced:
+                    announced = self.control.announce
+                    if announced:
+                        await self.announce(writer, max_size)
+                    else:
+                        await self.withdraw(writer, max_size)
+                if churning and not churn:
+                    churn = asyncio.ensure_future(self.send_churn(writer))
+                await changed.wait()
+        finally:
+            if churn:
+                churn.cancel()
+
+    async def established(self, reader, writer, hold_time, max_size):
+        tasks = [asyncio.ensure_future(self.keepalive(writer, max(hold_time // 3, 1)))]
+        try:
+            announced = self.control.announce
+            if announced:
+                await self.announce(writer, max_size)
+            tasks.append(asyncio.ensure_future(self.follow_control(writer, max_size, announced)))
+            while True:
+                # any message restarts the hold timer, a hold time of 0 disables it
+                try:
+                    msg_type, body = await asyncio.wait_for(read_message(reader), hold_time or None)
+                except asyncio.TimeoutError:
+                    writer.write(bgp.notification_message(bgp.BGP_ERR_HOLD_TIMER_EXPIRED, 0))
+                    await writer.drain()
+                    raise ConnectionError('hold timer expired')
+                if msg_type == bgp.BGP_MSG_UPDATE and self.sink:
+                    self.receive(body)
+                elif msg_type == bgp.BGP_MSG_NOTIFICATION:
+                    log('{0} received notification {1}', self.neighbor['router-id'], body[:2].hex())
+                    return
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    async def run(self):
+        n = self.neighbor
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(
+                    self.target['address'], bgp.BGP_PORT, local_addr=(n['local-address'], 0))
+            except OSError:
+                await asyncio.sleep(CONNECT_RETRY)
+                continue
+            try:
+                writer.write(bgp.open_message(n['as'], n['router-id'], self.hold_time,
+                                              extended_message=self.extended_message))
+                msg_type, body = await read_message(reader)
+                if msg_type != bgp.BGP_MSG_OPEN:
+                    writer.write(bgp.notification_message(bgp.BGP_ERR_FSM, 0))
+                    raise ConnectionError('unexpected message type {0}'.format(msg_type))
+                peer_as, hold_time, _, caps = bgp.parse_open(body)
+                hold_time = min(hold_time, self.hold_time)
+                max_size = bgp.BGP_MAX_MSG_LEN
+                if self.extended_message and bgp.BGP_CAP_EXTENDED_MESSAGE in caps:
+                    max_size = bgp.BGP_EXTENDED_MAX_MSG_LEN
+                writer.write(bgp.keepalive_message())
+                while True:
+                    msg_type, body = await read_message(reader)
+                    if msg_type == bgp.BGP_MSG_KEEPALIVE:
+                        break
+                    if msg_type == bgp.BGP_MSG_NOTIFICATION:
+                        raise ConnectionError('notification {0}'.format(body[:2].hex()))
+                    writer.write(bgp.notification_message(bgp.BGP_ERR_FSM, 0))
+                    raise ConnectionError('unexpected message type {0}'.format(msg_type))
+                log('{0} established with AS{1}', n['router-id'], peer_as)
+                if self.sink:
+                    self.control.counters['established'][n['router-id']] = time.time()
+                await self.established(reader, writer, hold_time, max_size)
+            except (OSError, asyncio.IncompleteReadError, ConnectionError, ValueError) as e:
+                log('{0} session closed: {1}', n['router-id'], e)
+            finally:
+                writer.close()
+            await asyncio.sleep(CONNECT_RETRY)
+
+
+async def serve(conf, neighbors):
+    # this process' share of the churn sessions of the tester
+    churning = len([n for n in conf['neighbors'] if n.get('churn')])
+    share = len([n for n, _ in neighbors if n.get('churn')]) / float(churning) if churning else 1.0
+    control = Control(conf.get('control', 'control.json'), share)
+    control.load()
+    sessions = [Session(conf, n, updates, control) for n, updates in neighbors]
+    await asyncio.gather(control.poll(), *(s.run() for s in sessions))
+
+
+def daemonize(logfile):
+    if os.fork() > 0:
+        os._exit(0)
+    os.setsid()
+    if os.fork() > 0:
+        os._exit(0)
+    fd = os.open(logfile, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    os.dup2(fd, sys.stdout.fileno())
+    os.dup2(fd, sys.stderr.fileno())
+    null = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(null, sys.stdin.fileno())
+
+
+def main():
+    parser = ArgumentParser(description='bgperf asyncio BGP speaker')
+    parser.add_argument('-f', '--config', required=True)
+    parser.add_argument('-l', '--log', help='daemonize and log to this file')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='number of processes (each one runs its own event loop)')
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        conf = json.load(f)
+
+    # the sessions are created by each worker, in its own event loop
+    neighbors = []
+    for idx, n in enumerate(conf['neighbors']):
+        if 'stream' in n:
+            updates, stats = None, n.get('stream-stats', {})
+        else:
+            updates, enc = prepare_updates(n)
+            stats = enc.stats()
+        neighbors.append((n, updates))
+        print('booted {0} ({1}/{2}) {3}'.format(n['router-id'], idx + 1, len(conf['neighbors']),
+                                                json.dumps(stats)), flush=True)
+
+    if args.log:
+        daemonize(args.log)
+
+    workers = max(min(args.workers, len(neighbors)), 1)
+    for i in range(workers - 1):
+        if os.fork() == 0:
+            asyncio.run(serve(conf, neighbors[i::workers]))
+            return
+    asyncio.run(serve(conf, neighbors[workers - 1::workers]))
+
+
+if __name__ == '__main__':
+    main()
@@ -15,13 +15,34 @@
 
 from base import Tester
 from exabgp import ExaBGP
+from speaker import Speaker
+from paths import iter_routes
 import os
+import json
 from  settings import dckr
 
 def rm_line():
     print '\x1b[1A\x1b[2K\x1b[1D\x1b[1A'
 
 
+def exabgp_attributes(neighbor, attributes):
+    # route options of the attributes of a synthetic RIB route and of the
+    # neighbor's own ones (see attributes_packer() in speakerd.py)
+    own = neighbor.get('attributes') or {}
+    if attributes is None and not own:
+        return ''
+    as_path, med, communities = attributes or ((), None, ())
+    as_path = (neighbor['as'],) * (1 + own.get('prepend', 0)) + as_path
+    med = own.get('med') if med is None else med
+    communities = tuple(own.get('communities', ())) + communities
+    options = ' origin {0} as-path [ {1} ]'.format(own.get('origin', 'igp'), ' '.join(str(a) for a in as_path))
+    if med is not None:
+        options += ' med {0}'.format(med)
+    if communities:
+        options += ' community [ {0} ]'.format(' '.join(communities))
+    return options
+
+
 class ExaBGPTester(Tester, ExaBGP):
 
     CONTAINER_NAME_PREFIX = 'bgperf_exabgp_tester_'
@@ -44,8 +65,9 @@ class ExaBGPTester(Tester, ExaBGP):
 '''.format(target_conf['local-address'], target_conf['as'],
                p['router-id'], local_address, p['as'])
                 f.write(config)
-                for path in p['paths']:
-                    f.write('      route {0} next-hop {1};\n'.format(path, local_address))
+                for path, attributes in iter_routes(p['paths']):
+                    f.write('      route {0} next-hop {1}{2};\n'.format(path, local_address,
+                                                                     exabgp_attributes(p, attributes)))
                 f.write('''   }
 }''')
 
@@ -61,3 +83,138 @@ exabgp.daemon.user=root \
 exabgp {0}/{1}.conf'''.format(self.guest_dir, p['router-id']))
 
         return '\n'.join(startup)
+
+
+
+class SpeakerTester(Tester, Speaker):
+
+    CONTAINER_NAME_PREFIX = 'bgperf_speaker_tester_'
+    CONFIG_FILE_NAME = 'speaker.json'
+    # polled by speakerd, see set_control()
+    CONTROL_FILE_NAME = 'control.json'
+
+    def __init__(self, name, host_dir, conf, image='bgperf/speaker'):
+        super(SpeakerTester, self).__init__(name, host_dir, conf, image)
+        self.control = {'generation': 0, 'announce': True}
+
+    def neighbor_config(self, p):
+        return {
+            'router-id': p['router-id'],
+            'as': p['as'],
+            'local-address': p['local-address'],
+            'paths': p.get('paths', []),
+            'extended-message': p.get('extended-message', self.conf.get('extended-message', False)),
+            # log when each prefix is sent to measure propagation latency
+            'send-log': self.conf.get('latency', False),
+            'churn': p.get('churn', self.conf.get('churn')),
+            # overlapping peers: own attributes and staggered announcements
+            'attributes': p.get('attributes'),
+            'delay': p.get('delay', 0),
+        }
+
+    def configure_neighbors(self, target_conf):
+        self.install_program()
+        # the counters of the speakerd processes of a previous run
+        for name in os.listdir(self.host_dir):
+            if name.startswith('counters.') and name.endswith('.json'):
+                os.remove('{0}/{1}'.format(self.host_dir, name))
+
+        config = {
+            'target': {
+                'address': target_conf['local-address'],
+                'as': target_conf['as'],
+            },
+            'neighbors': [self.neighbor_config(p) for p in self.conf.get('neighbors', {}).values()],
+            'control': self.CONTROL_FILE_NAME,
+        }
+        with open('{0}/{1}'.format(self.host_dir, self.CONFIG_FILE_NAME), 'w') as f:
+            json.dump(config, f)
+        self.write_control()
+
+    def write_control(self):
+        # written aside and renamed so that speakerd never reads half a file
+        filename = '{0}/{1}'.format(self.host_dir, self.CONTROL_FILE_NAME)
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(self.control, f)
+        os.rename(filename + '.tmp', filename)
+
+    def set_control(self, **kwargs):
+        self.control.update(kwargs)
+        self.control['generation'] += 1
+        self.write_control()
+
+    def counters(self):
+        # summed over the speakerd processes, the per router-id ones merged
+        total = {}
+        for name in os.listdir(self.host_dir):
+            if name.startswith('counters.') and name.endswith('.json'):
+                with open('{0}/{1}'.format(self.host_dir, name)) as f:
+                    for k, v in json.load(f).items():
+                        if isinstance(v, dict):
+                            total.setdefault(k, {}).update(v)
+                        else:
+                            total[k] = total.get(k, 0) + v
+        return total
+
+    def withdraw_all(self):
+        self.set_control(announce=False)
+
+    def announce_all(self):
+        self.set_control(announce=True)
+
+    def get_startup_cmd(self):
+        return '\n'.join(
+            ['#!/bin/bash',
+             'ulimit -n 65536',
+             'cd {guest_dir} && python3 speakerd.py -f {config_file_name} -w {workers} -l {guest_dir}/speakerd.log']
+        ).format(
+            guest_dir=self.guest_dir,
+            config_file_name=self.CONFIG_FILE_NAME,
+            workers=self.conf.get('workers', 1))
+
+    def wait_booted(self, output):
+        num = len(self.conf.get('neighbors', {}))
+        cnt = 0
+        stats = {'routes': 0, 'messages': 0, 'bytes': 0}
+        for lines in output: # This is the speakerd output
+            for line in lines.strip().split('\n'):
+                # e.g. booted 10.10.0.3 (1/100) {"routes": 100, "messages": 1, ...}
+                if not line.startswith('booted'):
+                    continue
+                s = json.loads(line.split(' ', 3)[3])
+                for k in stats:
+                    stats[k] += s[k]
+                cnt += 1
+                self.report_booting(cnt, num)
+
+        if stats['routes'] == 0:
+            return
+        routes = float(stats['routes'])
+        self.log('{0}: {1} routes packed into {2} updates ({3:.3f} msgs/route, {4:.1f} bytes/route)'.format(
+            self.name, stats['routes'], stats['messages'], stats['messages'] / routes, stats['bytes'] / routes))
+
+
+class ReceiverSink(SpeakerTester):
+    # receiving peers of the target: speakerd sessions announcing nothing,
+    # counting the prefixes exported to them until 'expect' are received
+
+    CONTAINER_NAME_PREFIX = 'bgperf_speaker_receiver_'
+
+    def neighbor_config(self, p):
+        return {
+            'router-id': p['router-id'],
+            'as': p['as'],
+            'local-address': p['local-address'],
+            'sink': True,
+            'expect': p.get('expect', self.conf.get('expect')),
+        }
+
+    def receivers(self):
+        # router-id -> {'established', 'received', 'done'}, the times being
+        # None until the session is established and every prefix received
+        c = self.counters()
+        return dict((p['router-id'], {
+            'established': c.get('established', {}).get(p['router-id']),
+            'received': c.get('received', {}).get(p['router-id'], 0),
+            'done': c.get('done', {}).get(p['router-id']),
+        }) for p in self.conf.get('neighbors', {}).values())
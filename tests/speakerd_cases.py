@@ -0,0 +1,213 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# speakerd test cases, imported by test_speakerd.py on Python 3 only
+
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import bgp
+import speakerd
+from latency import SendLog, read_send_log
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_rate(self):
+        async def take(num):
+            bucket = speakerd.TokenBucket(100, burst=1)
+            start = time.time()
+            for _ in range(num):
+                await bucket.take()
+            return time.time() - start
+        # the first token is there, each of the 10 others takes 10ms
+        elapsed = asyncio.run(take(11))
+        self.assertTrue(0.09 < elapsed < 0.5, elapsed)
+
+    def test_burst(self):
+        async def bucket():
+            return speakerd.TokenBucket(1000)
+        self.assertEqual(asyncio.run(bucket()).burst, 100.0)
+
+
+class ControlTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'control.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, **control):
+        with open(self.path, 'w') as f:
+            json.dump(control, f)
+
+    def test_generations(self):
+        async def follow():
+            control = speakerd.Control(self.path, share=0.5)
+            control.load()
+            self.assertEqual((control.generation, control.announce, control.churn), (0, True, False))
+
+            changed = control.changed
+            self.write(generation=1, announce=False)
+            control.load()
+            self.assertTrue(changed.is_set())
+            self.assertEqual((control.generation, control.announce), (1, False))
+
+            # only a new generation is a change
+            changed = control.changed
+            self.write(generation=1, announce=True)
+            control.load()
+            self.assertFalse(changed.is_set())
+            self.assertFalse(control.announce)
+
+            # this process' share of the churn rate of the tester
+            self.write(generation=2, churn=True, rate=1000)
+            control.load()
+            self.assertTrue(control.churn)
+            self.assertEqual(control.bucket.rate, 500.0)
+            self.write(generation=3, churn=True)
+            control.load()
+            self.assertEqual(control.bucket, None)
+        asyncio.run(follow())
+
+
+class PrefixSetTest(unittest.TestCase):
+
+    def test_distinct(self):
+        ids = {}
+        a, b = speakerd.PrefixSet(ids), speakerd.PrefixSet(ids)
+        prefixes = [bgp.pack_prefix('10.{0}.{1}.0/24'.format(i // 256, i % 256)) for i in range(1000)]
+        for p in prefixes + prefixes[:10]:
+            a.add(p)
+        self.assertEqual(a.count, 1000)
+        for p in prefixes[:10]:
+            a.discard(p)
+            a.discard(p)
+        self.assertEqual(a.count, 990)
+        # the numbering is shared
+        b.add(prefixes[999])
+        b.discard(prefixes[0])
+        self.assertEqual((b.count, len(ids)), (1, 1000))
+
+
+class SessionTest(unittest.TestCase):
+
+    def test_hold_timer(self):
+        # the target opens the session, then stays silent
+        async def session():
+            notifications = asyncio.Queue()
+
+            async def target(reader, writer):
+                await speakerd.read_message(reader)
+                writer.write(bgp.open_message(65000, '10.0.0.100', hold_time=3))
+                writer.write(bgp.keepalive_message())
+                while True:
+                    msg_type, body = await speakerd.read_message(reader)
+                    if msg_type == bgp.BGP_MSG_NOTIFICATION:
+                        await notifications.put(body)
+                        writer.close()
+                        return
+
+            server = await asyncio.start_server(target, '127.0.0.1', 0)
+            conf = {'target': {'address': '127.0.0.1'}, 'hold-time': 90}
+            neighbor = {'as': 65001, 'router-id': '10.0.0.1', 'local-address': '127.0.0.1'}
+            control = speakerd.Control(os.path.join(tempfile.gettempdir(), 'no-such-control.json'))
+            with mock.patch.object(bgp, 'BGP_PORT', server.sockets[0].getsockname()[1]):
+                task = asyncio.ensure_future(speakerd.Session(conf, neighbor, [], control).run())
+                try:
+                    return await asyncio.wait_for(notifications.get(), 10)
+                finally:
+                    task.cancel()
+                    server.close()
+        start = time.time()
+        self.assertEqual(asyncio.run(session())[:2], b'\x04\x00')
+        self.assertTrue(time.time() - start >= 3)
+
+    def test_sink(self):
+        # the prefixes re-announced or replaced count once
+        async def receive():
+            control = speakerd.Control(os.path.join(tempfile.gettempdir(), 'no-such-control.json'))
+            neighbor = {'as': 65001, 'router-id': '10.0.0.1', 'local-address': '127.0.0.1', 'sink': True,
+                        'expect': 3}
+            s = speakerd.Session({'target': {'address': '127.0.0.1'}}, neighbor, [], control)
+            attrs = bgp.path_attributes('10.10.0.1', as_path=(65000,))
+
+            def update(withdrawn=(), nlri=()):
+                msg = bgp.update_message(withdrawn=[bgp.pack_prefix(p) for p in withdrawn],
+                                         attrs=attrs if nlri else b'', nlri=[bgp.pack_prefix(p) for p in nlri])
+                s.receive(msg[bgp.BGP_HEADER_LEN:])
+                return control.counters['received']['10.0.0.1'], '10.0.0.1' in control.counters['done']
+            self.assertEqual(update(nlri=['10.0.0.0/24', '10.0.1.0/24']), (2, False))
+            self.assertEqual(update(nlri=['10.0.0.0/24']), (2, False))
+            self.assertEqual(update(withdrawn=['10.0.1.0/24'], nlri=['10.0.2.0/24']), (2, False))
+            self.assertEqual(update(nlri=['10.0.1.0/24']), (3, True))
+        asyncio.run(receive())
+
+
+class ChurnTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.neighbor = {'as': 65001, 'router-id': '10.0.0.1', 'local-address': '10.10.0.2',
+                         'paths': ['10.0.{0}.0/24'.format(i) for i in range(100)]}
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_flaps(self):
+        path = os.path.join(self.dir, 'churn')
+        churn = speakerd.Churn(self.neighbor, {'prefixes': 0.1, 'actions': ['withdraw'], 'seed': 1},
+                               SendLog(path))
+        self.assertEqual(len(churn.prefixes), 10)
+        flapped = {}
+        for _ in range(200):
+            msg = churn.next_update()
+            withdrawn, attrs, nlri = bgp.parse_update(msg[bgp.BGP_HEADER_LEN:])
+            prefix, = withdrawn or nlri
+            # a withdrawn prefix comes back with its original attributes
+            if prefix in flapped:
+                self.assertEqual((withdrawn, attrs), ([], churn.routes[bgp.pack_prefix(prefix)]))
+                del flapped[prefix]
+            else:
+                flapped[prefix] = True
+        restored = churn.restore(bgp.BGP_MAX_MSG_LEN)
+        self.assertEqual(sorted(p for m in restored for p in bgp.parse_update(m[bgp.BGP_HEADER_LEN:])[2]),
+                         sorted(bgp.unpack_prefixes(b''.join(churn.prefixes))))
+        churn.flush()
+        self.assertEqual(len(list(read_send_log(path))), 200)
+
+    def test_attributes(self):
+        churn = speakerd.Churn(self.neighbor, {'actions': ['med', 'as-path', 'community'], 'seed': 1})
+        for _ in range(50):
+            withdrawn, attrs, nlri = bgp.parse_update(churn.next_update()[bgp.BGP_HEADER_LEN:])
+            self.assertEqual((withdrawn, len(nlri)), ([], 1))
+            self.assertNotEqual(attrs, churn.routes[bgp.pack_prefix(nlri[0])])
+
+    def test_batches(self):
+        def batch(**conf):
+            return speakerd.Churn(self.neighbor, dict(conf, seed=1)).next_batch()
+        self.assertEqual(batch(rate=100), (1, 0.01))
+        self.assertEqual(batch(rate=100, distribution='burst', burst=50), (50, 0.5))
+        num, delay = batch(rate=100, distribution='poisson')
+        self.assertEqual(num, 1)
+        self.assertTrue(delay > 0)
@@ -0,0 +1,68 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+import bgp
+
+
+def decode(msgs):
+    # [(withdrawn, raw attributes, nlri)] of UPDATE messages
+    out = []
+    for msg in msgs:
+        length, msg_type = bgp.parse_header(msg[:bgp.BGP_HEADER_LEN])
+        assert msg_type == bgp.BGP_MSG_UPDATE and length == len(msg)
+        out.append(bgp.parse_update(msg[bgp.BGP_HEADER_LEN:]))
+    return out
+
+
+class BGPTest(unittest.TestCase):
+
+    def test_prefixes(self):
+        prefixes = ['0.0.0.0/0', '10.0.0.0/8', '10.1.128.0/17', '192.168.1.1/32']
+        data = b''.join(bgp.pack_prefix(p) for p in prefixes)
+        self.assertEqual(bgp.unpack_prefixes(data), prefixes)
+        self.assertEqual(bgp.count_prefixes(data), len(prefixes))
+        self.assertEqual(list(bgp.split_prefixes(data)), [bgp.pack_prefix(p) for p in prefixes])
+
+    def test_update(self):
+        attrs = bgp.path_attributes('192.168.0.1', as_path=(1000, 70000), med=10, communities=['1000:1'])
+        msg = bgp.update_message(withdrawn=[bgp.pack_prefix('10.0.0.0/24')], attrs=attrs,
+                                 nlri=[bgp.pack_prefix('10.0.1.0/24'), bgp.pack_prefix('10.0.2.0/24')])
+        (withdrawn, raw, nlri), = decode([msg])
+        self.assertEqual((withdrawn, raw, nlri), (['10.0.0.0/24'], attrs, ['10.0.1.0/24', '10.0.2.0/24']))
+        self.assertEqual(bgp.count_update_prefixes(msg[bgp.BGP_HEADER_LEN:]), (1, 2))
+        codes = dict((code, value) for _, code, value in bgp.parse_attributes(raw))
+        self.assertEqual(bgp.as_path_length(codes[bgp.BGP_ATTR_TYPE_AS_PATH]), 2)
+        self.assertEqual(bgp.as_path_length(bgp.as_path_prepend(codes[bgp.BGP_ATTR_TYPE_AS_PATH], 1)), 3)
+        (withdrawn, raw, nlri), = decode([bgp.withdrawal_message(msg)])
+        self.assertEqual((withdrawn, raw, nlri), (['10.0.1.0/24', '10.0.2.0/24'], b'', []))
+
+    def test_open(self):
+        msg = bgp.open_message(70000, '10.0.0.1', hold_time=30, extended_message=True)
+        length, msg_type = bgp.parse_header(msg[:bgp.BGP_HEADER_LEN])
+        self.assertEqual((length, msg_type), (len(msg), bgp.BGP_MSG_OPEN))
+        peer_as, hold_time, router_id, caps = bgp.parse_open(msg[bgp.BGP_HEADER_LEN:])
+        self.assertEqual((peer_as, hold_time, router_id), (70000, 30, '10.0.0.1'))
+        self.assertTrue(bgp.BGP_CAP_EXTENDED_MESSAGE in caps)
+
+    def test_notification(self):
+        msg = bgp.notification_message(bgp.BGP_ERR_HOLD_TIMER_EXPIRED, 0)
+        self.assertEqual(bgp.parse_header(msg[:bgp.BGP_HEADER_LEN]), (len(msg), bgp.BGP_MSG_NOTIFICATION))
+        self.assertEqual(msg[bgp.BGP_HEADER_LEN:], b'\x04\x00')
+
+
+if __name__ == '__main__':
+    unittest.main()
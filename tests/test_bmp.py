@@ -0,0 +1,91 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import socket
+import struct
+import time
+import unittest
+
+import bgp
+import bmp
+from bmp import BMPCollector
+
+
+def bmp_message(msg_type, body):
+    return struct.pack('!BIB', bmp.BMP_VERSION, bmp.BMP_COMMON_HEADER_LEN + len(body), msg_type) + body
+
+
+def route_monitoring(peer, update, post_policy=False):
+    # the body of a Route Monitoring message, per-peer header and BGP UPDATE
+    flags = bmp.BMP_PEER_FLAG_POST_POLICY if post_policy else 0
+    header = struct.pack('!BBQ', 0, flags, 0) + b'\x00' * 12 + socket.inet_aton(peer) + \
+        struct.pack('!I', 65001) + socket.inet_aton(peer) + struct.pack('!II', 0, 0)
+    return header + update
+
+
+def announce(*prefixes):
+    return bgp.update_message(attrs=bgp.path_attributes('10.10.0.2', as_path=(65001,)),
+                              nlri=[bgp.pack_prefix(p) for p in prefixes])
+
+
+def withdraw(*prefixes):
+    return bgp.update_message(withdrawn=[bgp.pack_prefix(p) for p in prefixes])
+
+
+class BMPCollectorTest(unittest.TestCase):
+
+    def test_route_monitoring(self):
+        c = BMPCollector()
+        c.handle_message(bmp.BMP_MSG_ROUTE_MONITORING,
+                         route_monitoring('10.10.0.2', announce('10.0.0.0/24', '10.0.1.0/24')), 1.0)
+        # re-announcements keep the first report
+        c.handle_message(bmp.BMP_MSG_ROUTE_MONITORING,
+                         route_monitoring('10.10.0.2', announce('10.0.0.0/24')), 2.0)
+        c.handle_message(bmp.BMP_MSG_ROUTE_MONITORING,
+                         route_monitoring('10.10.0.2', withdraw('10.0.1.0/24')), 3.0)
+        c.handle_message(bmp.BMP_MSG_ROUTE_MONITORING,
+                         route_monitoring('10.10.0.2', announce('10.0.0.0/24'), post_policy=True), 4.0)
+        c.handle_message(bmp.BMP_MSG_PEER_UP_NOTIFICATION, b'', 5.0)
+        self.assertEqual(c.summary(), [
+            ('10.10.0.2', False, {'routes': 2, 'withdrawn': 1, 'first': 1.0, 'last': 1.0}),
+            ('10.10.0.2', True, {'routes': 1, 'withdrawn': 0, 'first': 4.0, 'last': 4.0}),
+        ])
+
+    def test_station(self):
+        c = BMPCollector(address='127.0.0.1', port=0)
+        c.start()
+        try:
+            data = bmp_message(bmp.BMP_MSG_INITIATION, b'') + \
+                b''.join(bmp_message(bmp.BMP_MSG_ROUTE_MONITORING,
+                                    route_monitoring('10.10.0.{0}'.format(i), announce('10.0.{0}.0/24'.format(i))))
+                        for i in range(3))
+            s = socket.create_connection(c.server.server_address)
+            # messages split across segments
+            for i in range(0, len(data), 50):
+                s.sendall(data[i:i + 50])
+                time.sleep(0.01)
+            deadline = time.time() + 5
+            while len(c.summary()) < 3 and time.time() < deadline:
+                time.sleep(0.05)
+            s.close()
+        finally:
+            c.stop()
+        self.assertEqual([(peer, s['routes']) for peer, _, s in c.summary()],
+                         [('10.10.0.{0}'.format(i), 1) for i in range(3)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import os
+import shutil
+import tempfile
+import unittest
+
+import cgroup
+from cgroup import CgroupSampler
+
+CTN_ID = 'abcdef0123456789'
+
+
+class CgroupSamplerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.saved_root, cgroup.CGROUP_ROOT = cgroup.CGROUP_ROOT, self.root
+
+    def tearDown(self):
+        cgroup.CGROUP_ROOT = self.saved_root
+        shutil.rmtree(self.root)
+
+    def write(self, path, content):
+        path = os.path.join(self.root, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def test_v2(self):
+        self.write('cgroup.controllers', 'cpu memory io pids\n')
+        d = 'system.slice/docker-{0}.scope/'.format(CTN_ID)
+        self.write(d + 'cpu.stat', 'usage_usec 2500000\nuser_usec 2000000\nsystem_usec 500000\n')
+        self.write(d + 'memory.current', '1048576\n')
+        self.write(d + 'memory.stat', 'anon 524288\nfile 4096\npgmajfault 3\n')
+        self.write(d + 'io.stat', '8:0 rbytes=100 wbytes=200 rios=1 wios=2\n8:16 rbytes=1 wbytes=2 rios=1 wios=1\n')
+        self.write(d + 'pids.current', '12\n')
+        self.assertEqual(CgroupSampler(CTN_ID).sample(), {
+            'cpu_seconds': 2.5, 'mem': 1048576, 'rss': 524288, 'cache': 4096, 'major_faults': 3,
+            'io_read': 101, 'io_write': 202, 'pids': 12,
+        })
+
+    def test_v1(self):
+        d = 'docker/{0}/'.format(CTN_ID)
+        self.write('cpu,cpuacct/' + d + 'cpuacct.usage', '1500000000\n')
+        self.write('memory/' + d + 'memory.usage_in_bytes', '2097152\n')
+        self.write('memory/' + d + 'memory.stat', 'rss 1\ncache 2\ntotal_rss 1024\ntotal_cache 2048\n'
+                                                  'total_pgmajfault 5\n')
+        # neither blkio nor pids controller
+        self.assertEqual(CgroupSampler(CTN_ID).sample(), {
+            'cpu_seconds': 1.5, 'mem': 2097152, 'rss': 1024, 'cache': 2048, 'major_faults': 5,
+            'io_read': 0, 'io_write': 0, 'pids': 0,
+        })
+
+    def test_not_found(self):
+        self.write('cgroup.controllers', 'cpu memory\n')
+        self.assertRaises(IOError, CgroupSampler, CTN_ID)
+
+
+if __name__ == '__main__':
+    unittest.main()
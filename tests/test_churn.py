@@ -0,0 +1,81 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import os
+import shutil
+import tempfile
+import unittest
+
+import bgp
+from churn import ChurnTracker
+from latency import SendLog, CHURN_LOG_SUFFIX
+from ribwatch import RibWatch
+
+
+def path(prefix):
+    return {'nlri': {'prefix': prefix}}
+
+
+class ChurnTrackerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.rib = RibWatch()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def log(self, peer):
+        return SendLog(os.path.join(self.dir, peer + CHURN_LOG_SUFFIX))
+
+    def test_pending(self):
+        a = self.log('a')
+        # churn from before the tracker doesn't count
+        a.write(1.0, bgp.pack_prefix('10.0.0.0/24'))
+        a.flush()
+        tracker = ChurnTracker([self.dir], self.rib)
+        self.assertEqual(tracker.poll(), 0)
+
+        # updates to the same prefix the target coalesces count once
+        for now in (2.0, 2.1, 2.2):
+            a.write(now, bgp.pack_prefix('10.0.0.0/24'))
+        a.write(2.3, bgp.pack_prefix('10.0.1.0/24') + bgp.pack_prefix('10.0.2.0/24'))
+        a.flush()
+        self.assertEqual(tracker.poll(), 3)
+        self.assertEqual(tracker.sent, 4)
+        # an export before the last update doesn't converge the prefix
+        self.rib.update([path('10.0.0.0/24'), path('10.0.1.0/24')], 2.15)
+        self.assertEqual(tracker.poll(), 3)
+        self.rib.update([path('10.0.0.0/24'), path('10.0.1.0/24')], 2.5)
+        self.assertEqual(tracker.poll(), 1)
+        self.assertEqual(list(tracker.pending), ['10.0.2.0/24'])
+        a.close()
+
+    def test_new_logs(self):
+        tracker = ChurnTracker([self.dir], self.rib)
+        b = self.log('b')
+        b.write(1.0, bgp.pack_prefix('10.0.0.0/24'))
+        b.flush()
+        # a record being written is read once complete
+        with open(os.path.join(self.dir, 'b' + CHURN_LOG_SUFFIX), 'ab') as f:
+            f.write(b'\x00' * 5)
+        self.assertEqual(tracker.poll(), 1)
+        self.assertEqual(tracker.sent, 1)
+        b.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
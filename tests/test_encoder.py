@@ -0,0 +1,74 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+import bgp
+from encoder import UpdateEncoder
+
+
+def decode(msgs):
+    # [(withdrawn, raw attributes, nlri)] of UPDATE messages
+    out = []
+    for msg in msgs:
+        length, msg_type = bgp.parse_header(msg[:bgp.BGP_HEADER_LEN])
+        assert msg_type == bgp.BGP_MSG_UPDATE and length == len(msg)
+        out.append(bgp.parse_update(msg[bgp.BGP_HEADER_LEN:]))
+    return out
+
+
+class UpdateEncoderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.prefixes = ['10.{0}.{1}.0/24'.format(i // 256, i % 256) for i in range(2000)]
+        self.attrs = [bgp.path_attributes('192.168.0.1', as_path=(1000 + i % 2,)) for i in range(2)]
+
+    def check(self, msgs):
+        routes = {}
+        for withdrawn, attrs, nlri in decode(msgs):
+            self.assertEqual(withdrawn, [])
+            for prefix in nlri:
+                routes[prefix] = attrs
+        self.assertEqual(sorted(routes), sorted(self.prefixes))
+        for i, prefix in enumerate(self.prefixes):
+            self.assertEqual(routes[prefix], self.attrs[i % 2])
+        for msg in msgs:
+            self.assertTrue(len(msg) <= bgp.BGP_MAX_MSG_LEN)
+
+    def test_add(self):
+        enc = UpdateEncoder()
+        msgs = []
+        for i, prefix in enumerate(self.prefixes):
+            msgs += enc.add(prefix, self.attrs[i % 2])
+        msgs += enc.flush()
+        self.check(msgs)
+        self.assertEqual(enc.stats()['routes'], len(self.prefixes))
+        self.assertEqual(enc.stats()['messages'], len(msgs))
+
+    def test_encode_packed(self):
+        routes = [(bgp.pack_prefix(p), self.attrs[i % 2]) for i, p in enumerate(self.prefixes)]
+        self.check(list(UpdateEncoder().encode(routes, packed=True)))
+
+    def test_max_pending(self):
+        enc = UpdateEncoder(max_pending=1)
+        self.check(list(enc.encode((p, self.attrs[i % 2]) for i, p in enumerate(self.prefixes))))
+
+    def test_attributes_too_large(self):
+        attrs = bgp.path_attributes('192.168.0.1', communities=['1:{0}'.format(i) for i in range(1100)])
+        self.assertRaises(ValueError, UpdateEncoder().add, '10.0.0.0/24', attrs)
+
+
+if __name__ == '__main__':
+    unittest.main()
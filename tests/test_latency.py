@@ -0,0 +1,80 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import bgp
+from latency import SendLog, SEND_LOG_SUFFIX, collect, read_send_log
+
+
+class CollectTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def log(self, peer, records):
+        log = SendLog(os.path.join(self.dir, peer + SEND_LOG_SUFFIX))
+        for now, prefixes in records:
+            log.write(now, b''.join(bgp.pack_prefix(p) for p in prefixes))
+        return log
+
+    def test_first_announcement(self):
+        # overlapping peers, b announcing 10.0.0.0/24 first
+        self.log('a', [(10.0, ['10.0.0.0/24', '10.0.1.0/24'])]).close()
+        self.log('b', [(9.0, ['10.0.0.0/24']), (12.0, ['10.0.2.0/24'])]).close()
+        overall, peers, missing = collect([self.dir], {'10.0.0.0/24': 9.5, '10.0.1.0/24': 11.0})
+        self.assertEqual(missing, 1)
+        self.assertEqual(overall.count, 2)
+        self.assertEqual(peers['a'].count, 1)
+        self.assertEqual(peers['b'].count, 1)
+        self.assertAlmostEqual(peers['b'].max, 0.5, places=2)
+
+    def test_missing(self):
+        # a prefix which never arrived counts once, whoever sent it
+        self.log('a', [(1.0, ['10.0.0.0/24', '10.0.1.0/24'])]).close()
+        self.log('b', [(2.0, ['10.0.1.0/24'])]).close()
+        arrivals = {'10.0.0.0/24': 1.5}
+        overall, _, missing = collect([self.dir], arrivals)
+        self.assertEqual((overall.count, missing), (1, 1))
+        self.assertEqual(arrivals, {'10.0.0.0/24': None})
+
+    def test_read_chunks(self):
+        # records span chunk boundaries, some are larger than a chunk
+        records = [(float(i), ['10.{0}.{1}.0/24'.format(i, j) for j in range(i % 7 * 10)]) for i in range(50)]
+        self.log('a', records).close()
+        expected = [(now, p) for now, prefixes in records for p in prefixes]
+        path = os.path.join(self.dir, 'a' + SEND_LOG_SUFFIX)
+        for chunk in (16, 100, 1 << 12):
+            self.assertEqual(list(read_send_log(path, chunk)), expected)
+
+    def test_truncate(self):
+        # the send times of a previous iteration are forgotten
+        log = self.log('a', [(1.0, ['10.0.0.0/24'])])
+        log.truncate()
+        log.write(100.0, bgp.pack_prefix('10.0.0.0/24'))
+        log.close()
+        overall, _, _ = collect([self.dir], {'10.0.0.0/24': 101.0})
+        self.assertEqual(overall.count, 1)
+        self.assertAlmostEqual(overall.max, 1.0, places=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
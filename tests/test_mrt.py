@@ -0,0 +1,222 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import unittest
+
+import bgp
+import mrt
+from mrt import MRTReader
+from mrt_stream import compile_mrt, compile_mrt_peers, peer_prefixes, update_peers, TIMES_SUFFIX, TIME_ENTRY
+
+PEERS = [65000, 65001]
+PREFIXES = 100
+
+
+def record(type, subtype, data, timestamp=1000):
+    return struct.pack('!IHHI', timestamp, type, subtype, len(data)) + data
+
+
+def rib_dump():
+    # PEER_INDEX_TABLE of PEERS, then one RIB entry per prefix, from every
+    # peer for the even prefixes and from the first one for the others
+    peers = b''.join(struct.pack('!B', 2) + socket.inet_aton('1.1.1.{0}'.format(i)) +
+                     socket.inet_aton('2.2.2.{0}'.format(i)) + struct.pack('!I', asn)
+                     for i, asn in enumerate(PEERS))
+    out = record(mrt.MRT_TYPE_TABLE_DUMP_V2, mrt.TABLE_DUMP_V2_PEER_INDEX_TABLE,
+                 socket.inet_aton('9.9.9.9') + struct.pack('!HH', 0, len(PEERS)) + peers)
+    for i in range(PREFIXES):
+        entries = b''
+        peers = range(len(PEERS)) if i % 2 == 0 else [0]
+        for p in peers:
+            attrs = bgp.path_attributes('2.2.2.{0}'.format(p), as_path=(PEERS[p], 100 + i % 3))
+            entries += struct.pack('!HIH', p, 1000, len(attrs)) + attrs
+        out += record(mrt.MRT_TYPE_TABLE_DUMP_V2, mrt.TABLE_DUMP_V2_RIB_IPV4_UNICAST,
+                      struct.pack('!I', i) + bgp.pack_prefix('20.0.{0}.0/24'.format(i)) +
+                      struct.pack('!H', len(peers)) + entries)
+    return out
+
+
+def updates():
+    # BGP4MP_ET messages of a 4-octet AS peer, 0.5s apart, and BGP4MP ones
+    # of a 2-octet AS peer, which withdraws its first prefix at the end
+    out = b''
+    for i in range(10):
+        msg = bgp.update_message(attrs=bgp.path_attributes('2.2.2.0', as_path=(70000,)),
+                                 nlri=[bgp.pack_prefix('30.0.{0}.0/24'.format(i))])
+        out += record(mrt.MRT_TYPE_BGP4MP_ET, mrt.BGP4MP_MESSAGE_AS4,
+                      struct.pack('!IIIHH', 500000 * (i % 2), 70000, 1000, 0, 1) +
+                      socket.inet_aton('2.2.2.0') + socket.inet_aton('2.2.2.9') + msg, 2000 + i // 2)
+    as_path = struct.pack('!BBH', bgp.BGP_AS_SEQUENCE, 1, 65001)
+    attrs = bgp.path_attribute(bgp.BGP_ATTR_FLAG_TRANSITIVE, bgp.BGP_ATTR_TYPE_ORIGIN, b'\x00') + \
+        bgp.path_attribute(bgp.BGP_ATTR_FLAG_TRANSITIVE, bgp.BGP_ATTR_TYPE_AS_PATH, as_path) + \
+        bgp.path_attribute(bgp.BGP_ATTR_FLAG_TRANSITIVE, bgp.BGP_ATTR_TYPE_NEXT_HOP, socket.inet_aton('2.2.2.1'))
+    msgs = [bgp.update_message(attrs=attrs, nlri=[bgp.pack_prefix('31.0.{0}.0/24'.format(i))]) for i in range(3)]
+    msgs.append(bgp.update_message(withdrawn=[bgp.pack_prefix('31.0.0.0/24')]))
+    for i, msg in enumerate(msgs):
+        out += record(mrt.MRT_TYPE_BGP4MP, mrt.BGP4MP_MESSAGE, struct.pack('!HHHH', 65001, 1000, 0, 1) +
+                      socket.inet_aton('2.2.2.1') + socket.inet_aton('2.2.2.9') + msg, 2010 + i)
+    return out
+
+
+class MRTTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, data):
+        path = os.path.join(self.dir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+
+class MRTReaderTest(MRTTestCase):
+
+    def test_index(self):
+        path = self.write('rib.mrt', rib_dump())
+        with MRTReader(path) as reader:
+            self.assertEqual(len(reader), PREFIXES)
+            self.assertEqual([p['as'] for p in reader.peer_index()], PEERS)
+        self.assertTrue(os.path.exists(path + '.idx'))
+        # the second reader loads the index
+        with MRTReader(path) as reader:
+            self.assertTrue(reader.offsets is not None)
+            self.assertEqual(len(reader), PREFIXES)
+            self.assertEqual(reader.peer_index()[1]['address'], '2.2.2.1')
+        with MRTReader(path, use_index=False) as reader:
+            self.assertEqual(len(reader), PREFIXES)
+            self.assertEqual(len(reader.peer_index()), len(PEERS))
+
+    def test_records(self):
+        path = self.write('rib.mrt', rib_dump())
+        for use_index in (True, False):
+            with MRTReader(path, use_index=use_index) as reader:
+                records = list(reader.records(skip=10, count=5))
+                self.assertEqual([r.parse_rib()[1] for r in records],
+                                 ['20.0.{0}.0/24'.format(i) for i in range(10, 15)])
+                seq, prefix, entries = records[0].parse_rib()
+                self.assertEqual((seq, len(entries)), (10, len(PEERS)))
+                self.assertEqual(len(list(reader.records(skip=PREFIXES - 2, count=10))), 2)
+
+    def test_write_slice(self):
+        path = self.write('rib.mrt', rib_dump())
+        with MRTReader(path) as reader:
+            reader.write_slice(os.path.join(self.dir, 'slice.mrt'), skip=20, count=30)
+        with MRTReader(os.path.join(self.dir, 'slice.mrt')) as reader:
+            self.assertEqual(len(reader), 30)
+            self.assertEqual(len(reader.peer_index()), len(PEERS))
+            self.assertEqual(next(reader.records()).parse_rib()[1], '20.0.20.0/24')
+
+    def test_gzip(self):
+        path = os.path.join(self.dir, 'rib.mrt.gz')
+        f = gzip.open(path, 'wb')
+        f.write(rib_dump())
+        f.close()
+        with MRTReader(path) as reader:
+            self.assertEqual(len(reader), PREFIXES)
+
+    def test_bgp4mp(self):
+        path = self.write('updates.mrt', updates())
+        with MRTReader(path) as reader:
+            records = list(reader.records())
+            self.assertEqual(reader.peer_index(), [])
+        self.assertEqual(len(records), 14)
+        self.assertTrue(all(r.is_bgp4mp_message() for r in records))
+        r = records[0].parse_bgp4mp()
+        self.assertEqual((r['peer-as'], r['peer-address']), (70000, '2.2.2.0'))
+        self.assertEqual(records[-1].parse_bgp4mp()['peer-as'], 65001)
+
+
+def read_stream(path):
+    with open(path, 'rb') as f:
+        return [bgp.parse_update(m[bgp.BGP_HEADER_LEN:]) for m in bgp.read_messages(f)]
+
+
+def as_path(attrs):
+    for _, code, value in bgp.parse_attributes(attrs):
+        if code == bgp.BGP_ATTR_TYPE_AS_PATH:
+            return struct.unpack('!{0}I'.format((len(value) - 2) // 4), value[2:])
+
+
+class CompileTest(MRTTestCase):
+
+    def test_cache(self):
+        path = self.write('rib.mrt', rib_dump())
+        cache = os.path.join(self.dir, 'cache')
+        stream, meta = compile_mrt(path, cache, 1234, '10.0.0.5')
+        self.assertEqual(meta['routes'], PREFIXES * 3 // 2)
+        os.utime(stream, (0, 0))
+        self.assertEqual(compile_mrt(path, cache, 1234, '10.0.0.5'), (stream, meta))
+        self.assertEqual(os.path.getmtime(stream), 0)
+        # other options or another dump get their own stream
+        self.assertNotEqual(compile_mrt(path, cache, 1234, '10.0.0.6')[0], stream)
+        other = self.write('other.mrt', rib_dump()[:-1] + b'\x01')
+        self.assertNotEqual(compile_mrt(other, cache, 1234, '10.0.0.5')[0], stream)
+
+    def test_rib_peers(self):
+        path = self.write('rib.mrt', rib_dump())
+        cache = os.path.join(self.dir, 'cache')
+        streams = compile_mrt_peers(path, cache, [(0, PEERS[0], '10.0.0.3'), (1, PEERS[1], '10.0.0.4'),
+                                                  (None, 1234, '10.0.0.5')])
+        self.assertEqual([meta['routes'] for _, meta in streams], [PREFIXES, PREFIXES // 2, PREFIXES * 3 // 2])
+        for _, attrs, _ in read_stream(streams[0][0]):
+            # a peer's own AS isn't prepended again
+            self.assertEqual(as_path(attrs)[0], PEERS[0])
+            self.assertNotEqual(as_path(attrs)[1], PEERS[0])
+        for _, attrs, _ in read_stream(streams[2][0]):
+            self.assertEqual(as_path(attrs)[0], 1234)
+        self.assertEqual(sorted(p for _, _, nlri in read_stream(streams[1][0]) for p in nlri),
+                         sorted('20.0.{0}.0/24'.format(i) for i in range(0, PREFIXES, 2)))
+        # taken from the cache
+        self.assertEqual(compile_mrt(path, cache, PEERS[1], '10.0.0.4', peer=1), streams[1])
+        self.assertEqual(peer_prefixes(path, [1]), PREFIXES // 2)
+        self.assertEqual(peer_prefixes(path, [0, 1]), PREFIXES)
+
+    def test_updates(self):
+        path = self.write('updates.mrt', updates())
+        self.assertEqual(update_peers(path), [('2.2.2.0', 70000), ('2.2.2.1', 65001)])
+        self.assertEqual(peer_prefixes(path, ['2.2.2.1']), 2)
+        (first, meta), (second, _) = compile_mrt_peers(path, os.path.join(self.dir, 'cache'),
+                                                       [('2.2.2.0', 70000, '10.0.0.3'),
+                                                        ('2.2.2.1', 65001, '10.0.0.4')])
+        self.assertTrue(meta['timed'])
+        self.assertEqual((meta['updates'], meta['routes'], meta['duration']), (10, 10, 4.5))
+        with open(first + TIMES_SUFFIX, 'rb') as f:
+            times = f.read()
+        entries = [TIME_ENTRY.unpack_from(times, i) for i in range(0, len(times), TIME_ENTRY.size)]
+        self.assertEqual([t for t, _ in entries], [i * 0.5 for i in range(10)])
+        self.assertEqual(entries[-1][1], os.path.getsize(first))
+        # 2-octet AS paths are widened
+        messages = read_stream(second)
+        self.assertEqual(as_path(messages[0][1]), (65001,))
+        self.assertEqual(messages[-1], (['31.0.0.0/24'], b'', []))
+
+    def test_only_best(self):
+        path = self.write('rib.mrt', rib_dump())
+        _, meta = compile_mrt(path, os.path.join(self.dir, 'cache'), 1234, '10.0.0.5', only_best=True,
+                              skip=10, count=20)
+        self.assertEqual(meta['routes'], 20)
+
+if __name__ == '__main__':
+    unittest.main()
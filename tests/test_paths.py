@@ -0,0 +1,54 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from paths import path_range, count_paths, iter_paths, iter_routes, next_start
+
+
+class PathsTest(unittest.TestCase):
+
+    def test_range(self):
+        paths = path_range('10.0.0.0', 4, prefix_len=24)
+        self.assertEqual(count_paths(paths), 4)
+        self.assertEqual(list(iter_paths(paths)), ['10.0.0.0/24', '10.0.1.0/24', '10.0.2.0/24', '10.0.3.0/24'])
+        self.assertEqual(next_start(paths), '10.0.4.0')
+
+    def test_stride_and_alignment(self):
+        # the start is aligned on the prefix length
+        paths = path_range('10.0.0.77', 3, prefix_len=30, stride=2)
+        self.assertEqual(list(iter_paths(paths)), ['10.0.0.76/30', '10.0.0.84/30', '10.0.0.92/30'])
+
+    def test_chained_ranges(self):
+        first = path_range('10.0.0.0', 300)
+        second = path_range(next_start(first), 300)
+        prefixes = list(iter_paths(first)) + list(iter_paths(second))
+        self.assertEqual(len(set(prefixes)), 600)
+        self.assertEqual(prefixes[300], '10.0.1.44/32')
+
+    def test_out_of_address_space(self):
+        self.assertRaises(ValueError, list, iter_paths(path_range('255.255.255.0', 257)))
+        self.assertRaises(ValueError, list, iter_paths(path_range('10.0.0.0', 1, prefix_len=33)))
+
+    def test_list(self):
+        paths = ['10.0.0.0/24', '10.0.1.0/24']
+        self.assertEqual(count_paths(paths), 2)
+        self.assertEqual(list(iter_paths(paths)), paths)
+        self.assertEqual(list(iter_routes(paths)), [(p, None) for p in paths])
+        self.assertEqual(count_paths(None), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
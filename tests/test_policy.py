@@ -0,0 +1,49 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from paths import path_range
+from policy import value_range, count_values, iter_values
+
+
+class PolicyTest(unittest.TestCase):
+
+    def match(self, type, value):
+        return {'type': type, 'value': value}
+
+    def test_prefix(self):
+        m = self.match('prefix', path_range('90.0.0.0', 3))
+        self.assertEqual(count_values(m), 3)
+        self.assertEqual(list(iter_values(m)), ['90.0.0.0/32', '90.0.0.1/32', '90.0.0.2/32'])
+
+    def test_ranges(self):
+        self.assertEqual(list(iter_values(self.match('as-path', value_range(10000, 2)))), [10000, 10001])
+        self.assertEqual(list(iter_values(self.match('community', value_range(65535, 2)))), ['0:65535', '1:0'])
+        self.assertEqual(list(iter_values(self.match('ext-community', value_range(0, 1)))), ['rt:0:0'])
+        self.assertEqual(count_values(self.match('community', value_range(0, 100))), 100)
+
+    def test_list(self):
+        m = self.match('as-path', [1, 2])
+        self.assertEqual(count_values(m), 2)
+        self.assertEqual(list(iter_values(m)), [1, 2])
+        self.assertEqual(count_values(self.match('as-path', None)), 0)
+
+    def test_unknown_range(self):
+        self.assertRaises(ValueError, list, iter_values(self.match('med', value_range(0, 1))))
+
+
+if __name__ == '__main__':
+    unittest.main()
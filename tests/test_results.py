@@ -0,0 +1,112 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+from argparse import Namespace
+
+import results
+
+
+class RunRecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_same_second(self):
+        recorders = [results.RunRecorder(os.path.join(self.dir, 'results'), 'bench', {}) for _ in range(3)]
+        self.assertEqual(len(set(r.run_id for r in recorders)), 3)
+        for i, r in enumerate(recorders):
+            r.append(0.0, 1.0, None, 100, i)
+            r.finish(1.0)
+            self.assertEqual(len(results.find_runs(os.path.join(self.dir, 'results'), r.run_id)), 1)
+        self.assertEqual(list(results.load_series(recorders[2].dir, 'recved')), [2.0])
+
+
+class WelchTest(unittest.TestCase):
+
+    def test_p_value(self):
+        # t = 1.897 with 5.88 degrees of freedom
+        self.assertAlmostEqual(results.welch_test([1, 2, 3, 4, 5], [2, 4, 6, 8, 10]), 0.10753, places=4)
+
+    def test_symmetric(self):
+        xs, ys = [10.1, 10.3, 9.9, 10.0], [12.0, 12.4, 11.8, 12.1, 12.2]
+        self.assertAlmostEqual(results.welch_test(xs, ys), results.welch_test(ys, xs))
+        self.assertTrue(results.welch_test(xs, ys) < 0.001)
+
+    def test_degenerate(self):
+        self.assertEqual(results.welch_test([1.0], [2.0, 3.0]), None)
+        self.assertEqual(results.welch_test([1.0, 1.0], [1.0, 1.0]), 1.0)
+        self.assertEqual(results.welch_test([1.0, 1.0], [2.0, 2.0]), 0.0)
+
+    def test_compare(self):
+        def runs(values):
+            return [{'summary': {'convergence': v, 'peak_mem': 100, 'cpu_seconds': 1.0}} for v in values]
+        rows = dict((r['metric'], r) for r in results.compare(runs([10.1, 10.3, 9.9, 10.0]),
+                                                              runs([12.0, 12.4, 11.8, 12.1, 12.2])))
+        self.assertTrue(rows['convergence']['regression'])
+        self.assertFalse(rows['peak_mem']['regression'])
+        self.assertAlmostEqual(rows['convergence']['baseline'], 10.075)
+
+
+class LoglogFitTest(unittest.TestCase):
+
+    def test_single_axis(self):
+        # sweeping the neighbors only, at a fixed number of prefixes per peer
+        xs = [(n, 100) for n in [10, 100, 1000]]
+        exponents, r2 = results.loglog_fit(xs, [0.5 * n ** 1.5 for n, _ in xs])
+        self.assertAlmostEqual(exponents[0], 1.5)
+        self.assertEqual(exponents[1], None)
+        self.assertAlmostEqual(r2, 1.0)
+
+    def test_two_axes(self):
+        xs = [(n, p) for n in [10, 100, 1000] for p in [100, 1000]]
+        exponents, r2 = results.loglog_fit(xs, [2.0 * n * p ** 0.5 for n, p in xs])
+        self.assertAlmostEqual(exponents[0], 1.0)
+        self.assertAlmostEqual(exponents[1], 0.5)
+
+    def test_collinear(self):
+        # peers and routes of a single axis sweep vary together
+        xs = [(n, n * 100) for n in [10, 100, 1000]]
+        self.assertEqual(results.loglog_fit(xs, [n for n, _ in xs]), None)
+
+    def test_not_enough_points(self):
+        self.assertEqual(results.loglog_fit([(10, 1), (100, 1)], [1.0, 2.0]), None)
+        self.assertEqual(results.loglog_fit([], []), None)
+
+
+class SweepPointsTest(unittest.TestCase):
+
+    def test_points(self):
+        args = Namespace(target=['gobgp', 'bird'], neighbor_num=[10, 100], prefix_num=[1000], bench_name='b')
+        points = results.sweep_points(args, ['target', 'neighbor_num', 'prefix_num'])
+        self.assertEqual([values for values, _ in points],
+                         [('gobgp', 10, 1000), ('gobgp', 100, 1000), ('bird', 10, 1000), ('bird', 100, 1000)])
+        _, point = points[1]
+        self.assertEqual((point.target, point.neighbor_num, point.prefix_num, point.bench_name),
+                         ('gobgp', 100, 1000, 'b'))
+        # every point is a copy, the sweep options are left as they are
+        point.repeat = False
+        self.assertFalse(hasattr(points[0][1], 'repeat'))
+        self.assertEqual(args.neighbor_num, [10, 100])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+import paths
+from ribgen import RibGenerator, rib_slice, iter_routes, DFZ_PREFIX_LENGTHS
+
+
+class RibGeneratorTest(unittest.TestCase):
+
+    TOTAL = 50000
+
+    def test_unique_prefixes(self):
+        g = RibGenerator({'seed': 1, 'total': self.TOTAL})
+        prefixes = set(g.prefix(i) for i in range(self.TOTAL))
+        self.assertEqual(len(prefixes), self.TOTAL)
+        for p in list(prefixes)[:1000]:
+            addr, length = p.split('/')
+            self.assertTrue(int(addr.split('.')[0]) not in (0, 10, 127) and int(addr.split('.')[0]) < 224)
+
+    def test_reproducible(self):
+        rib = {'seed': 7, 'total': 1000}
+        self.assertEqual(list(RibGenerator(rib).routes(0, 1000)), list(RibGenerator(dict(rib)).routes(0, 1000)))
+        other = list(RibGenerator({'seed': 8, 'total': 1000}).routes(0, 1000))
+        self.assertNotEqual(list(RibGenerator(rib).routes(0, 1000)), other)
+
+    def test_slices(self):
+        # disjoint slices of a RIB are the RIB
+        whole = list(iter_routes(rib_slice(0, 3000, 3000, seed=3)))
+        parts = []
+        for offset in range(0, 3000, 1000):
+            parts += list(iter_routes(rib_slice(offset, 1000, 3000, seed=3)))
+        self.assertEqual(parts, whole)
+        self.assertRaises(ValueError, list, RibGenerator({'total': 10}).routes(5, 10))
+
+    def test_prefix_lengths(self):
+        g = RibGenerator({'seed': 2, 'total': 20000})
+        counts = {}
+        for i in range(20000):
+            length = int(g.prefix(i).split('/')[1])
+            counts[length] = counts.get(length, 0) + 1
+        total = float(sum(DFZ_PREFIX_LENGTHS.values()))
+        for length, w in DFZ_PREFIX_LENGTHS.items():
+            self.assertAlmostEqual(counts.get(length, 0) / 20000.0, w / total, places=2)
+
+    def test_unique_attrs(self):
+        g = RibGenerator({'seed': 4, 'total': 1000, 'unique-attrs': 0.1})
+        sets = set(g.attributes(i) for i in range(1000))
+        self.assertTrue(50 <= len(sets) <= 100)
+        for as_path, med, communities in sets:
+            self.assertTrue(1 <= len(as_path) + 1 <= 8)
+            self.assertTrue(med is None or 0 <= med <= 1000)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, RibGenerator, {'total': 10, 'prefix-lengths': {40: 1}})
+        self.assertRaises(ValueError, RibGenerator, {'total': 1000000, 'prefix-lengths': {8: 1}})
+
+    def test_tester_paths(self):
+        # a slice is a path spec of the testers
+        spec = rib_slice(10, 5, 100, seed=1)
+        self.assertEqual(paths.count_paths(spec), 5)
+        routes = list(paths.iter_routes(spec))
+        self.assertEqual([p for p, _ in routes], list(paths.iter_paths(spec)))
+        self.assertTrue(all(attrs is not None for _, attrs in routes))
+
+
+if __name__ == '__main__':
+    unittest.main()
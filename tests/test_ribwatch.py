@@ -0,0 +1,70 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import json
+import unittest
+
+from ribwatch import RibWatch
+
+
+def path(prefix, withdrawal=False):
+    # a path as printed by gobgp monitor global rib -j
+    p = {'nlri': {'prefix': prefix}, 'age': 0, 'best': True, 'attrs': [{'type': 1, 'value': 0}]}
+    if withdrawal:
+        p['withdrawal'] = True
+    return p
+
+
+class RibWatchTest(unittest.TestCase):
+
+    def test_feed(self):
+        rib = RibWatch()
+        line = json.dumps([path('10.0.0.0/24'), path('10.0.1.0/24')]) + '\n'
+        # a line split across chunks is parsed once complete
+        rib.feed(line[:10], 1.0)
+        self.assertEqual(rib.events, 0)
+        rib.feed(line[10:] + json.dumps(path('10.0.2.0/24')), 2.0)
+        self.assertEqual(rib.routes, {'10.0.0.0/24': 2.0, '10.0.1.0/24': 2.0})
+        rib.feed('\n', 3.0)
+        self.assertEqual(rib.routes['10.0.2.0/24'], 3.0)
+        self.assertEqual(rib.events, 3)
+
+    def test_changes(self):
+        rib = RibWatch()
+        rib.update([path('10.0.0.0/24'), path('10.0.1.0/24')], 1.0)
+        # a new best path keeps the first arrival time
+        rib.update(path('10.0.0.0/24'), 2.0)
+        self.assertEqual(rib.routes['10.0.0.0/24'], 1.0)
+        self.assertEqual((rib.changes, rib.last_change), (1, 2.0))
+        rib.update(path('10.0.1.0/24', withdrawal=True), 3.0)
+        self.assertEqual(list(rib.routes), ['10.0.0.0/24'])
+        self.assertEqual((rib.events, rib.changes, rib.last_change, rib.last_event), (4, 1, 2.0, 3.0))
+
+    def test_check_points(self):
+        rib = RibWatch([2, 3])
+        rib.update(path('10.0.0.0/24'), 1.0)
+        self.assertTrue(rib.crossings.empty())
+        # one update can cross several check-points
+        rib.update([path('10.0.1.0/24'), path('10.0.2.0/24')], 2.0)
+        self.assertEqual([rib.crossings.get_nowait() for _ in range(2)], [(2.0, 3), (2.0, 3)])
+        rib.update([path(p, withdrawal=True) for p in ['10.0.0.0/24', '10.0.1.0/24', '10.0.2.0/24']], 3.0)
+        rib.rearm([1])
+        rib.update(path('10.0.0.0/24'), 4.0)
+        self.assertEqual(rib.crossings.get_nowait(), (4.0, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import unittest
+
+# speakerd runs on Python 3 only, in the speaker containers. its cases use
+# async def, which Python 2 can't compile.
+if sys.version_info >= (3,):
+    from tests.speakerd_cases import TokenBucketTest, ControlTest, PrefixSetTest, ChurnTest, SessionTest
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+# Copyright (C) 2017 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Timeline of a benchmark in the trace event format, viewable in Perfetto
+# or chrome://tracing: one track per container (and one for bgperf itself)
+# holding the spans of its phases, plus counter tracks of the samples of the
+# target and the monitor. Every time is a time.time() value.
+
+import json
+import time
+from threading import Lock
+
+PID = 1
+
+
+class Timeline(object):
+
+    def __init__(self):
+        self.t0 = time.time()
+        self.events = []
+        self.tracks = {}
+        self.lock = Lock()
+
+    def _ts(self, t):
+        return int((t - self.t0) * 1e6)
+
+    def _tid(self, track):
+        # called with the lock held
+        if track not in self.tracks:
+            self.tracks[track] = len(self.tracks) + 1
+            self.events.append({'ph': 'M', 'name': 'thread_name', 'pid': PID, 'tid': self.tracks[track],
+                                'args': {'name': track}})
+        return self.tracks[track]
+
+    def complete(self, name, track, begin, end=None, **args):
+        # span of track from begin to end (now by default)
+        end = time.time() if end is None else end
+        with self.lock:
+            self.events.append({'ph': 'X', 'name': name, 'pid': PID, 'tid': self._tid(track),
+                                'ts': self._ts(begin), 'dur': max(self._ts(end) - self._ts(begin), 0),
+                                'args': args})
+
+    def instant(self, name, track, t=None, **args):
+        t = time.time() if t is None else t
+        with self.lock:
+            self.events.append({'ph': 'i', 's': 't', 'name': name, 'pid': PID, 'tid': self._tid(track),
+                                'ts': self._ts(t), 'args': args})
+
+    def counter(self, name, t, **values):
+        with self.lock:
+            self.events.append({'ph': 'C', 'name': name, 'pid': PID, 'ts': self._ts(t), 'args': values})
+
+    def save(self, path):
+        with self.lock:
+            events = list(self.events)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+class NullTimeline(Timeline):
+    # records nothing, when --trace isn't given
+
+    def complete(self, name, track, begin, end=None, **args):
+        pass
+
+    def instant(self, name, track, t=None, **args):
+        pass
+
+    def counter(self, name, t, **values):
+        pass
+
+    def save(self, path):
+        pass